@@ -0,0 +1,45 @@
+"""Сравнение кодеков документа: python -m benchmarks.bench_codec [N]"""
+import pickle
+import sys
+import time
+from typing import Any, Callable, List
+from documentflow import codec, serialization
+from documentflow.documents import ContractDocument, Document
+from documentflow.users import Organization, User
+
+
+def _make_docs(count: int) -> List[Document]:
+    user = User(id="u1", login="bench", display_name="Bench")
+    org = Organization(name="ООО Ромашка", inn="7700000001")
+    docs: List[Document] = []
+    for i in range(count):
+        doc = ContractDocument(id=str(i), number=f"CON-{i:07d}", title=f"Договор поставки {i}", author=user,
+                               organization=org, total_amount=i * 100)
+        doc.add_version(f"Текст договора {i} " * 20, "u1")
+        doc.metadata.add_tag("поставка")
+        doc.metadata.set_attribute("region", str(i % 90))
+        docs.append(doc)
+    return docs
+
+
+def run(name: str, docs: List[Document], dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]) -> None:
+    started = time.perf_counter()
+    blobs = [dumps(doc) for doc in docs]
+    encoded = time.perf_counter() - started
+    started = time.perf_counter()
+    for raw in blobs:
+        loads(raw)
+    decoded = time.perf_counter() - started
+    size = sum(len(raw) for raw in blobs) / len(blobs)
+    print(f"{name:8} encode {len(docs) / encoded:>9,.0f}/s  decode {len(docs) / decoded:>9,.0f}/s  {size:>6,.0f} байт/док")
+
+
+def main(count: int = 20_000) -> None:
+    docs = _make_docs(count)
+    run("codec", docs, codec.encode, codec.decode)
+    run("json", docs, serialization.dumps, serialization.loads)
+    run("pickle", docs, pickle.dumps, pickle.loads)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
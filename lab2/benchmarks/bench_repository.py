@@ -0,0 +1,49 @@
+"""Сравнение пропускной способности репозиториев: python -m benchmarks.bench_repository [N]"""
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+from documentflow.core import DocumentRepositoryProtocol
+from documentflow.documents import IncomingDocument
+from documentflow.security import QuotaManager
+from documentflow.services import InMemoryDocumentRepository
+from documentflow.sqlite_repository import SqliteDocumentRepository
+from documentflow.storage import DocumentStorage, StorageLocation
+from documentflow.users import User
+
+
+def _rate(count: int, action: Callable[[], None]) -> float:
+    started = time.perf_counter()
+    action()
+    return count / (time.perf_counter() - started)
+
+
+def run(name: str, repo: DocumentRepositoryProtocol, count: int) -> None:
+    user = User(id="u1", login="bench", display_name="Bench")
+    docs = [IncomingDocument(id=str(i), number=f"IN-{i:07d}", title=f"Входящее письмо {i % 1000}", author=user) for i in range(count)]
+    half = count // 2
+
+    def save_single() -> None:
+        for doc in docs[:half]:
+            repo.save(doc)
+
+    saves = _rate(half, save_single)
+    bulk = _rate(count - half, lambda: repo.save_many(docs[half:]))
+    gets = _rate(count, lambda: [repo.get(d.number) for d in docs])
+    queries = 200
+    search = _rate(queries, lambda: [list(repo.search_substring(f"письмо {i}")) for i in range(queries)])
+    print(f"{name:10} save {saves:>9,.0f}/s  save_many {bulk:>9,.0f}/s  get {gets:>9,.0f}/s  search {search:>7,.0f}/s")
+
+
+def main(count: int = 20_000) -> None:
+    storage = DocumentStorage(location=StorageLocation(name="bench", base_path="/tmp"), quota=QuotaManager(max_bytes=10**12))
+    run("in-memory", InMemoryDocumentRepository(storage=storage), count)
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = SqliteDocumentRepository(path=os.path.join(tmp, "bench.db"))
+        run("sqlite", repo, count)
+        repo.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
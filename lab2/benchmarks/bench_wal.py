@@ -0,0 +1,34 @@
+"""Замер восстановления DurableDocumentStorage из журнала: python -m benchmarks.bench_wal [N]"""
+import os
+import sys
+import tempfile
+import time
+from documentflow.wal import DurableDocumentStorage, FsyncPolicy
+from documentflow.storage import StorageLocation
+from documentflow.security import QuotaManager
+from documentflow.documents import IncomingDocument
+from documentflow.users import User
+
+
+def main(count: int = 100_000) -> None:
+    user = User(id="u1", login="bench", display_name="Bench")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "docs.wal")
+        location = StorageLocation(name="bench", base_path=tmp)
+        storage = DurableDocumentStorage.open(location, QuotaManager(max_bytes=10**12), path, fsync_policy=FsyncPolicy.GROUP, group_size=1024)
+        started = time.perf_counter()
+        for i in range(count):
+            storage.save(IncomingDocument(id=str(i), number=f"IN-{i:09d}", title=f"Входящее письмо {i}", author=user))
+        storage.close()
+        written = time.perf_counter() - started
+
+        recovered = DurableDocumentStorage.open(location, QuotaManager(max_bytes=10**12), path)
+        stats = recovered.last_recovery
+        recovered.close()
+        per_million = stats.seconds / stats.records * 1_000_000
+        print(f"write: {count / written:,.0f} records/s, log size: {os.path.getsize(path) / count:.0f} B/record")
+        print(f"recovery: {stats.records:,} records in {stats.seconds:.2f}s (~{per_million:.0f}s per million)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
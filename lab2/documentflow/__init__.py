@@ -2,11 +2,25 @@
 __all__ = [
     "exceptions",
     "core",
+    "versions",
+    "diffs",
     "documents",
     "workflow",
     "users",
     "security",
+    "indexes",
+    "blobs",
     "storage",
+    "partitioning",
+    "query",
+    "cache",
+    "serialization",
+    "codec",
+    "wal",
+    "sqlite_repository",
+    "snapshot",
+    "retention",
+    "compaction",
     "payments",
     "services",
     "cli",
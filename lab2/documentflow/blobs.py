@@ -0,0 +1,52 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict
+from .documents import DocumentAttachment
+
+
+@dataclass
+class BlobStore:
+    """Reference-counted attachment contents keyed by checksum
+
+    Every attachment with the same checksum shares one blob. The store
+    only counts references; the caller charges quota when acquire()
+    reports a new blob and frees it when release() drops the last one.
+    """
+    _blobs: Dict[str, DocumentAttachment] = field(default_factory=dict)
+    _refs: Dict[str, int] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._blobs
+
+    def acquire(self, key: str, att: DocumentAttachment) -> bool:
+        """Add a reference; True if the blob was not stored before"""
+        refs = self._refs.get(key, 0)
+        if refs == 0:
+            self._blobs[key] = att
+        self._refs[key] = refs + 1
+        return refs == 0
+
+    def release(self, key: str) -> DocumentAttachment | None:
+        """Drop a reference; return the blob if it was the last one"""
+        refs = self._refs.get(key, 0)
+        if refs == 0:
+            return None
+        if refs > 1:
+            self._refs[key] = refs - 1
+            return None
+        del self._refs[key]
+        return self._blobs.pop(key)
+
+    def refcount(self, key: str) -> int:
+        return self._refs.get(key, 0)
+
+    def stored_bytes(self) -> int:
+        """Get the size of unique blobs, i.e. the quota they occupy"""
+        return sum(att.size for att in self._blobs.values())
+
+    def clear(self) -> None:
+        self._blobs.clear()
+        self._refs.clear()
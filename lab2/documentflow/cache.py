@@ -0,0 +1,278 @@
+from __future__ import annotations
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+from .core import DocumentRepositoryProtocol, SearchPage
+from .documents import Document
+from .exceptions import VersionConflictError
+from .storage import DocumentStorage
+
+_DOCUMENT_OVERHEAD = 1024
+_ITEM_OVERHEAD = 256
+
+
+def estimate_size(doc: Document) -> int:
+    """Estimate the memory held by a document without walking every object"""
+    size = _DOCUMENT_OVERHEAD + sys.getsizeof(doc.title) + sys.getsizeof(doc.number)
+    if not doc.is_loaded():
+        return size
+    for version in doc.versions:
+        # delta-encoded and chunked versions keep no content string of their own
+        size += _ITEM_OVERHEAD + sys.getsizeof(version.__dict__.get("content", "")) + sys.getsizeof(version.comment)
+        chunks = version.__dict__.get("_chunks")
+        if chunks is not None:
+            size += len(chunks)
+    store = doc.__dict__.get("_version_store")
+    if store is not None:
+        size += store.stored_chars()
+    items = len(doc.attachments) + len(doc.signatures) + len(doc.metadata.tags) + len(doc.metadata.attributes)
+    return size + _ITEM_OVERHEAD * items
+
+
+def _query_key(query: str) -> str:
+    # every blank query returns all documents; as "" it is invalidated by any save
+    key = query.lower()
+    return key if key.strip() else ""
+
+
+@dataclass
+class SearchCache:
+    capacity: int = 1024
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    _entries: "OrderedDict[str, List[Document]]" = field(default_factory=OrderedDict)
+    _by_number: Dict[str, Set[str]] = field(default_factory=dict)
+    _by_gram: Dict[str, Set[str]] = field(default_factory=dict)
+    _short: Set[str] = field(default_factory=set)
+
+    def attach(self, storage: DocumentStorage) -> None:
+        """Invalidate cached results on every write to the storage"""
+        storage.subscribe(self.on_storage_event)
+
+    def get(self, query: str) -> List[Document] | None:
+        """Get cached results for the query, if any"""
+        key = _query_key(query)
+        docs = self._entries.get(key)
+        if docs is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(docs)
+
+    def put(self, query: str, docs: List[Document]) -> None:
+        """Cache results for the query, evicting the least recently used entry"""
+        key = _query_key(query)
+        self._drop(key)
+        self._entries[key] = list(docs)
+        for doc in docs:
+            self._by_number.setdefault(doc.number, set()).add(key)
+        if len(key) < 3:
+            self._short.add(key)
+        else:
+            self._by_gram.setdefault(key[:3], set()).add(key)
+        while len(self._entries) > self.capacity:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        docs = self._entries.pop(key, None)
+        if docs is None:
+            return
+        for doc in docs:
+            keys = self._by_number.get(doc.number)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_number[doc.number]
+        if len(key) < 3:
+            self._short.discard(key)
+        else:
+            keys = self._by_gram[key[:3]]
+            keys.discard(key)
+            if not keys:
+                del self._by_gram[key[:3]]
+
+    def _affected_keys(self, doc: Document) -> Set[str]:
+        keys = set(self._by_number.get(doc.number, ()))
+        for text in (doc.title.lower(), doc.number.lower()):
+            keys.update(k for k in self._short if k in text)
+            for i in range(len(text) - 2):
+                keys.update(k for k in self._by_gram.get(text[i:i + 3], ()) if k in text)
+        return keys
+
+    def on_storage_event(self, storage: DocumentStorage, event: str, *args: Any) -> None:
+        if event == "saved":
+            keys = self._affected_keys(args[0])
+        elif event in ("deleted", "demoted"):
+            keys = set(self._by_number.get(args[0], ()))
+        elif event == "cleared":
+            keys = set(self._entries)
+        else:
+            return
+        for key in keys:
+            self._drop(key)
+        self.invalidations += len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters"""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+@dataclass
+class CachedDocumentRepository(DocumentRepositoryProtocol):
+    """Read-through, write-through cache of documents in front of a repository
+
+    Documents are kept in LRU order until their estimated size exceeds
+    max_bytes; a document cached before its deferred fields are loaded is
+    measured again once they are. Misses are remembered for negative_ttl
+    seconds so repeated lookups of absent numbers do not reach the
+    repository. Writes that bypass the wrapper must call invalidate().
+    """
+    repo: DocumentRepositoryProtocol
+    max_bytes: int = 64 * 1024 * 1024
+    negative_ttl: float = 5.0
+    negative_capacity: int = 1024
+    clock: Callable[[], float] = time.monotonic
+    hits: int = 0
+    misses: int = 0
+    negative_hits: int = 0
+    evictions: int = 0
+    _entries: "OrderedDict[str, Tuple[Document, int]]" = field(default_factory=OrderedDict)
+    _bytes: int = 0
+    _missing: "OrderedDict[str, float]" = field(default_factory=OrderedDict)
+
+    def get(self, number: str) -> Document | None:
+        entry = self._entries.get(number)
+        if entry is not None:
+            self._entries.move_to_end(number)
+            self.hits += 1
+            return entry[0]
+        expires = self._missing.get(number)
+        if expires is not None:
+            if expires > self.clock():
+                self.negative_hits += 1
+                return None
+            del self._missing[number]
+        self.misses += 1
+        doc = self.repo.get(number)
+        if doc is None:
+            self._remember_missing(number)
+        else:
+            self._put(doc)
+        return doc
+
+    def exists(self, number: str) -> bool:
+        if number in self._entries:
+            return True
+        expires = self._missing.get(number)
+        if expires is not None and expires > self.clock():
+            return False
+        return self.repo.exists(number)
+
+    def save(self, doc: Document, expected_revision: int | None = None) -> None:
+        try:
+            self.repo.save(doc, expected_revision)
+        except VersionConflictError:
+            # the cached copy is stale; the retry must read the current one
+            self.invalidate(doc.number)
+            raise
+        entry = self._entries.get(doc.number)
+        if entry is not None and entry[0] is not doc and entry[0].id == doc.id:
+            # keep handing out the document callers already hold
+            entry[0].update_from(doc)
+            doc = entry[0]
+        self._put(doc)
+
+    def save_many(self, docs: Iterable[Document]) -> None:
+        docs = list(docs)
+        self.repo.save_many(docs)
+        for doc in docs:
+            self._put(doc)
+
+    def search(self, query: str) -> Iterable[Document]:
+        return self.repo.search(query)
+
+    def search_words(self, query: str) -> Iterable[Document]:
+        return self.repo.search_words(query)
+
+    def search_substring(self, query: str) -> Iterable[Document]:
+        return self.repo.search_substring(query)
+
+    def search_page(self, query: str, limit: int, cursor: str | None = None, order_by: str = "number") -> SearchPage:
+        return self.repo.search_page(query, limit, cursor, order_by)
+
+    def search_content(self, query: str, limit: int = 10) -> List[Document]:
+        return self.repo.search_content(query, limit)
+
+    def invalidate(self, number: str) -> None:
+        """Forget a cached document or miss"""
+        self._drop(number)
+        self._missing.pop(number, None)
+
+    def _put(self, doc: Document) -> None:
+        self._drop(doc.number)
+        self._missing.pop(doc.number, None)
+        size = estimate_size(doc)
+        if size > self.max_bytes:
+            return
+        self._entries[doc.number] = (doc, size)
+        self._bytes += size
+        if not doc.is_loaded():
+            doc.subscribe(self._on_document_event)
+        self._evict()
+
+    def _on_document_event(self, doc: Document, event: str, *args: Any) -> None:
+        if event != "loaded":
+            return
+        doc.unsubscribe(self._on_document_event)
+        entry = self._entries.get(doc.number)
+        if entry is None or entry[0] is not doc:
+            return
+        size = estimate_size(doc)
+        self._bytes += size - entry[1]
+        if size > self.max_bytes:
+            self._drop(doc.number)
+            return
+        self._entries[doc.number] = (doc, size)
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, number: str) -> None:
+        entry = self._entries.pop(number, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+            entry[0].unsubscribe(self._on_document_event)
+
+    def _remember_missing(self, number: str) -> None:
+        self._missing[number] = self.clock() + self.negative_ttl
+        self._missing.move_to_end(number)
+        while len(self._missing) > self.negative_capacity:
+            self._missing.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Get cache counters and the hit ratio of get()"""
+        lookups = self.hits + self.misses + self.negative_hits
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
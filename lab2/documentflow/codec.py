@@ -0,0 +1,309 @@
+from __future__ import annotations
+import struct
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple, Type
+from .documents import (
+    ContractDocument, Document, DocumentAttachment, DocumentLock, DocumentMetadata, DocumentVersion,
+    IncomingDocument, InvoiceDocument, OrderDocument, OutgoingDocument, Signature,
+)
+from .users import Department, Organization, User
+from .versions import ChunkedContent
+from .workflow import ApprovalRoute, ApprovalStep
+
+# 2 appends the document revision, 3 the keyframe interval of delta versions,
+# 4 the chunk size of each version (0 for plain contents)
+SCHEMA_VERSION = 4
+
+_HEADER = struct.Struct("<BB")
+# version, type code, flags, created_at, updated_at, then counts of versions,
+# attachments, tags, attributes and signatures
+_DOCUMENT = struct.Struct("<BBBqqIIIII")
+_VERSION = struct.Struct("<qq")
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_NONE = -(2 ** 63)
+_HAS_ORGANIZATION = 1
+_HAS_DEPARTMENT = 2
+_HAS_ROUTE = 4
+_HAS_LOCK = 8
+
+
+def _micros(value: datetime | None) -> int:
+    if value is None:
+        return _NONE
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(value: int) -> datetime | None:
+    return None if value == _NONE else _EPOCH + value * _MICROSECOND
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.parts: List[bytes] = []
+
+    def u8(self, value: int) -> None:
+        self.parts.append(_U8.pack(value))
+
+    def u32(self, value: int) -> None:
+        self.parts.append(_U32.pack(value))
+
+    def int(self, value: int) -> None:
+        self.parts.append(_I64.pack(value))
+
+    def bool(self, value: bool) -> None:
+        self.u8(1 if value else 0)
+
+    def str(self, value: str) -> None:
+        raw = value.encode()
+        self.parts.append(_U32.pack(len(raw)))
+        self.parts.append(raw)
+
+    def chunks(self, content: ChunkedContent) -> None:
+        self.parts.append(_U32.pack(len(content)))
+        self.parts.extend(content.iter_bytes())
+
+    def opt_str(self, value: str | None) -> None:
+        self.bool(value is not None)
+        if value is not None:
+            self.str(value)
+
+    def datetime(self, value: datetime | None) -> None:
+        self.int(_micros(value))
+
+    def str_list(self, values: List[str]) -> None:
+        self.u32(len(values))
+        for value in values:
+            self.str(value)
+
+
+class _Reader:
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw
+        self.pos = 0
+
+    def u8(self) -> int:
+        (value,) = _U8.unpack_from(self.raw, self.pos)
+        self.pos += _U8.size
+        return value
+
+    def u32(self) -> int:
+        (value,) = _U32.unpack_from(self.raw, self.pos)
+        self.pos += _U32.size
+        return value
+
+    def int(self) -> int:
+        (value,) = _I64.unpack_from(self.raw, self.pos)
+        self.pos += _I64.size
+        return value
+
+    def bool(self) -> bool:
+        return self.u8() != 0
+
+    def bytes(self) -> memoryview:
+        (length,) = _U32.unpack_from(self.raw, self.pos)
+        start = self.pos + _U32.size
+        self.pos = start + length
+        if self.pos > len(self.raw):
+            raise ValueError("Данные документа обрезаны")
+        return memoryview(self.raw)[start:self.pos]
+
+    def str(self) -> str:
+        return str(self.bytes(), "utf-8")
+
+    def opt_str(self) -> str | None:
+        return self.str() if self.bool() else None
+
+    def datetime(self) -> datetime | None:
+        return _from_micros(self.int())
+
+    def str_list(self) -> List[str]:
+        return [self.str() for _ in range(self.u32())]
+
+
+@dataclass
+class ReferenceResolver:
+    """Restores users, organizations and departments stored by ID
+
+    Unknown IDs become placeholder objects that carry only the ID, so a
+    document can always be decoded.
+    """
+    users: Dict[str, User] = field(default_factory=dict)
+    organizations: Dict[str, Organization] = field(default_factory=dict)
+    departments: Dict[str, Department] = field(default_factory=dict)
+
+    def user(self, user_id: str) -> User:
+        user = self.users.get(user_id)
+        return user if user is not None else User(id=user_id, login=user_id, display_name=user_id)
+
+    def organization(self, inn: str) -> Organization:
+        org = self.organizations.get(inn)
+        return org if org is not None else Organization(name="", inn=inn)
+
+    def department(self, cost_center: str) -> Department:
+        dept = self.departments.get(cost_center)
+        return dept if dept is not None else Department(name="", cost_center=cost_center)
+
+
+_Field = Tuple[str, str]
+_document_types: Dict[int, Tuple[Type[Document], Tuple[_Field, ...]]] = {}
+_type_codes: Dict[Type[Document], int] = {}
+
+
+def register_document_type(code: int, cls: Type[Document], fields: Tuple[_Field, ...] = ()) -> None:
+    """Register a Document subclass with its extra fields as (name, kind) pairs
+
+    kind is one of "str", "int", "bool", "datetime" and "str_list";
+    datetime fields may be None.
+    """
+    if code in _document_types and _document_types[code][0] is not cls:
+        raise ValueError(f"Код типа {code} уже занят")
+    _document_types[code] = (cls, fields)
+    _type_codes[cls] = code
+
+
+register_document_type(1, Document)
+register_document_type(2, IncomingDocument, (("sender", "str"),))
+register_document_type(3, OutgoingDocument, (("recipient", "str"),))
+register_document_type(4, ContractDocument, (("effective_from", "datetime"), ("effective_to", "datetime"), ("total_amount", "int")))
+register_document_type(5, InvoiceDocument, (("amount_due", "int"), ("due_date", "datetime"), ("paid", "bool")))
+register_document_type(6, OrderDocument, (("items", "str_list"),))
+
+
+def _write_route(w: _Writer, route: ApprovalRoute) -> None:
+    w.str(route.name)
+    w.bool(route.is_active)
+    w.u32(len(route.steps))
+    for step in route.steps:
+        w.str(step.name)
+        w.str(step.role_name)
+        w.bool(step.required)
+        w.int(step.deadline_hours)
+        w.int(step.order)
+
+
+def _read_route(r: _Reader) -> ApprovalRoute:
+    name = r.str()
+    is_active = r.bool()
+    steps = [ApprovalStep(name=r.str(), role_name=r.str(), required=r.bool(), deadline_hours=r.int(), order=r.int())
+             for _ in range(r.u32())]
+    return ApprovalRoute(name=name, steps=steps, is_active=is_active)
+
+
+def encode(doc: Document) -> bytes:
+    """Encode a document; users, organizations and departments are stored by ID"""
+    try:
+        code = _type_codes[type(doc)]
+    except KeyError as e:
+        raise TypeError(f"Тип {type(doc).__name__} не зарегистрирован") from e
+    w = _Writer()
+    flags = ((_HAS_ORGANIZATION if doc.organization else 0) | (_HAS_DEPARTMENT if doc.department else 0)
+             | (_HAS_ROUTE if doc.approval_route is not None else 0) | (_HAS_LOCK if doc._lock is not None else 0))
+    w.parts.append(_DOCUMENT.pack(SCHEMA_VERSION, code, flags, _micros(doc.created_at), _micros(doc.updated_at),
+                                  len(doc.versions), len(doc.attachments), len(doc.metadata.tags),
+                                  len(doc.metadata.attributes), len(doc.signatures)))
+    w.str(doc.id)
+    w.str(doc.number)
+    w.str(doc.title)
+    w.str(doc.author.id)
+    w.str(doc.status)
+    if doc.organization:
+        w.str(doc.organization.inn)
+    if doc.department:
+        w.str(doc.department.cost_center)
+    for v in doc.versions:
+        w.parts.append(_VERSION.pack(v.number, _micros(v.created_at)))
+        chunks = v.__dict__["_chunks"] if v.is_chunked() else None
+        if chunks is not None:
+            w.chunks(chunks)
+        else:
+            w.str(v.content)
+        w.str(v.author_id)
+        w.str(v.comment)
+        w.u32(chunks.chunk_size if chunks is not None else 0)
+    for att in doc.attachments:
+        w.int(att.size)
+        w.str(att.filename)
+        w.str(att.content_type)
+        w.str(att.checksum)
+    if doc.approval_route is not None:
+        _write_route(w, doc.approval_route)
+    for tag in doc.metadata.tags:
+        w.str(tag)
+    for key, value in doc.metadata.attributes.items():
+        w.str(key)
+        w.str(value)
+    if doc._lock is not None:
+        w.datetime(doc._lock.acquired_at)
+        w.str(doc._lock.owner_id)
+    for sig in doc.signatures:
+        w.datetime(sig.signed_at)
+        w.str(sig.user_id)
+        w.str(sig.certificate_id)
+    for name, kind in _document_types[code][1]:
+        getattr(w, kind)(getattr(doc, name))
+    w.int(doc.revision)
+    w.int(doc.delta_keyframes)
+    return b"".join(w.parts)
+
+
+def decode(raw: bytes, resolver: ReferenceResolver | None = None) -> Document:
+    """Decode a document produced by encode"""
+    resolver = resolver or ReferenceResolver()
+    version, code = _HEADER.unpack_from(raw, 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Неподдерживаемая версия схемы: {version}")
+    try:
+        cls, extra = _document_types[code]
+    except KeyError as e:
+        raise ValueError(f"Неизвестный код типа документа: {code}") from e
+    (_, _, flags, created_at, updated_at, versions, attachments, tags, attributes,
+     signatures) = _DOCUMENT.unpack_from(raw, 0)
+    r = _Reader(raw)
+    r.pos = _DOCUMENT.size
+    text = r.str
+    state: Dict[str, Any] = {
+        "id": text(),
+        "number": text(),
+        "title": text(),
+        "author": resolver.user(text()),
+        "status": text(),
+        "organization": resolver.organization(text()) if flags & _HAS_ORGANIZATION else None,
+        "department": resolver.department(text()) if flags & _HAS_DEPARTMENT else None,
+        "created_at": _from_micros(created_at),
+        "updated_at": _from_micros(updated_at),
+    }
+    state["versions"] = [_read_version(r, version) for _ in range(versions)]
+    state["attachments"] = [DocumentAttachment(size=r.int(), filename=text(), content_type=text(), checksum=text())
+                            for _ in range(attachments)]
+    state["approval_route"] = _read_route(r) if flags & _HAS_ROUTE else None
+    state["metadata"] = DocumentMetadata(tags=[text() for _ in range(tags)],
+                                         attributes={text(): text() for _ in range(attributes)})
+    state["_lock"] = DocumentLock(acquired_at=r.datetime(), owner_id=text()) if flags & _HAS_LOCK else None
+    state["signatures"] = [Signature(signed_at=r.datetime(), user_id=text(), certificate_id=text())
+                           for _ in range(signatures)]
+    readers: Dict[str, Callable[[], Any]] = {"str": r.str, "int": r.int, "bool": r.bool, "datetime": r.datetime, "str_list": r.str_list}
+    for name, kind in extra:
+        state[name] = readers[kind]()
+    state["revision"] = r.int() if version >= 2 else 0
+    state["delta_keyframes"] = r.int() if version >= 3 else 0
+    doc = cls.__new__(cls)
+    doc.__setstate__(state)
+    return doc
+
+
+def _read_version(r: _Reader, schema: int) -> DocumentVersion:
+    number, created_at = _VERSION.unpack_from(r.raw, r.pos)
+    r.pos += _VERSION.size
+    content = r.bytes()
+    fields: Dict[str, Any] = {"number": number, "created_at": _from_micros(created_at), "author_id": r.str(), "comment": r.str()}
+    chunk_size = r.u32() if schema >= 4 else 0
+    if chunk_size:
+        return DocumentVersion.chunked(ChunkedContent.from_source(content, chunk_size), **fields)
+    return DocumentVersion(content=str(content, "utf-8"), **fields)
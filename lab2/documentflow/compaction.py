@@ -0,0 +1,228 @@
+from __future__ import annotations
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, ContextManager, Dict, List, Set
+from .cache import estimate_size
+from .documents import Document, DocumentVersion
+from .services import retry_on_conflict
+from .storage import DocumentStorage
+
+
+class CompactionPolicy(ABC):
+    """Chooses versions of a document to keep; the rest may be pruned"""
+
+    @abstractmethod
+    def keep(self, doc: Document, now: datetime) -> Set[int]:
+        """Get numbers of versions the policy keeps"""
+
+
+@dataclass
+class KeepLastN(CompactionPolicy):
+    n: int = 10
+
+    def __post_init__(self) -> None:
+        if self.n <= 0:
+            raise ValueError("n должен быть положительным")
+
+    def keep(self, doc: Document, now: datetime) -> Set[int]:
+        return {v.number for v in doc.versions[-self.n:]}
+
+
+@dataclass
+class KeepAnnotated(CompactionPolicy):
+    """Keeps commented versions and versions that were current when signed"""
+    comments: bool = True
+    signatures: bool = True
+
+    def keep(self, doc: Document, now: datetime) -> Set[int]:
+        kept: Set[int] = set()
+        if self.comments:
+            kept.update(v.number for v in doc.versions if v.comment)
+        if self.signatures and doc.signatures and doc.versions:
+            created = [v.created_at for v in doc.versions]
+            for sig in doc.signatures:
+                i = bisect_right(created, sig.signed_at)
+                if i:
+                    kept.add(doc.versions[i - 1].number)
+        return kept
+
+
+@dataclass
+class ThinByAge(CompactionPolicy):
+    """Keeps every version newer than older_than, and of older ones the last per period"""
+    older_than: timedelta = timedelta(days=30)
+    period: timedelta = timedelta(days=1)
+
+    def __post_init__(self) -> None:
+        if self.period <= timedelta(0):
+            raise ValueError("period должен быть положительным")
+
+    def keep(self, doc: Document, now: datetime) -> Set[int]:
+        cutoff = now - self.older_than
+        kept: Set[int] = set()
+        last_in_period: Dict[int, int] = {}
+        for v in doc.versions:
+            if v.created_at > cutoff:
+                kept.add(v.number)
+            else:
+                last_in_period[(cutoff - v.created_at) // self.period] = v.number
+        kept.update(last_in_period.values())
+        return kept
+
+
+@dataclass
+class CompactionReport:
+    documents: int = 0
+    compacted: int = 0
+    versions_removed: int = 0
+    reclaimed_bytes: int = 0
+    seconds: float = 0.0
+
+    def add(self, other: "CompactionReport") -> None:
+        self.documents += other.documents
+        self.compacted += other.compacted
+        self.versions_removed += other.versions_removed
+        self.reclaimed_bytes += other.reclaimed_bytes
+
+
+def _kept(doc: Document, policies: List[CompactionPolicy], now: datetime) -> Set[int]:
+    kept: Set[int] = set()
+    for policy in policies:
+        kept |= policy.keep(doc, now)
+    return kept
+
+
+def compact_document(doc: Document, policies: List[CompactionPolicy], now: datetime | None = None) -> CompactionReport:
+    """Prune versions no policy keeps; the latest version is always kept
+
+    reclaimed_bytes is the drop in estimate_size of the document.
+    """
+    if not policies:
+        raise ValueError("Нужна хотя бы одна политика")
+    now = now or datetime.utcnow()
+    report = CompactionReport(documents=1)
+    versions: List[DocumentVersion] = doc.versions
+    if len(versions) < 2:
+        return report
+    kept = _kept(doc, policies, now)
+    before = estimate_size(doc)
+    removed = doc.prune_versions(v.number for v in versions if v.number not in kept)
+    if removed:
+        report.compacted = 1
+        report.versions_removed = len(removed)
+        report.reclaimed_bytes = max(0, before - estimate_size(doc))
+    return report
+
+
+@dataclass
+class VersionCompactor:
+    """Applies compaction policies to submitted documents and a whole storage
+
+    run_once compacts the documents passed to submit, then every document
+    held in memory by the storage, pausing after every batch_size of them.
+    Cold documents are left alone so compaction does not rehydrate them.
+    Stored documents are compacted on a copy saved with the revision it was
+    taken at, so the change is logged and a concurrent write is not lost.
+    When the storage is shared with other threads, pass the lock guarding it.
+    """
+    policies: List[CompactionPolicy]
+    storage: DocumentStorage | None = None
+    batch_size: int = 200
+    pause: float = 0.01
+    lock: threading.Lock | None = None
+    clock: Callable[[], datetime] = datetime.utcnow
+    runs: int = 0
+    total_reclaimed: int = 0
+    last_report: CompactionReport = field(default_factory=CompactionReport)
+    _pending: Dict[str, Document] = field(default_factory=dict, repr=False)
+    _wake: threading.Event = field(default_factory=threading.Event, repr=False)
+    _stop: threading.Event = field(default_factory=threading.Event, repr=False)
+    _thread: threading.Thread | None = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        if not self.policies:
+            raise ValueError("Нужна хотя бы одна политика")
+        if self.batch_size <= 0:
+            raise ValueError("batch_size должен быть положительным")
+
+    def _guard(self) -> ContextManager[object]:
+        return self.lock if self.lock is not None else nullcontext()
+
+    def submit(self, doc: Document) -> None:
+        """Queue one document for the next run and wake the background thread"""
+        with self._guard():
+            self._pending[doc.id] = doc
+        self._wake.set()
+
+    def run_once(self) -> CompactionReport:
+        """Compact submitted documents, then the storage, in throttled batches"""
+        report = CompactionReport()
+        started = time.perf_counter()
+        now = self.clock()
+        with self._guard():
+            pending, self._pending = list(self._pending.values()), {}
+            numbers = self.storage.get_all_numbers() if self.storage is not None else []
+        seen: Set[int] = set()
+        for doc in pending:
+            if self.storage is not None and self.storage._docs.get(doc.number) is doc:
+                report.add(self._compact_stored(doc.number, now))
+            else:
+                with self._guard():
+                    report.add(compact_document(doc, self.policies, now))
+            seen.add(id(doc))
+        for i in range(0, len(numbers), self.batch_size):
+            for number in numbers[i:i + self.batch_size]:
+                assert self.storage is not None
+                if id(self.storage._docs.get(number)) not in seen:
+                    report.add(self._compact_stored(number, now))
+            if i + self.batch_size < len(numbers) and self._stop.wait(self.pause):
+                break
+        report.seconds = time.perf_counter() - started
+        self.runs += 1
+        self.total_reclaimed += report.reclaimed_bytes
+        self.last_report = report
+        return report
+
+    @retry_on_conflict()
+    def _compact_stored(self, number: str, now: datetime) -> CompactionReport:
+        assert self.storage is not None
+        with self._guard():
+            doc = self.storage._docs.get(number)
+            if doc is None:
+                return CompactionReport()
+            # copy only documents that lose versions; the latest is always kept
+            kept = _kept(doc, self.policies, now) if len(doc.versions) > 1 else set()
+            if all(v.number in kept for v in doc.versions[:-1]):
+                return CompactionReport(documents=1)
+            draft = doc.draft()
+            report = compact_document(draft, self.policies, now)
+            self.storage.save(draft, expected_revision=doc.revision)
+            return report
+
+    def start(self, interval: float = 3600.0) -> None:
+        """Run every interval seconds, or sooner after submit, in a daemon thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop() -> None:
+            while not self._stop.is_set():
+                self._wake.clear()
+                self.run_once()
+                self._wake.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="version-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread after the current batch"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -2,7 +2,7 @@ from __future__ import annotations
 from abc import ABC
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Protocol, runtime_checkable, Optional, Iterable
+from typing import Protocol, runtime_checkable, Optional, Iterable, List, Callable, Any
 
 
 @dataclass(kw_only=True)
@@ -26,6 +26,29 @@ class TimestampMixin:
     updated_at: datetime
 
 
+class ObservableMixin:
+    """Notifies subscribed listeners about in-place changes of an entity"""
+
+    def subscribe(self, listener: Callable[..., None]) -> None:
+        listeners = self.__dict__.setdefault("_listeners", [])
+        if listener not in listeners:
+            listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[..., None]) -> None:
+        listeners = self.__dict__.get("_listeners")
+        if listeners and listener in listeners:
+            listeners.remove(listener)
+
+    def _emit(self, event: str, *args: Any) -> None:
+        for listener in list(self.__dict__.get("_listeners", ())):
+            listener(self, event, *args)
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state.pop("_listeners", None)
+        return state
+
+
 class Validatable(ABC):
     def validate(self) -> None: ...
 
@@ -52,6 +75,16 @@ class PaymentProcessorProtocol(Protocol):
     def transfer(self, src_account: str, dst_account: str, amount: int) -> str: ...
 
 
+@dataclass
+class SearchPage:
+    items: List["DocumentLike"] = field(default_factory=list)
+    next_cursor: str | None = None
+
+    def has_more(self) -> bool:
+        """Check if another page can be requested with next_cursor"""
+        return self.next_cursor is not None
+
+
 class DocumentLike(Protocol):
     number: str
     title: str
@@ -61,10 +94,20 @@ class DocumentLike(Protocol):
 
 @runtime_checkable
 class DocumentRepositoryProtocol(Protocol):
-    def save(self, doc: "DocumentLike") -> None: ...
+    def save(self, doc: "DocumentLike", expected_revision: int | None = None) -> None: ...
+
+    def save_many(self, docs: Iterable["DocumentLike"]) -> None: ...
 
     def get(self, number: str) -> Optional["DocumentLike"]: ...
 
     def exists(self, number: str) -> bool: ...
 
     def search(self, query: str) -> Iterable["DocumentLike"]: ...
+
+    def search_words(self, query: str) -> Iterable["DocumentLike"]: ...
+
+    def search_substring(self, query: str) -> Iterable["DocumentLike"]: ...
+
+    def search_page(self, query: str, limit: int, cursor: str | None = None, order_by: str = "number") -> SearchPage: ...
+
+    def search_content(self, query: str, limit: int = 10) -> List["DocumentLike"]: ...
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Hashable, List, Tuple
+
+DIFF_MODES = ("line", "word")
+
+_WORD_RE = re.compile(r"\s+|\S+")
+
+
+@dataclass(frozen=True)
+class DiffOp:
+    """One run of the diff: tag is equal, insert, delete or replace"""
+    tag: str
+    old: str
+    new: str
+
+
+@dataclass(frozen=True)
+class VersionDiff:
+    from_number: int
+    to_number: int
+    mode: str
+    ops: Tuple[DiffOp, ...]
+
+    def changes(self) -> List[DiffOp]:
+        """Get the runs that are not equal"""
+        return [op for op in self.ops if op.tag != "equal"]
+
+    def is_empty(self) -> bool:
+        return all(op.tag == "equal" for op in self.ops)
+
+    def added(self) -> int:
+        """Count inserted lines or words"""
+        return sum(len(_units(op.new, self.mode)) for op in self.ops if op.tag != "equal")
+
+    def removed(self) -> int:
+        """Count deleted lines or words"""
+        return sum(len(_units(op.old, self.mode)) for op in self.ops if op.tag != "equal")
+
+
+def _units(text: str, mode: str) -> List[str]:
+    if mode == "line":
+        return text.splitlines(keepends=True)
+    return [w for w in _WORD_RE.findall(text) if not w.isspace()]
+
+
+def _opcodes(old: List[str], new: List[str]) -> List[Tuple[str, int, int, int, int]]:
+    # strip the common head and tail first: between adjacent versions of a
+    # long contract they are most of the text and cost SequenceMatcher most
+    head = 0
+    limit = min(len(old), len(new))
+    while head < limit and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    codes: List[Tuple[str, int, int, int, int]] = []
+    if head:
+        codes.append(("equal", 0, head, 0, head))
+    matcher = SequenceMatcher(None, old[head:len(old) - tail], new[head:len(new) - tail])
+    codes.extend((tag, i1 + head, i2 + head, j1 + head, j2 + head) for tag, i1, i2, j1, j2 in matcher.get_opcodes())
+    if tail:
+        codes.append(("equal", len(old) - tail, len(old), len(new) - tail, len(new)))
+    return codes
+
+
+def _diff_units(old: List[str], new: List[str]) -> List[DiffOp]:
+    return [DiffOp(tag, "".join(old[i1:i2]), "".join(new[j1:j2])) for tag, i1, i2, j1, j2 in _opcodes(old, new)]
+
+
+def diff_contents(old: str, new: str, mode: str = "line") -> List[DiffOp]:
+    """Diff two texts by lines, or by words within changed lines"""
+    if mode not in DIFF_MODES:
+        raise ValueError(f"Неизвестный режим сравнения: {mode}")
+    ops = _diff_units(old.splitlines(keepends=True), new.splitlines(keepends=True))
+    if mode == "line":
+        return ops
+    words: List[DiffOp] = []
+    for op in ops:
+        if op.tag == "replace":
+            words.extend(_diff_units(_WORD_RE.findall(op.old), _WORD_RE.findall(op.new)))
+        else:
+            words.append(op)
+    return words
+
+
+@dataclass
+class DiffCache:
+    """Bounded LRU of version diffs keyed by (document id, from, to, mode)
+
+    Entries remember the compared versions by weak reference and are only
+    returned while the document still holds those very version objects,
+    so replaced, reloaded or compacted versions never see a stale diff.
+    """
+    capacity: int = 256
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    _entries: "OrderedDict[Hashable, Tuple[weakref.ref[Any], weakref.ref[Any], VersionDiff]]" = field(default_factory=OrderedDict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.capacity <= 0:
+            raise ValueError("capacity должен быть положительным")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, old: Any, new: Any) -> VersionDiff | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0]() is not old or entry[1]() is not new:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Hashable, old: Any, new: Any, diff: VersionDiff) -> None:
+        with self._lock:
+            self._entries[key] = (weakref.ref(old), weakref.ref(new), diff)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+default_diff_cache = DiffCache()
@@ -1,30 +1,54 @@
 from __future__ import annotations
+import copy
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict
-from .core import BaseEntity, IdentifiableMixin, Validatable, Approvable, Signable
+from typing import List, Dict, Set, Any, Callable, Iterable, Iterator
+from .core import BaseEntity, IdentifiableMixin, ObservableMixin, Validatable, Approvable, Signable
 from .exceptions import InvalidDocumentStatusError, InvalidSignatureError, VersionConflictError
 from .users import User, Organization, Department
 from .workflow import ApprovalRoute, WorkflowState
+from .versions import CHUNK_SIZE, ChunkedContent, DeltaVersionStore
+from .diffs import DiffCache, VersionDiff, default_diff_cache, diff_contents
 
 @dataclass
-class DocumentMetadata:
+class DocumentMetadata(ObservableMixin):
     tags: List[str] = field(default_factory=list)
     attributes: Dict[str, str] = field(default_factory=dict)
+    _tag_set: Set[str] = field(default_factory=set, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self._tag_set = set(self.tags)
     
     def add_tag(self, tag: str) -> None:
         """Add a tag to metadata"""
-        if tag not in self.tags:
+        if tag not in self._tag_set:
+            self._tag_set.add(tag)
             self.tags.append(tag)
+            self._emit("tag_added", tag)
     
     def remove_tag(self, tag: str) -> None:
         """Remove a tag from metadata"""
-        if tag in self.tags:
+        if tag in self._tag_set:
+            self._tag_set.discard(tag)
             self.tags.remove(tag)
+            self._emit("tag_removed", tag)
     
     def has_tag(self, tag: str) -> bool:
         """Check if metadata has a specific tag"""
-        return tag in self.tags
+        return tag in self._tag_set
+    
+    def set_attribute(self, key: str, value: str) -> None:
+        """Set an attribute value"""
+        old = self.attributes.get(key)
+        if old != value:
+            self.attributes[key] = value
+            self._emit("attribute_set", key, old, value)
+    
+    def remove_attribute(self, key: str) -> None:
+        """Remove an attribute"""
+        if key in self.attributes:
+            old = self.attributes.pop(key)
+            self._emit("attribute_removed", key, old)
 
 @dataclass
 class DocumentAttachment:
@@ -53,9 +77,68 @@ class DocumentVersion:
     author_id: str
     comment: str = ""
     
+    @classmethod
+    def in_store(cls, store: DeltaVersionStore, content: str, **fields: Any) -> "DocumentVersion":
+        """Create a version whose content is kept in a delta store"""
+        version = cls.__new__(cls)
+        version.__dict__.update({"comment": "", **fields})
+        version.__dict__["_store"] = store
+        version.__dict__["_slot"] = store.append(content)
+        return version
+
+    @classmethod
+    def chunked(cls, chunks: ChunkedContent, **fields: Any) -> "DocumentVersion":
+        """Create a version whose content is kept in fixed-size chunks"""
+        version = cls.__new__(cls)
+        version.__dict__.update({"comment": "", **fields})
+        version.__dict__["_chunks"] = chunks
+        return version
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        # serializers hand chunked bodies back as ChunkedContent
+        if isinstance(state.get("content"), ChunkedContent):
+            self.__dict__["_chunks"] = self.__dict__.pop("content")
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "content":
+            store = self.__dict__.get("_store")
+            if store is not None:
+                return store.content(self.__dict__["_slot"])
+            chunks = self.__dict__.get("_chunks")
+            if chunks is not None:
+                return chunks.content
+        raise AttributeError(name)
+
     def get_content_length(self) -> int:
         """Get content length"""
+        if "content" not in self.__dict__:
+            store = self.__dict__.get("_store")
+            if store is not None:
+                return store.length(self.__dict__["_slot"])
+            chunks = self.__dict__.get("_chunks")
+            if chunks is not None:
+                return chunks.char_length
         return len(self.content)
+
+    def iter_content(self) -> Iterator[str]:
+        """Iterate the content in pieces without joining chunked bodies"""
+        chunks = self.__dict__.get("_chunks")
+        if chunks is not None and "content" not in self.__dict__:
+            yield from chunks.iter_text()
+        else:
+            yield self.content
+
+    def iter_bytes(self) -> Iterator[memoryview]:
+        """Iterate the UTF-8 content as memoryviews over stored chunks"""
+        chunks = self.__dict__.get("_chunks")
+        if chunks is not None and "content" not in self.__dict__:
+            yield from chunks.iter_bytes()
+        else:
+            yield memoryview(self.content.encode())
+
+    def is_chunked(self) -> bool:
+        return "_chunks" in self.__dict__
     
     def is_latest(self, total_versions: int) -> bool:
         """Check if this is the latest version"""
@@ -110,37 +193,257 @@ class DocumentLock:
         """Get lock duration in seconds"""
         return int((datetime.utcnow() - self.acquired_at).total_seconds())
 
+LAZY_FIELDS = ("versions", "attachments", "signatures", "metadata")
+
+
+class _ObservedField:
+    """Document field whose assignments go through a setter that notifies listeners
+
+    It is the dataclass default itself, as dataclasses read the default
+    through __get__ on the class. A factory default is passed to __init__
+    as the descriptor and made fresh for each instance.
+    """
+
+    def __init__(self, default: Any, setter: str, factory: bool = False) -> None:
+        self.default = default
+        self.setter = setter
+        self.factory = factory
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, obj: Any, owner: type | None = None) -> Any:
+        if obj is None:
+            return self if self.factory else self.default
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            # falls back to __getattr__, which loads deferred fields
+            raise AttributeError(self.name) from None
+
+    def __set__(self, obj: Any, value: Any) -> None:
+        if value is self:
+            value = self.default()
+        getattr(obj, self.setter)(value)
+
+
 @dataclass(kw_only=True)
-class Document(IdentifiableMixin, Validatable, Approvable, Signable, BaseEntity):
+class Document(IdentifiableMixin, ObservableMixin, Validatable, Approvable, Signable, BaseEntity):
     id: str
     number: str
     title: str
     author: User
     organization: Organization | None = None
     department: Department | None = None
-    status: str = WorkflowState.NEW
+    # only status and metadata changes are observed, so writes to every
+    # other field cost a plain attribute store
+    status: str = _ObservedField(WorkflowState.NEW, "_set_status")  # type: ignore[assignment]
     versions: List[DocumentVersion] = field(default_factory=list)
     attachments: List[DocumentAttachment] = field(default_factory=list)
     approval_route: ApprovalRoute | None = None
-    metadata: DocumentMetadata = field(default_factory=DocumentMetadata)
+    metadata: DocumentMetadata = _ObservedField(DocumentMetadata, "_set_metadata", factory=True)  # type: ignore[assignment]
     _lock: DocumentLock | None = None
     signatures: List[Signature] = field(default_factory=list)
+    # bumped by storages on every save; compare-and-swap writes check it
+    revision: int = 0
+    # keyframe interval of delta-encoded versions, 0 when contents are plain
+    delta_keyframes: int = 0
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        # serialized versions come back with plain contents
+        if self.delta_keyframes and "versions" in state and "_version_store" not in state:
+            self.use_delta_versions(self.delta_keyframes)
+
+    def subscribe(self, listener: Callable[..., None]) -> None:
+        # metadata events are relayed only once someone listens to the document
+        super().subscribe(listener)
+        metadata = self.__dict__.get("metadata")
+        if metadata is not None:
+            metadata.subscribe(self._relay_metadata_event)
+
+    def _set_status(self, value: str) -> None:
+        old = self.__dict__.get("status")
+        self.__dict__["status"] = value
+        if old is not None and old != value:
+            self._emit("status", old, value)
+
+    def _set_metadata(self, value: DocumentMetadata) -> None:
+        old = self.__dict__.get("metadata")
+        self.__dict__["metadata"] = value
+        if old is None or old is value:
+            return
+        old.unsubscribe(self._relay_metadata_event)
+        if self.__dict__.get("_listeners"):
+            value.subscribe(self._relay_metadata_event)
+        self._emit("metadata_replaced")
+
+    def __getstate__(self) -> dict:
+        self.load_deferred()
+        return super().__getstate__()
+
+    def __getattr__(self, name: str) -> Any:
+        # called only for attributes missing from __dict__, i.e. deferred fields
+        if name in LAZY_FIELDS and "_loader" in self.__dict__:
+            self.load_deferred()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def defer_loading(self, loader: Callable[[], Dict[str, Any]]) -> None:
+        """Load versions, attachments, signatures and metadata on first access
+
+        loader returns the missing fields; fields already set are kept.
+        """
+        self.__dict__["_loader"] = loader
+
+    def is_loaded(self) -> bool:
+        """Check that no fields are waiting for a deferred load"""
+        return "_loader" not in self.__dict__
+
+    def load_deferred(self) -> None:
+        """Load deferred fields now and emit loaded"""
+        loader = self.__dict__.pop("_loader", None)
+        if loader is None:
+            return
+        try:
+            values = loader()
+        except Exception:
+            self.__dict__["_loader"] = loader
+            raise
+        for name in LAZY_FIELDS:
+            self.__dict__.setdefault(name, values[name])
+        if self.delta_keyframes and "_version_store" not in self.__dict__:
+            self.use_delta_versions(self.delta_keyframes)
+        if self.__dict__.get("_listeners"):
+            self.metadata.subscribe(self._relay_metadata_event)
+            self._emit("loaded")
+
+    def touch(self) -> None:
+        super().touch()
+        self._emit("touched")
+
+    def draft(self) -> "Document":
+        """Get a deep copy to change and save back; it shares the author, organization and department"""
+        shared = {id(ref): ref for ref in (self.author, self.organization, self.department) if ref is not None}
+        return copy.deepcopy(self, shared)
+
+    def update_from(self, other: "Document") -> None:
+        """Take over the fields of a changed copy, keeping the listeners of this document
+
+        The copy should not be used afterwards: its lists are now shared.
+        """
+        listeners = self.__dict__.get("_listeners")
+        metadata = self.__dict__.get("metadata")
+        if metadata is not None:
+            metadata.unsubscribe(self._relay_metadata_event)
+        self.__dict__.clear()
+        self.__setstate__(other.__getstate__())
+        if listeners:
+            self.__dict__["_listeners"] = listeners
+            self.metadata.subscribe(self._relay_metadata_event)
+
+    def _relay_metadata_event(self, metadata: DocumentMetadata, event: str, *args: Any) -> None:
+        self._emit(event, *args)
 
     def validate(self) -> None:
         if not self.title or not self.number:
             raise ValueError("title и number обязательны")
 
-    def add_version(self, content: str, author_id: str) -> DocumentVersion:
-        v = DocumentVersion(
-            number=len(self.versions) + 1,
-            content=content,
-            created_at=datetime.utcnow(),
-            author_id=author_id,
-        )
+    def use_delta_versions(self, keyframe_interval: int = 16) -> DeltaVersionStore:
+        """Keep version contents as keyframes plus deltas, converting existing versions
+
+        The mode is kept in delta_keyframes and survives serialization.
+        """
+        store = DeltaVersionStore(keyframe_interval=keyframe_interval)
+        self.versions = [
+            DocumentVersion.in_store(store, v.content, number=v.number, created_at=v.created_at,
+                                     author_id=v.author_id, comment=v.comment)
+            for v in self.versions
+        ]
+        self.__dict__["_version_store"] = store
+        self.delta_keyframes = keyframe_interval
+        return store
+
+    def add_version(self, content: str | Iterable[str | bytes] | Any, author_id: str,
+                    chunk_size: int = CHUNK_SIZE) -> DocumentVersion:
+        """Add a version; content may be a str, bytes, an iterator of str/bytes pieces or a file-like object
+
+        Non-string content is stored in chunks of chunk_size bytes.
+        """
+        # numbers keep growing after older versions are pruned; reading
+        # versions first loads deferred fields, which restores the store
+        number = self.versions[-1].number + 1 if self.versions else 1
+        store = self.__dict__.get("_version_store")
+        if not isinstance(content, str):
+            v = DocumentVersion.chunked(ChunkedContent.from_source(content, chunk_size), number=number,
+                                        created_at=datetime.utcnow(), author_id=author_id)
+        elif store is not None:
+            v = DocumentVersion.in_store(store, content, number=number,
+                                         created_at=datetime.utcnow(), author_id=author_id)
+        else:
+            v = DocumentVersion(
+                number=number,
+                content=content,
+                created_at=datetime.utcnow(),
+                author_id=author_id,
+            )
+        previous = self.versions[-1] if self.versions else None
         self.versions.append(v)
         self.touch()
+        self._emit("version_added", v, previous)
         return v
 
+    def prune_versions(self, numbers: Iterable[int]) -> List[DocumentVersion]:
+        """Remove versions by number, never the latest; return the removed ones
+
+        Remaining versions keep their numbers. Delta-encoded contents are
+        re-encoded, since removed versions may be keyframes of others.
+        """
+        drop = set(numbers)
+        if self.versions:
+            drop.discard(self.versions[-1].number)
+        removed = [v for v in self.versions if v.number in drop]
+        if not removed:
+            return []
+        kept = [v for v in self.versions if v.number not in drop]
+        store = self.__dict__.get("_version_store")
+        if store is not None:
+            fresh = DeltaVersionStore(keyframe_interval=store.keyframe_interval)
+            kept = [
+                DocumentVersion.in_store(fresh, v.content, number=v.number, created_at=v.created_at,
+                                         author_id=v.author_id, comment=v.comment)
+                if "_store" in v.__dict__ else v
+                for v in kept
+            ]
+            self.__dict__["_version_store"] = fresh
+        self.versions = kept
+        self._emit("versions_pruned", removed)
+        return removed
+
+    def get_version(self, number: int) -> DocumentVersion:
+        """Get a version by its number"""
+        versions = self.versions
+        if 0 < number <= len(versions) and versions[number - 1].number == number:
+            return versions[number - 1]
+        for v in versions:
+            if v.number == number:
+                return v
+        raise ValueError(f"Версия {number} не найдена")
+
+    def diff(self, from_number: int, to_number: int, mode: str = "line",
+             cache: DiffCache | None = default_diff_cache) -> VersionDiff:
+        """Diff two versions by lines or words; results are memoized in cache"""
+        old, new = self.get_version(from_number), self.get_version(to_number)
+        key = (self.id, from_number, to_number, mode)
+        if cache is not None:
+            cached = cache.get(key, old, new)
+            if cached is not None:
+                return cached
+        result = VersionDiff(from_number, to_number, mode, tuple(diff_contents(old.content, new.content, mode)))
+        if cache is not None:
+            cache.put(key, old, new, result)
+        return result
+
     def add_attachment(self, attachment: DocumentAttachment) -> None:
         self.attachments.append(attachment)
         self.touch()
@@ -227,6 +530,10 @@ class DocumentRegistry:
     def contains(self, number: str) -> bool:
         return number in self.numbers
     
+    def register_many(self, numbers: Iterable[str]) -> None:
+        """Register a batch of numbers already checked for duplicates"""
+        self.numbers.update(numbers)
+    
     def unregister(self, number: str) -> None:
         """Unregister a document number"""
         self.numbers.discard(number)
@@ -0,0 +1,596 @@
+from __future__ import annotations
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+import heapq
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Set, Tuple
+from .documents import Document
+from .workflow import WorkflowState
+
+_TOKEN_RE = re.compile(r"\w+")
+_TAIL_RE = re.compile(r"\w+\Z")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def tokenize_stream(pieces: Iterable[str]) -> Iterator[str]:
+    """Tokenize text split into pieces, joining words cut at piece boundaries"""
+    carry = ""
+    for piece in pieces:
+        text = carry + piece
+        tail = _TAIL_RE.search(text)
+        carry = tail.group() if tail else ""
+        yield from tokenize(text[:len(text) - len(carry)])
+    yield from tokenize(carry)
+
+
+def _intersect(postings: List[Set[str]]) -> Set[str]:
+    postings = sorted(postings, key=len)
+    result = set(postings[0])
+    for numbers in postings[1:]:
+        result &= numbers
+        if not result:
+            break
+    return result
+
+
+class DocumentIndex(ABC):
+    """Secondary index over documents kept in DocumentStorage, keyed by number"""
+
+    @abstractmethod
+    def add(self, doc: Document) -> None: ...
+
+    @abstractmethod
+    def remove(self, number: str) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    def on_event(self, doc: Document, event: str, *args: Any) -> None:
+        """React to an in-place change of an indexed document"""
+
+
+@dataclass
+class TokenIndex(DocumentIndex):
+    _postings: Dict[str, Set[str]] = field(default_factory=dict)
+    _doc_tokens: Dict[str, Set[str]] = field(default_factory=dict)
+
+    def add(self, doc: Document) -> None:
+        self.remove(doc.number)
+        tokens = set(tokenize(doc.title)) | set(tokenize(doc.number))
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(doc.number)
+        self._doc_tokens[doc.number] = tokens
+
+    def remove(self, number: str) -> None:
+        for token in self._doc_tokens.pop(number, ()):
+            postings = self._postings[token]
+            postings.discard(number)
+            if not postings:
+                del self._postings[token]
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._doc_tokens.clear()
+
+    def lookup(self, query: str) -> Set[str]:
+        """Get numbers of documents containing every token of the query"""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return set()
+        postings = []
+        for token in tokens:
+            numbers = self._postings.get(token)
+            if not numbers:
+                return set()
+            postings.append(numbers)
+        return _intersect(postings)
+
+    def token_count(self) -> int:
+        """Count distinct indexed tokens"""
+        return len(self._postings)
+
+
+def trigrams(text: str) -> Set[str]:
+    """Get padded lowercase trigrams of text"""
+    padded = f"\x02{text.lower()}\x03"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class TrigramIndex(DocumentIndex):
+    _postings: Dict[str, Set[str]] = field(default_factory=dict)
+    _texts: Dict[str, tuple[str, str]] = field(default_factory=dict)
+
+    def add(self, doc: Document) -> None:
+        self.remove(doc.number)
+        title, number = doc.title.lower(), doc.number.lower()
+        for gram in trigrams(title) | trigrams(number):
+            self._postings.setdefault(gram, set()).add(doc.number)
+        self._texts[doc.number] = (title, number)
+
+    def remove(self, number: str) -> None:
+        texts = self._texts.pop(number, None)
+        if texts is None:
+            return
+        for gram in trigrams(texts[0]) | trigrams(texts[1]):
+            postings = self._postings[gram]
+            postings.discard(number)
+            if not postings:
+                del self._postings[gram]
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._texts.clear()
+
+    def postings(self, query: str) -> List[Set[str]] | None:
+        """Get the posting sets of the query's trigrams, smallest first
+
+        None means the query is too short to have trigrams; an empty list
+        means some trigram has no documents, so nothing can match.
+        """
+        q = query.lower()
+        if len(q) < 3:
+            return None
+        postings = []
+        for i in range(len(q) - 2):
+            numbers = self._postings.get(q[i:i + 3])
+            if not numbers:
+                return []
+            postings.append(numbers)
+        return sorted(postings, key=len)
+
+    def candidates(self, query: str) -> Set[str]:
+        """Get numbers of documents that may contain the query as a substring"""
+        q = query.lower()
+        postings = self.postings(q)
+        if postings is None:
+            result: Set[str] = set()
+            for gram, numbers in self._postings.items():
+                if q in gram:
+                    result |= numbers
+            return result
+        return _intersect(postings) if postings else set()
+
+    def contains(self, number: str, query: str) -> bool:
+        """Check that the document's title or number contains the lowercase query"""
+        texts = self._texts.get(number)
+        return texts is not None and (query in texts[0] or query in texts[1])
+
+    def lookup(self, query: str) -> Set[str]:
+        """Get numbers of documents whose title or number contains the query"""
+        q = query.lower()
+        return {n for n in self.candidates(q) if self.contains(n, q)}
+
+
+@dataclass
+class TagIndex(DocumentIndex):
+    _by_tag: Dict[str, Set[str]] = field(default_factory=dict)
+    _by_attribute: Dict[Tuple[str, str], Set[str]] = field(default_factory=dict)
+    _doc_tags: Dict[str, Set[str]] = field(default_factory=dict)
+    _doc_attributes: Dict[str, Dict[str, str]] = field(default_factory=dict)
+
+    def add(self, doc: Document) -> None:
+        self.remove(doc.number)
+        self._doc_tags[doc.number] = set()
+        self._doc_attributes[doc.number] = {}
+        for tag in doc.metadata.tags:
+            self._link_tag(doc.number, tag)
+        for key, value in doc.metadata.attributes.items():
+            self._link_attribute(doc.number, key, value)
+
+    def remove(self, number: str) -> None:
+        for tag in list(self._doc_tags.get(number, ())):
+            self._unlink_tag(number, tag)
+        for key in list(self._doc_attributes.get(number, ())):
+            self._unlink_attribute(number, key)
+        self._doc_tags.pop(number, None)
+        self._doc_attributes.pop(number, None)
+
+    def clear(self) -> None:
+        self._by_tag.clear()
+        self._by_attribute.clear()
+        self._doc_tags.clear()
+        self._doc_attributes.clear()
+
+    def on_event(self, doc: Document, event: str, *args: Any) -> None:
+        if doc.number not in self._doc_tags:
+            return
+        if event == "tag_added":
+            self._link_tag(doc.number, args[0])
+        elif event == "tag_removed":
+            self._unlink_tag(doc.number, args[0])
+        elif event == "attribute_set":
+            self._unlink_attribute(doc.number, args[0])
+            self._link_attribute(doc.number, args[0], args[2])
+        elif event == "attribute_removed":
+            self._unlink_attribute(doc.number, args[0])
+        elif event == "metadata_replaced":
+            self.add(doc)
+
+    def _link_tag(self, number: str, tag: str) -> None:
+        self._by_tag.setdefault(tag, set()).add(number)
+        self._doc_tags[number].add(tag)
+
+    def _unlink_tag(self, number: str, tag: str) -> None:
+        numbers = self._by_tag.get(tag)
+        if numbers is not None:
+            numbers.discard(number)
+            if not numbers:
+                del self._by_tag[tag]
+        self._doc_tags[number].discard(tag)
+
+    def _link_attribute(self, number: str, key: str, value: str) -> None:
+        self._by_attribute.setdefault((key, value), set()).add(number)
+        self._doc_attributes[number][key] = value
+
+    def _unlink_attribute(self, number: str, key: str) -> None:
+        value = self._doc_attributes[number].pop(key, None)
+        if value is None:
+            return
+        numbers = self._by_attribute[(key, value)]
+        numbers.discard(number)
+        if not numbers:
+            del self._by_attribute[(key, value)]
+
+    def with_tags(self, tags: Iterable[str], match_all: bool = True) -> Set[str]:
+        """Get numbers of documents having all (AND) or any (OR) of the tags"""
+        postings = [self._by_tag.get(tag, set()) for tag in set(tags)]
+        if not postings:
+            return set()
+        if match_all:
+            return _intersect(postings)
+        return set().union(*postings)
+
+    def with_attribute(self, key: str, value: str) -> Set[str]:
+        """Get numbers of documents whose attribute has the given value"""
+        return set(self._by_attribute.get((key, value), ()))
+
+    def tag_facets(self, numbers: Iterable[str] | None = None) -> Dict[str, int]:
+        """Count documents per tag, optionally within a subset of numbers"""
+        if numbers is None:
+            return {tag: len(docs) for tag, docs in self._by_tag.items()}
+        counts: Dict[str, int] = {}
+        for number in numbers:
+            for tag in self._doc_tags.get(number, ()):
+                counts[tag] = counts.get(tag, 0) + 1
+        return counts
+
+    def attribute_facets(self, key: str, numbers: Iterable[str] | None = None) -> Dict[str, int]:
+        """Count documents per value of an attribute, optionally within a subset of numbers"""
+        if numbers is None:
+            return {value: len(docs) for (k, value), docs in self._by_attribute.items() if k == key}
+        counts: Dict[str, int] = {}
+        for number in numbers:
+            value = self._doc_attributes.get(number, {}).get(key)
+            if value is not None:
+                counts[value] = counts.get(value, 0) + 1
+        return counts
+
+
+@dataclass
+class FieldIndex(DocumentIndex):
+    key: Callable[[Document], Hashable | None]
+    _by_value: Dict[Hashable, Set[str]] = field(default_factory=dict)
+    _doc_value: Dict[str, Hashable] = field(default_factory=dict)
+
+    def add(self, doc: Document) -> None:
+        self.remove(doc.number)
+        value = self.key(doc)
+        if value is None:
+            return
+        self._by_value.setdefault(value, set()).add(doc.number)
+        self._doc_value[doc.number] = value
+
+    def remove(self, number: str) -> None:
+        if number not in self._doc_value:
+            return
+        value = self._doc_value.pop(number)
+        numbers = self._by_value[value]
+        numbers.discard(number)
+        if not numbers:
+            del self._by_value[value]
+
+    def clear(self) -> None:
+        self._by_value.clear()
+        self._doc_value.clear()
+
+    def numbers(self, value: Hashable) -> Set[str]:
+        """Get numbers of documents with the given key value"""
+        return set(self._by_value.get(value, ()))
+
+    def count(self, value: Hashable) -> int:
+        """Count documents with the given key value"""
+        return len(self._by_value.get(value, ()))
+
+    def counts(self) -> Dict[Hashable, int]:
+        """Count documents per key value"""
+        return {value: len(numbers) for value, numbers in self._by_value.items()}
+
+
+def _status_key(doc: Document) -> str:
+    return doc.status
+
+
+@dataclass
+class StatusIndex(FieldIndex):
+    key: Callable[[Document], Hashable | None] = _status_key
+
+    def on_event(self, doc: Document, event: str, *args: Any) -> None:
+        if event == "status" and doc.number in self._doc_value:
+            self.add(doc)
+
+
+_MAX_CHAR = "\U0010ffff"
+
+
+@dataclass
+class OrderedIndex(DocumentIndex):
+    """Chunked sorted list of (key, number) pairs with logarithmic lookups
+
+    Documents whose key is None are not indexed.
+    """
+    key: Callable[[Document], Any]
+    load: int = 512
+    _chunks: List[List[Tuple[Any, str]]] = field(default_factory=list)
+    _maxes: List[Tuple[Any, str]] = field(default_factory=list)
+    _doc_key: Dict[str, Any] = field(default_factory=dict)
+
+    def add(self, doc: Document) -> None:
+        self.remove(doc.number)
+        value = self.key(doc)
+        if value is None:
+            return
+        entry = (value, doc.number)
+        self._doc_key[doc.number] = entry[0]
+        if not self._chunks:
+            self._chunks.append([entry])
+            self._maxes.append(entry)
+            return
+        i = min(bisect_left(self._maxes, entry), len(self._chunks) - 1)
+        chunk = self._chunks[i]
+        insort(chunk, entry)
+        self._maxes[i] = chunk[-1]
+        if len(chunk) > 2 * self.load:
+            self._chunks[i:i + 1] = [chunk[:self.load], chunk[self.load:]]
+            self._maxes[i:i + 1] = [chunk[self.load - 1], chunk[-1]]
+
+    def remove(self, number: str) -> None:
+        if number not in self._doc_key:
+            return
+        entry = (self._doc_key.pop(number), number)
+        i = bisect_left(self._maxes, entry)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, entry)]
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+
+    def clear(self) -> None:
+        self._chunks.clear()
+        self._maxes.clear()
+        self._doc_key.clear()
+
+    def __len__(self) -> int:
+        return len(self._doc_key)
+
+    def _iter_from(self, start: Tuple[Any, ...] | None) -> Iterator[Tuple[Any, str]]:
+        if start is None:
+            i, j = 0, 0
+        else:
+            i = bisect_left(self._maxes, start)
+            j = bisect_left(self._chunks[i], start) if i < len(self._chunks) else 0
+        for chunk in self._chunks[i:]:
+            yield from chunk[j:]
+            j = 0
+
+    def entry(self, number: str) -> Tuple[Any, str] | None:
+        """Get the (key, number) entry of a document, or None if it is not indexed"""
+        key = self._doc_key.get(number)
+        return None if key is None else (key, number)
+
+    def entries_after(self, key: Tuple[Any, ...] | None) -> Iterator[Tuple[Any, str]]:
+        """Iterate (key, number) entries strictly greater than key, in order"""
+        for entry in self._iter_from(key):
+            if key is None or entry > key:
+                yield entry
+
+    def range(self, low: Any = None, high: Any = None) -> Iterator[str]:
+        """Iterate numbers whose key lies in [low, high]; None leaves a bound open"""
+        for key, number in self._iter_from(None if low is None else (low,)):
+            if high is not None and key > high:
+                return
+            yield number
+
+    def prefix(self, prefix: str) -> Iterator[str]:
+        """Iterate numbers whose string key starts with prefix"""
+        for key, number in self._iter_from((prefix,)):
+            if not key.startswith(prefix):
+                return
+            yield number
+
+    def _entry_before(self, bound: Tuple[Any, ...]) -> Tuple[Any, str] | None:
+        i = bisect_left(self._maxes, bound)
+        if i < len(self._chunks):
+            j = bisect_left(self._chunks[i], bound)
+            if j > 0:
+                return self._chunks[i][j - 1]
+        return self._maxes[i - 1] if i > 0 else None
+
+    def last(self, prefix: str = "") -> str | None:
+        """Get the number with the greatest string key starting with prefix"""
+        entry = self._entry_before((prefix + _MAX_CHAR,))
+        if entry is None or not entry[0].startswith(prefix):
+            return None
+        return entry[1]
+
+
+def _archived_created_key(doc: Document) -> datetime | None:
+    return doc.created_at if doc.status == WorkflowState.ARCHIVED else None
+
+
+@dataclass
+class ArchivedAgeIndex(OrderedIndex):
+    """Archived documents ordered by creation time"""
+    key: Callable[[Document], Any] = _archived_created_key
+
+    def on_event(self, doc: Document, event: str, *args: Any) -> None:
+        if event == "status":
+            self.add(doc)
+
+
+def _updated_key(doc: Document) -> str:
+    return doc.updated_at.isoformat()
+
+
+@dataclass
+class UpdatedAtIndex(OrderedIndex):
+    """Documents ordered by last update time, keyed by ISO strings as page cursors are"""
+    key: Callable[[Document], Any] = _updated_key
+
+    def on_event(self, doc: Document, event: str, *args: Any) -> None:
+        if event == "touched":
+            self.add(doc)
+
+
+@dataclass
+class FullTextIndex(DocumentIndex):
+    """BM25 index over the latest version content of each document
+
+    When max_postings is set and exceeded, the terms found in the most
+    documents (then the most often) are stopped: their postings are dropped,
+    as they carry the least weight. Up to max_postings stopped terms, those
+    found in the most documents, are remembered so later documents do not
+    index them again. The limit trades
+    recall for memory: a stopped term is no longer found, even once removals
+    free room, and memory stays proportional to max_postings.
+    """
+    max_postings: int | None = None
+    k1: float = 1.2
+    b: float = 0.75
+    _postings: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # indexed terms of each document, to retire its postings
+    _doc_terms: Dict[str, Set[str]] = field(default_factory=dict)
+    _doc_len: Dict[str, int] = field(default_factory=dict)
+    _total_len: int = 0
+    _posting_count: int = 0
+    _stopped: Dict[str, int] = field(default_factory=dict)
+    _stopped_heap: List[Tuple[int, str]] = field(default_factory=list)
+    _term_freq: Dict[str, int] = field(default_factory=dict)
+    _heap: List[Tuple[int, int, str]] = field(default_factory=list)
+
+    def add(self, doc: Document) -> None:
+        self.remove(doc.number)
+        if doc.versions:
+            self._index(doc.number, doc.versions[-1].iter_content())
+
+    def remove(self, number: str) -> None:
+        terms = self._doc_terms.pop(number, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            self._term_freq[term] -= postings.pop(number)
+            self._posting_count -= 1
+            if not postings:
+                del self._postings[term]
+                del self._term_freq[term]
+        self._total_len -= self._doc_len.pop(number)
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._doc_len.clear()
+        self._stopped.clear()
+        self._stopped_heap.clear()
+        self._term_freq.clear()
+        self._heap.clear()
+        self._total_len = 0
+        self._posting_count = 0
+
+    def on_event(self, doc: Document, event: str, *args: Any) -> None:
+        if event == "version_added":
+            self.remove(doc.number)
+            self._index(doc.number, args[0].iter_content())
+
+    def _index(self, number: str, pieces: Iterable[str]) -> None:
+        # counts terms as the pieces are tokenized, never holding all words
+        terms = Counter(tokenize_stream(pieces))
+        indexed: Set[str] = set()
+        for term, tf in terms.items():
+            if term in self._stopped:
+                continue
+            postings = self._postings.setdefault(term, {})
+            postings[number] = tf
+            self._term_freq[term] = self._term_freq.get(term, 0) + tf
+            self._posting_count += 1
+            self._push(term)
+            indexed.add(term)
+        length = sum(terms.values())
+        self._doc_terms[number] = indexed
+        self._doc_len[number] = length
+        self._total_len += length
+        self._enforce_limit()
+
+    def _push(self, term: str) -> None:
+        # the heap is lazy: an entry is stale once the term's counts change,
+        # and is skipped when popped
+        if self.max_postings is not None:
+            heapq.heappush(self._heap, (-len(self._postings[term]), -self._term_freq[term], term))
+
+    def _enforce_limit(self) -> None:
+        if self.max_postings is None:
+            return
+        while self._posting_count > self.max_postings and self._heap:
+            df, freq, term = heapq.heappop(self._heap)
+            postings = self._postings.get(term)
+            if postings is None or len(postings) != -df or self._term_freq[term] != -freq:
+                continue
+            del self._postings[term]
+            del self._term_freq[term]
+            self._posting_count -= len(postings)
+            for number in postings:
+                self._doc_terms[number].discard(term)
+            self._stopped[term] = -df
+            heapq.heappush(self._stopped_heap, (-df, term))
+            if len(self._stopped) > self.max_postings:
+                # the stopped term found in the fewest documents is forgotten
+                # and may be indexed again
+                del self._stopped[heapq.heappop(self._stopped_heap)[1]]
+        if len(self._heap) > 2 * len(self._postings) + 64:
+            self._heap = [(-len(p), -self._term_freq[t], t) for t, p in self._postings.items()]
+            heapq.heapify(self._heap)
+
+    def posting_count(self) -> int:
+        """Count postings currently held in memory"""
+        return self._posting_count
+
+    def stopped_terms(self) -> Set[str]:
+        """Get terms dropped to respect max_postings"""
+        return set(self._stopped)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Get up to limit (number, score) pairs ranked by BM25"""
+        n = len(self._doc_len)
+        if not n:
+            return []
+        avg_len = self._total_len / n or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[number] / avg_len)
+                scores[number] = scores.get(number, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import heapq
+import threading
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice, takewhile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, TypeVar
+from .blobs import BlobStore
+from .core import ObservableMixin, SearchPage
+from .documents import Document, DocumentAttachment
+from .security import QuotaManager
+from .storage import SORT_ORDERS, DocumentStorage, StorageLocation, encode_cursor
+
+T = TypeVar("T")
+
+
+def shard_of(number: str, shards: int) -> int:
+    """Get the shard of a document number; stable across processes"""
+    return zlib.crc32(number.encode()) % shards
+
+
+def _page_key(order_by: str, doc: Document) -> Tuple[str, ...]:
+    return (doc.number,) if order_by == "number" else (doc.updated_at.isoformat(), doc.number)
+
+
+def _number(doc: Document) -> str:
+    return doc.number
+
+
+def _archived_entries(p: DocumentStorage, cutoff: datetime, limit: int | None) -> List[Tuple[datetime, str]]:
+    entries = takewhile(lambda entry: entry[0] <= cutoff, p._archived_by_age.entries_after(None))
+    return list(entries if limit is None else islice(entries, limit))
+
+
+@dataclass
+class PartitionedDocumentStorage(ObservableMixin):
+    """Documents spread over DocumentStorage shards by hash of number
+
+    Point operations go to one shard under that shard's lock. Scans run
+    on every shard in a thread pool and their sorted results are merged.
+    Shards share the quota and one blob store, so attachments with the same
+    checksum are stored and charged once whatever shards their documents
+    are in; changes to the blob store are serialized by a lock of their own.
+    """
+    location: StorageLocation
+    quota: QuotaManager
+    shards: int = 4
+    _partitions: List[DocumentStorage] = field(default_factory=list)
+    _locks: List[threading.RLock] = field(default_factory=list, repr=False)
+    _blobs: BlobStore = field(default_factory=BlobStore)
+    _blob_lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    _pool: ThreadPoolExecutor | None = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.shards <= 0:
+            raise ValueError("Количество секций должно быть положительным")
+        self._partitions = [self._new_partition() for _ in range(self.shards)]
+        self._locks = [threading.RLock() for _ in range(self.shards)]
+
+    def _new_partition(self) -> DocumentStorage:
+        partition = DocumentStorage(location=self.location, quota=self.quota, _blobs=self._blobs)
+        partition.subscribe(self._relay)
+        return partition
+
+    def _relay(self, partition: DocumentStorage, event: str, *args: Any) -> None:
+        self._emit(event, *args)
+
+    def _index(self, number: str) -> int:
+        return shard_of(number, self.shards)
+
+    def partition(self, number: str) -> DocumentStorage:
+        """Get the shard holding the number"""
+        return self._partitions[self._index(number)]
+
+    def _locked(self, i: int, fn: Callable[[DocumentStorage], T]) -> T:
+        with self._locks[i]:
+            return fn(self._partitions[i])
+
+    def _blob_locked(self, i: int, fn: Callable[[DocumentStorage], T]) -> T:
+        with self._locks[i], self._blob_lock:
+            return fn(self._partitions[i])
+
+    def _fan_out(self, fn: Callable[[DocumentStorage], T]) -> List[T]:
+        if self.shards == 1:
+            return [self._locked(0, fn)]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.shards, thread_name_prefix="partition")
+        return list(self._pool.map(lambda i: self._locked(i, fn), range(self.shards)))
+
+    def save(self, doc: Document, expected_revision: int | None = None) -> None:
+        self._locked(self._index(doc.number), lambda p: p.save(doc, expected_revision))
+
+    def save_many(self, docs: Iterable[Document]) -> None:
+        """Save a batch of documents"""
+        for doc in docs:
+            self.save(doc)
+
+    def get(self, number: str) -> Document:
+        return self._locked(self._index(number), lambda p: p.get(number))
+
+    def exists(self, number: str) -> bool:
+        return self._locked(self._index(number), lambda p: p.exists(number))
+
+    def delete(self, number: str) -> None:
+        """Delete document from storage"""
+        self._blob_locked(self._index(number), lambda p: p.delete(number))
+
+    def archive(self, doc: Document) -> None:
+        doc.archive()
+
+    def demote(self, number: str) -> None:
+        self._locked(self._index(number), lambda p: p.demote(number))
+
+    def store_attachment(self, doc: Document, att: DocumentAttachment) -> None:
+        self._blob_locked(self._index(doc.number), lambda p: p.store_attachment(doc, att))
+
+    def remove_attachment(self, doc: Document, filename: str) -> bool:
+        return self._blob_locked(self._index(doc.number), lambda p: p.remove_attachment(doc, filename))
+
+    def count_documents(self) -> int:
+        """Count total documents in storage"""
+        return sum(self._fan_out(lambda p: p.count_documents()))
+
+    def get_all_numbers(self) -> List[str]:
+        """Get all document numbers"""
+        return list(heapq.merge(*self._fan_out(lambda p: p.get_all_numbers())))
+
+    def clear(self) -> None:
+        """Clear all documents from storage"""
+        def clear(p: DocumentStorage) -> None:
+            with self._blob_lock:
+                p.clear()
+
+        self._fan_out(clear)
+
+    def search(self, query: str) -> Iterator[Document]:
+        """Find documents whose title or number contains the query as a substring"""
+        return self.search_substring(query)
+
+    def search_words(self, query: str) -> Iterator[Document]:
+        """Find documents whose title or number contains every word of the query"""
+        yield from heapq.merge(*self._fan_out(lambda p: list(p.search_words(query))), key=_number)
+
+    def search_substring(self, query: str) -> Iterator[Document]:
+        """Find documents whose title or number contains the query as a substring"""
+        yield from heapq.merge(*self._fan_out(lambda p: list(p.search_substring(query))), key=_number)
+
+    def find_by_status(self, status: str) -> List[Document]:
+        """Find documents in the given workflow status"""
+        return list(heapq.merge(*self._fan_out(lambda p: p.find_by_status(status)), key=_number))
+
+    def count_by_status(self, status: str) -> int:
+        """Count documents in the given workflow status"""
+        return sum(self._fan_out(lambda p: p.count_by_status(status)))
+
+    def status_counts(self) -> Dict[str, int]:
+        """Count documents per workflow status"""
+        total: Counter[str] = Counter()
+        for counts in self._fan_out(lambda p: p.status_counts()):
+            total.update(counts)
+        return dict(total)
+
+    def archived_before(self, cutoff: datetime, limit: int | None = None) -> List[str]:
+        """Get numbers of archived documents created at or before cutoff, oldest first"""
+        merged = heapq.merge(*self._fan_out(lambda p: _archived_entries(p, cutoff, limit)))
+        return [n for _, n in (merged if limit is None else islice(merged, limit))]
+
+    def count_archived_before(self, cutoff: datetime) -> int:
+        """Count archived documents created at or before cutoff"""
+        return sum(self._fan_out(lambda p: p.count_archived_before(cutoff)))
+
+    def search_content(self, query: str, limit: int = 10) -> List[Document]:
+        """Find documents whose latest version content best matches the query
+
+        Scores come from each shard's own statistics, so the merged order
+        approximates a single index.
+        """
+        def top(p: DocumentStorage) -> List[Tuple[float, str, Document]]:
+            return [(-score, n, p._read(n)) for n, score in p._fulltext.search(query, limit)]
+
+        hits = heapq.nsmallest(limit, (hit for shard_hits in self._fan_out(top) for hit in shard_hits))
+        return [doc for _, _, doc in hits]
+
+    def search_page(self, query: str, limit: int, cursor: str | None = None, order_by: str = "number") -> SearchPage:
+        """Get one page of substring search results in a stable order"""
+        if limit <= 0:
+            raise ValueError("limit должен быть положительным")
+        if order_by not in SORT_ORDERS:
+            raise ValueError(f"Неизвестный порядок сортировки: {order_by}")
+        pages = self._fan_out(lambda p: p.search_page(query, limit, cursor, order_by))
+        docs = heapq.nsmallest(limit + 1, (doc for page in pages for doc in page.items),
+                               key=lambda d: _page_key(order_by, d))
+        has_more = len(docs) > limit or any(page.has_more() for page in pages)
+        items = docs[:limit]
+        next_cursor = encode_cursor(order_by, _page_key(order_by, items[-1])) if has_more and items else None
+        return SearchPage(items=items, next_cursor=next_cursor)
+
+    def rebalance(self, shards: int) -> int:
+        """Redistribute documents over a new number of shards; return how many moved
+
+        Only documents whose shard changes are moved, together with their
+        attachments and tier; their revisions stay as they are. Writes must
+        not run concurrently with it.
+        """
+        if shards <= 0:
+            raise ValueError("Количество секций должно быть положительным")
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            old = self._partitions
+            self._partitions = old + [self._new_partition() for _ in range(shards - len(old))]
+            moved = 0
+            for source in old:
+                for number in source.get_all_numbers():
+                    target = self._partitions[shard_of(number, shards)]
+                    if target is source:
+                        continue
+                    cold = source.is_cold(number)
+                    doc = source.get(number)
+                    attachments = [source._attachments[k] for k in source._attachment_keys.get(number, ())]
+                    source.delete(number)
+                    target._put(doc)
+                    target._emit("saved", doc)
+                    for att in attachments:
+                        target.store_attachment(doc, att)
+                    if cold:
+                        target.demote(number)
+                    moved += 1
+            for partition in self._partitions[shards:]:
+                partition.unsubscribe(self._relay)
+            self._partitions = self._partitions[:shards]
+            self.shards = shards
+        finally:
+            locks, self._locks = self._locks, [threading.RLock() for _ in range(self.shards)]
+            for lock in locks:
+                lock.release()
+        self.close()
+        return moved
+
+    def close(self) -> None:
+        """Shut down the scan thread pool"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,109 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Hashable, List, Set
+from .documents import Document
+from .storage import DocumentStorage
+
+FULL_SCAN = "full_scan"
+
+
+@dataclass
+class DocumentQuery:
+    status: str | None = None
+    doc_type: type | None = None
+    organization_inn: str | None = None
+    cost_center: str | None = None
+    author_id: str | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+    updated_from: datetime | None = None
+    updated_to: datetime | None = None
+
+    def indexed_filters(self) -> Dict[str, Hashable]:
+        """Get filters that can be answered by a storage field index"""
+        filters: Dict[str, Hashable] = {
+            "status": self.status,
+            "type": self.doc_type,
+            "organization": self.organization_inn,
+            "department": self.cost_center,
+            "author": self.author_id,
+        }
+        return {name: value for name, value in filters.items() if value is not None}
+
+    def matches(self, doc: Document) -> bool:
+        """Check if document satisfies every filter of the query"""
+        if self.status is not None and doc.status != self.status:
+            return False
+        if self.doc_type is not None and not isinstance(doc, self.doc_type):
+            return False
+        if self.organization_inn is not None and (not doc.organization or doc.organization.inn != self.organization_inn):
+            return False
+        if self.cost_center is not None and (not doc.department or doc.department.cost_center != self.cost_center):
+            return False
+        if self.author_id is not None and doc.author.id != self.author_id:
+            return False
+        if self.created_from is not None and doc.created_at < self.created_from:
+            return False
+        if self.created_to is not None and doc.created_at > self.created_to:
+            return False
+        if self.updated_from is not None and doc.updated_at < self.updated_from:
+            return False
+        if self.updated_to is not None and doc.updated_at > self.updated_to:
+            return False
+        return True
+
+
+@dataclass
+class QueryPlan:
+    index: str
+    estimated_rows: int
+    estimates: Dict[str, int] = field(default_factory=dict)
+
+    def describe(self) -> str:
+        """Get a one-line human readable plan description"""
+        others = ", ".join(f"{name}={rows}" for name, rows in sorted(self.estimates.items()))
+        return f"{self.index} (~{self.estimated_rows} rows){'; candidates: ' + others if others else ''}"
+
+
+@dataclass
+class QueryResult:
+    documents: List[Document]
+    plan: QueryPlan
+    examined: int = 0
+
+
+@dataclass
+class DocumentQueryEngine:
+    storage: DocumentStorage
+
+    def _candidates(self, name: str, value: Hashable) -> Set[str]:
+        index = self.storage.field_indexes()[name]
+        if name != "type":
+            return index.numbers(value)
+        subtypes = [t for t in index.counts() if issubclass(t, value)]  # type: ignore[arg-type]
+        return set().union(*(index.numbers(t) for t in subtypes))
+
+    def _estimate(self, name: str, value: Hashable) -> int:
+        index = self.storage.field_indexes()[name]
+        if name != "type":
+            return index.count(value)
+        return sum(count for t, count in index.counts().items() if issubclass(t, value))  # type: ignore[arg-type]
+
+    def plan(self, query: DocumentQuery) -> QueryPlan:
+        """Choose the most selective index for the query"""
+        estimates = {name: self._estimate(name, value) for name, value in query.indexed_filters().items()}
+        if not estimates:
+            return QueryPlan(index=FULL_SCAN, estimated_rows=self.storage.count_documents())
+        best = min(estimates, key=lambda name: estimates[name])
+        return QueryPlan(index=best, estimated_rows=estimates[best], estimates=estimates)
+
+    def execute(self, query: DocumentQuery) -> QueryResult:
+        """Run the query: fetch candidates from the chosen index, then filter them"""
+        plan = self.plan(query)
+        if plan.index == FULL_SCAN:
+            numbers: Set[str] | List[str] = self.storage.get_all_numbers()
+        else:
+            numbers = self._candidates(plan.index, query.indexed_filters()[plan.index])
+        docs = [self.storage._read(n) for n in sorted(numbers)]
+        return QueryResult(documents=[d for d in docs if query.matches(d)], plan=plan, examined=len(docs))
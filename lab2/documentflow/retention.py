@@ -0,0 +1,100 @@
+from __future__ import annotations
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, ContextManager
+from .storage import ArchiveService
+
+
+@dataclass
+class SweepReport:
+    deleted: int = 0
+    batches: int = 0
+    released_bytes: int = 0
+    seconds: float = 0.0
+    backlog: int = 0
+
+    def throughput(self) -> float:
+        """Get deleted documents per second"""
+        return self.deleted / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class RetentionSweeper:
+    """Deletes archived documents older than the archive retention period
+
+    Expired documents are found through the storage's created_at index of
+    archived documents and deleted in batches of batch_size with a pause
+    between batches, so a large backlog does not monopolize the storage.
+    A run stops after max_batches; the rest is reported as backlog. When
+    the storage is shared with other threads, pass the lock guarding it.
+    """
+    archive: ArchiveService
+    batch_size: int = 500
+    pause: float = 0.05
+    max_batches: int | None = None
+    lock: threading.Lock | None = None
+    clock: Callable[[], datetime] = datetime.utcnow
+    total_deleted: int = 0
+    runs: int = 0
+    last_report: SweepReport = field(default_factory=SweepReport)
+    _stop: threading.Event = field(default_factory=threading.Event, repr=False)
+    _thread: threading.Thread | None = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.batch_size <= 0:
+            raise ValueError("batch_size должен быть положительным")
+
+    def _guard(self) -> ContextManager[object]:
+        return self.lock if self.lock is not None else nullcontext()
+
+    def run_once(self) -> SweepReport:
+        """Delete expired archives in throttled batches"""
+        storage = self.archive.storage
+        cutoff = self.archive.retention_cutoff(self.clock())
+        report = SweepReport()
+        started = time.perf_counter()
+        while self.max_batches is None or report.batches < self.max_batches:
+            with self._guard():
+                numbers = storage.archived_before(cutoff, self.batch_size)
+                if not numbers:
+                    break
+                used = storage.quota.used_bytes
+                for number in numbers:
+                    storage.delete(number)
+                report.released_bytes += used - storage.quota.used_bytes
+            report.deleted += len(numbers)
+            report.batches += 1
+            if len(numbers) < self.batch_size or self._stop.wait(self.pause):
+                break
+        report.seconds = time.perf_counter() - started
+        with self._guard():
+            report.backlog = storage.count_archived_before(cutoff)
+        self.total_deleted += report.deleted
+        self.runs += 1
+        self.last_report = report
+        return report
+
+    def start(self, interval: float = 3600.0) -> None:
+        """Run the sweep every interval seconds in a daemon thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop() -> None:
+            while True:
+                self.run_once()
+                if self._stop.wait(interval):
+                    return
+
+        self._thread = threading.Thread(target=loop, name="retention-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread after the current batch"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import dataclasses
+import json
+from datetime import datetime
+from typing import Any, Dict, Tuple
+from . import documents, users, workflow
+from .documents import LAZY_FIELDS, Document, DocumentVersion
+from .versions import ChunkedContent
+
+_TYPE_KEY = "__type__"
+_types: Dict[str, type] = {}
+
+
+def register_type(cls: type) -> type:
+    """Allow a dataclass to be restored by from_primitive"""
+    _types[cls.__name__] = cls
+    return cls
+
+
+for _module in (documents, users, workflow):
+    for _obj in vars(_module).values():
+        if isinstance(_obj, type) and dataclasses.is_dataclass(_obj) and _obj.__module__ == _module.__name__:
+            register_type(_obj)
+
+
+def _field_value(obj: Any, name: str) -> Any:
+    # chunked version bodies are written piece by piece, never joined
+    if name == "content" and isinstance(obj, DocumentVersion) and obj.is_chunked():
+        return obj.__dict__["_chunks"]
+    return getattr(obj, name)
+
+
+def to_primitive(obj: Any) -> Any:
+    """Convert a value into JSON-compatible primitives"""
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, datetime):
+        return {_TYPE_KEY: "datetime", "value": obj.isoformat()}
+    if isinstance(obj, (set, frozenset)):
+        return {_TYPE_KEY: "set", "items": [to_primitive(v) for v in obj]}
+    if isinstance(obj, (list, tuple)):
+        return [to_primitive(v) for v in obj]
+    if isinstance(obj, dict):
+        return {_TYPE_KEY: "dict", "items": [[to_primitive(k), to_primitive(v)] for k, v in obj.items()]}
+    if isinstance(obj, ChunkedContent):
+        return {_TYPE_KEY: "chunks", "chunk_size": obj.chunk_size, "pieces": list(obj.iter_text())}
+    if dataclasses.is_dataclass(obj):
+        data = {f.name: to_primitive(_field_value(obj, f.name)) for f in dataclasses.fields(obj)}
+        data[_TYPE_KEY] = type(obj).__name__
+        return data
+    raise TypeError(f"Тип {type(obj).__name__} не поддерживается")
+
+
+def from_primitive(data: Any) -> Any:
+    """Restore a value produced by to_primitive"""
+    if isinstance(data, list):
+        return [from_primitive(v) for v in data]
+    if not isinstance(data, dict):
+        return data
+    kind = data[_TYPE_KEY]
+    if kind == "datetime":
+        return datetime.fromisoformat(data["value"])
+    if kind == "set":
+        return {from_primitive(v) for v in data["items"]}
+    if kind == "dict":
+        return {from_primitive(k): from_primitive(v) for k, v in data["items"]}
+    if kind == "chunks":
+        return ChunkedContent.from_source(data["pieces"], data["chunk_size"])
+    try:
+        cls = _types[kind]
+    except KeyError as e:
+        raise TypeError(f"Неизвестный тип {kind}") from e
+    state = {k: from_primitive(v) for k, v in data.items() if k != _TYPE_KEY}
+    obj = cls.__new__(cls)
+    if hasattr(obj, "__setstate__"):
+        obj.__setstate__(state)
+    else:
+        obj.__dict__.update(state)
+    return obj
+
+
+def document_to_dict(doc: Document) -> Dict[str, Any]:
+    """Convert a document with all nested entities into primitives"""
+    return to_primitive(doc)
+
+
+def document_from_dict(data: Dict[str, Any]) -> Document:
+    """Restore a document produced by document_to_dict"""
+    doc = from_primitive(data)
+    if not isinstance(doc, Document):
+        raise TypeError("Данные не содержат документ")
+    return doc
+
+
+def split_document(doc: Document) -> Tuple[Dict[str, Any], Dict[str, Any] | None]:
+    """Convert a document into header primitives and primitives of its deferred fields
+
+    The second item is None when the deferred fields have not been loaded.
+    """
+    loaded = doc.is_loaded()
+    header: Dict[str, Any] = {_TYPE_KEY: type(doc).__name__}
+    details: Dict[str, Any] = {}
+    for f in dataclasses.fields(doc):
+        if f.name in LAZY_FIELDS:
+            if loaded:
+                details[f.name] = to_primitive(getattr(doc, f.name))
+        else:
+            header[f.name] = to_primitive(getattr(doc, f.name))
+    return header, details if loaded else None
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize a value to compact JSON bytes"""
+    return json.dumps(to_primitive(obj), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(raw: bytes) -> Any:
+    """Deserialize a value produced by dumps"""
+    return from_primitive(json.loads(raw))
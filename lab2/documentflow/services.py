@@ -1,19 +1,50 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Iterable, Dict
-from .core import DocumentRepositoryProtocol, NotifierProtocol, PaymentProcessorProtocol
+import functools
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Iterable, Iterator, Dict, Tuple, TypeVar
+from .core import SearchPage, DocumentRepositoryProtocol, NotifierProtocol, PaymentProcessorProtocol
 from .documents import Document, InvoiceDocument, DocumentAttachment, DocumentRegistry
-from .exceptions import DocumentNotFoundError, AccessDeniedError, AuthFailedError
+from .exceptions import DocumentNotFoundError, AccessDeniedError, AuthFailedError, DuplicateDocumentError, VersionConflictError
 from .workflow import ApprovalRoute, ApprovalStep, WorkflowState
 from .users import User
 from .security import PasswordPolicy, Token
 from .storage import DocumentStorage
+from .cache import SearchCache
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def retry_on_conflict(attempts: int = 5, backoff: float = 0.002) -> Callable[[F], F]:
+    """Rerun a read-modify-write operation when its save hits VersionConflictError
+
+    The operation must read the document anew on every call. Retries wait
+    a randomized, exponentially growing delay; the last conflict is raised.
+    """
+    if attempts <= 0:
+        raise ValueError("attempts должен быть положительным")
+
+    def decorate(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            for attempt in range(attempts):
+                try:
+                    return fn(*args, **kwargs)
+                except VersionConflictError:
+                    if attempt == attempts - 1:
+                        raise
+                    time.sleep(random.uniform(0, backoff * 2 ** attempt))
+        return wrapper  # type: ignore[return-value]
+    return decorate
 
 @dataclass
 class InMemoryDocumentRepository(DocumentRepositoryProtocol):
     storage: DocumentStorage
-    def save(self, doc: Document) -> None:
-        self.storage.save(doc)
+    def save(self, doc: Document, expected_revision: int | None = None) -> None:
+        self.storage.save(doc, expected_revision)
+    def save_many(self, docs: Iterable[Document]) -> None:
+        self.storage.save_many(docs)
     def get(self, number: str) -> Document | None:
         try:
             return self.storage.get(number)
@@ -22,25 +53,81 @@ class InMemoryDocumentRepository(DocumentRepositoryProtocol):
     def exists(self, number: str) -> bool:
         return self.storage.exists(number)
     def search(self, query: str) -> Iterable[Document]:
-        for d in list(self.storage._docs.values()):  # type: ignore[attr-defined]
-            if query.lower() in d.title.lower() or query.lower() in d.number.lower():
-                yield d
+        return self.storage.search(query)
+    def search_words(self, query: str) -> Iterable[Document]:
+        return self.storage.search_words(query)
+    def search_substring(self, query: str) -> Iterable[Document]:
+        return self.storage.search_substring(query)
+    def search_page(self, query: str, limit: int, cursor: str | None = None, order_by: str = "number") -> SearchPage:
+        return self.storage.search_page(query, limit, cursor, order_by)
+    def search_content(self, query: str, limit: int = 10) -> List[Document]:
+        return self.storage.search_content(query, limit)
 
 @dataclass
 class ConsoleNotifier(NotifierProtocol):
     def notify(self, message: str) -> None:
         print(f"[NOTIFY] {message}")
 
+def _match_rank(query: str, doc: Document) -> int:
+    q, title, number = query.lower(), doc.title.lower(), doc.number.lower()
+    if number == q:
+        return 0
+    if number.startswith(q):
+        return 1
+    if title == q:
+        return 2
+    if title.startswith(q):
+        return 3
+    if any(word.startswith(q) for word in title.split()):
+        return 4
+    if q in number:
+        return 5
+    return 6
+
 @dataclass
 class SearchService:
     repo: DocumentRepositoryProtocol
+    cache: SearchCache | None = None
     def find(self, query: str) -> List[Document]:
-        return list(self.repo.search(query))
+        if self.cache is not None:
+            cached = self.cache.get(query)
+            if cached is not None:
+                return cached
+        docs = list(self.repo.search_substring(query))
+        docs.sort(key=lambda d: (_match_rank(query, d), len(d.title), d.number))
+        if self.cache is not None:
+            self.cache.put(query, docs)
+        return docs
+    def find_content(self, query: str, limit: int = 10) -> List[Document]:
+        return self.repo.search_content(query, limit)
+    def find_page(self, query: str, limit: int = 50, cursor: str | None = None, order_by: str = "number") -> SearchPage:
+        return self.repo.search_page(query, limit, cursor, order_by)
+    def iter_results(self, query: str, page_size: int = 100, order_by: str = "number") -> Iterator[Document]:
+        """Stream all matches page by page without building the full result list"""
+        cursor = None
+        while True:
+            page = self.repo.search_page(query, page_size, cursor, order_by)
+            yield from page.items
+            if not page.has_more():
+                return
+            cursor = page.next_cursor
 
 @dataclass
 class ValidationService:
     def validate(self, doc: Document) -> None:
         doc.validate()
+    def validate_many(self, docs: Iterable[Document]) -> Tuple[List[Document], List[Tuple[Document, Exception]]]:
+        """Validate a batch, splitting it into valid documents and failures"""
+        valid: List[Document] = []
+        failed: List[Tuple[Document, Exception]] = []
+        for doc in docs:
+            try:
+                self.validate(doc)
+            except ValueError as e:
+                failed.append((doc, e))
+            else:
+                valid.append(doc)
+        return valid, failed
 
 @dataclass
 class NotificationService:
@@ -48,6 +135,15 @@ class NotificationService:
     def send(self, message: str) -> None:
         self.notifier.notify(message)
 
+@dataclass
+class BulkRegistrationResult:
+    registered: List[str] = field(default_factory=list)
+    failed: List[Tuple[Document, Exception]] = field(default_factory=list)
+
+    def is_complete(self) -> bool:
+        """Check if every document of the batch was registered"""
+        return not self.failed
+
 @dataclass
 class DocumentService:
     repo: DocumentRepositoryProtocol
@@ -61,29 +157,61 @@ class DocumentService:
         self.repo.save(doc)
         self.notifier.send(f"Документ зарегистрирован: {doc.number}")
 
+    def register_many(self, docs: Iterable[Document]) -> BulkRegistrationResult:
+        """Register a batch of documents, collecting per-document failures"""
+        result = BulkRegistrationResult()
+        unique: List[Document] = []
+        seen: set[str] = set()
+        for doc in docs:
+            if doc.number in seen or self.registry.contains(doc.number):
+                result.failed.append((doc, DuplicateDocumentError(f"Номер {doc.number} уже существует")))
+            else:
+                seen.add(doc.number)
+                unique.append(doc)
+        valid, invalid = self.validator.validate_many(unique)
+        result.failed.extend(invalid)
+        try:
+            self.repo.save_many(valid)
+            saved = valid
+        except Exception:
+            # retry one by one to find the documents that cannot be stored;
+            # those already written by the failed batch are simply rewritten
+            saved = []
+            for doc in valid:
+                try:
+                    self.repo.save(doc)
+                    saved.append(doc)
+                except Exception as e:
+                    result.failed.append((doc, e))
+        # numbers are registered only once their documents are stored
+        self.registry.register_many(d.number for d in saved)
+        result.registered = [d.number for d in saved]
+        self.notifier.send(f"Зарегистрировано документов: {len(result.registered)}, ошибок: {len(result.failed)}")
+        return result
+
+    @retry_on_conflict()
     def add_attachment(self, number: str, att: DocumentAttachment) -> None:
-        doc = self.require(number)
-        doc.add_attachment(att)
-        self.repo.save(doc)
+        self._edit(number, lambda doc: doc.add_attachment(att))
 
+    @retry_on_conflict()
     def send_for_approval(self, number: str, route: ApprovalRoute) -> None:
-        doc = self.require(number)
-        doc.approval_route = route
-        doc.status = WorkflowState.IN_REVIEW
-        self.repo.save(doc)
+        def change(doc: Document) -> None:
+            doc.approval_route = route
+            doc.status = WorkflowState.IN_REVIEW
+        self._edit(number, change)
         self.notifier.send(f"Документ {number} отправлен на согласование")
 
+    @retry_on_conflict()
     def sign(self, number: str, user: User) -> None:
-        doc = self.require(number)
-        if user.is_blocked:
-            raise AccessDeniedError("Пользователь заблокирован")
-        doc.sign(user.id)
-        self.repo.save(doc)
+        def change(doc: Document) -> None:
+            if user.is_blocked:
+                raise AccessDeniedError("Пользователь заблокирован")
+            doc.sign(user.id)
+        self._edit(number, change)
 
+    @retry_on_conflict()
     def archive(self, number: str) -> None:
-        doc = self.require(number)
-        doc.archive()
-        self.repo.save(doc)
+        self._edit(number, lambda doc: doc.archive())
 
     def require(self, number: str) -> Document:
         doc = self.repo.get(number)
@@ -91,6 +219,18 @@ class DocumentService:
             raise DocumentNotFoundError(number)
         return doc
 
+    def _edit(self, number: str, change: Callable[[Document], None]) -> None:
+        """Apply change to a copy of a document and save it if nobody saved the document since
+
+        A change lost to a conflict never reaches the stored document, so a
+        retry applies it once; a saved copy updates the stored document.
+        """
+        doc = self.require(number)
+        revision = doc.revision
+        draft = doc.draft()
+        change(draft)
+        self.repo.save(draft, expected_revision=revision)
+
 @dataclass
 class ApprovalService:
     notifier: NotificationService
@@ -0,0 +1,395 @@
+from __future__ import annotations
+import mmap
+import os
+import struct
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+from . import serialization
+from .core import SearchPage
+from .documents import Document, DocumentAttachment, DocumentRegistry
+from .exceptions import DocumentNotFoundError
+from .indexes import FieldIndex
+from .security import QuotaManager
+from .storage import DocumentStorage, StorageLocation
+
+MAGIC = b"DFSNAP02"
+_HEADER = struct.Struct("<8sQQQQQQQQ")
+_ENTRY = struct.Struct("<QIQIQI")
+_LENGTH = struct.Struct("<I")
+
+
+def _write_items(f: Any, items: List[bytes]) -> None:
+    for item in items:
+        f.write(_LENGTH.pack(len(item)))
+        f.write(item)
+
+
+def _index_stub(doc: Document) -> Document:
+    # the document without versions, attachments and signatures: enough
+    # for every index but the full-text one
+    stub = object.__new__(type(doc))
+    stub.__dict__.update(doc.__dict__)
+    stub.__dict__.pop("_listeners", None)
+    stub.__dict__.pop("_version_store", None)
+    stub.__dict__.update(versions=[], attachments=[], signatures=[], metadata=doc.metadata)
+    stub.__dict__.pop("_loader", None)
+    return stub
+
+
+def _encode(storage: DocumentStorage, number: str) -> Tuple[bytes, bytes]:
+    if isinstance(storage, SnapshotDocumentStorage) and storage._only_in_snapshot(number):
+        assert storage.snapshot is not None
+        return storage.snapshot.raw(number)
+    doc = storage._read(number)
+    return serialization.dumps(doc), serialization.dumps(_index_stub(doc))
+
+
+def write_snapshot(path: str, storage: DocumentStorage, registry: DocumentRegistry | None = None) -> None:
+    """Write documents, registry numbers and attachment metadata to a single file
+
+    Layout: header, a fixed-width entry table sorted by number, the number
+    heap, the document bodies, index stubs of the documents (header fields
+    and metadata), then length-prefixed registry numbers and attachment
+    records. The table lets a reader binary-search a number without loading
+    anything else. Documents of a SnapshotDocumentStorage that were never
+    loaded are copied over without decoding.
+    """
+    if isinstance(storage, SnapshotDocumentStorage):
+        storage.load_attachments()
+    numbers = storage.get_all_numbers()
+    keys = [n.encode() for n in numbers]
+    encoded = [_encode(storage, n) for n in numbers]
+    bodies = [body for body, _ in encoded]
+    stubs = [stub for _, stub in encoded]
+    table_off = _HEADER.size
+    keys_off = table_off + _ENTRY.size * len(numbers)
+    bodies_off = keys_off + sum(len(k) for k in keys)
+    stubs_off = bodies_off + sum(len(b) for b in bodies)
+    registry_off = stubs_off + sum(len(s) for s in stubs)
+    registry_items = sorted(n.encode() for n in (registry.numbers if registry else ()))
+    attachments_off = registry_off + sum(_LENGTH.size + len(n) for n in registry_items)
+    attachment_items = [serialization.dumps([key, att]) for key, att in storage._attachments.items()]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(numbers), table_off, keys_off, bodies_off, registry_off,
+                             len(registry_items), attachments_off, storage.quota.used_bytes))
+        key_pos, body_pos, stub_pos = keys_off, bodies_off, stubs_off
+        for key, body, stub in zip(keys, bodies, stubs):
+            f.write(_ENTRY.pack(key_pos, len(key), body_pos, len(body), stub_pos, len(stub)))
+            key_pos += len(key)
+            body_pos += len(body)
+            stub_pos += len(stub)
+        for key in keys:
+            f.write(key)
+        for body in bodies:
+            f.write(body)
+        for stub in stubs:
+            f.write(stub)
+        _write_items(f, registry_items)
+        _write_items(f, attachment_items)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@dataclass
+class Snapshot:
+    """Read-only view of a snapshot file opened with mmap"""
+    path: str
+    _file: Any = None
+    _map: mmap.mmap | None = None
+    _count: int = 0
+    _table_off: int = 0
+    _registry_off: int = 0
+    _registry_count: int = 0
+    _attachments_off: int = 0
+    used_bytes: int = 0
+
+    def __post_init__(self) -> None:
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self._count, self._table_off, _, _, self._registry_off,
+         self._registry_count, self._attachments_off, self.used_bytes) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Файл не является снимком хранилища")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int, int, int]:
+        return _ENTRY.unpack_from(self._map, self._table_off + i * _ENTRY.size)
+
+    def _key(self, i: int) -> bytes:
+        key_off, key_len = self._entry(i)[:2]
+        return self._map[key_off:key_off + key_len]
+
+    def _find(self, number: str) -> int:
+        key = number.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self._count and self._key(lo) == key else -1
+
+    def contains(self, number: str) -> bool:
+        return self._find(number) >= 0
+
+    def load(self, number: str) -> Document | None:
+        """Decode one document, or None if the snapshot does not contain it"""
+        i = self._find(number)
+        if i < 0:
+            return None
+        _, _, body_off, body_len, _, _ = self._entry(i)
+        return serialization.loads(self._map[body_off:body_off + body_len])
+
+    def raw(self, number: str) -> Tuple[bytes, bytes]:
+        """Get the encoded body and index stub of a document the snapshot contains"""
+        _, _, body_off, body_len, stub_off, stub_len = self._entry(self._find(number))
+        return self._map[body_off:body_off + body_len], self._map[stub_off:stub_off + stub_len]
+
+    def numbers(self) -> Iterator[str]:
+        """Iterate document numbers in sorted order"""
+        for i in range(self._count):
+            yield self._key(i).decode()
+
+    def stubs(self) -> Iterator[Tuple[str, Document]]:
+        """Iterate numbers with index stubs: documents without versions, attachments and signatures"""
+        for i in range(self._count):
+            key_off, key_len, _, _, stub_off, stub_len = self._entry(i)
+            yield self._map[key_off:key_off + key_len].decode(), serialization.loads(self._map[stub_off:stub_off + stub_len])
+
+    def _items(self, offset: int, count: int | None) -> Iterator[bytes]:
+        end = len(self._map)
+        read = 0
+        while offset < end and (count is None or read < count):
+            (length,) = _LENGTH.unpack_from(self._map, offset)
+            yield self._map[offset + _LENGTH.size:offset + _LENGTH.size + length]
+            offset += _LENGTH.size + length
+            read += 1
+
+    def registry_numbers(self) -> Iterator[str]:
+        for raw in self._items(self._registry_off, self._registry_count):
+            yield raw.decode()
+
+    def attachments(self) -> Iterator[Tuple[str, DocumentAttachment]]:
+        for raw in self._items(self._attachments_off, None):
+            key, att = serialization.loads(raw)
+            yield key, att
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def restore_registry(snapshot: Snapshot) -> DocumentRegistry:
+    """Build a DocumentRegistry from the numbers stored in a snapshot"""
+    return DocumentRegistry(numbers=set(snapshot.registry_numbers()))
+
+
+@dataclass
+class SnapshotDocumentStorage(DocumentStorage):
+    """DocumentStorage that materializes documents from a snapshot on first access
+
+    Point lookups (get, exists, count_documents) touch only the requested
+    entry. The first query answered by secondary indexes (numbers, status,
+    tags, attributes, fields, title search, archive age) blocks while the
+    indexes are built from the index stubs, without decoding documents;
+    build_indexes does it up front. search_content loads every document,
+    as the full-text index needs their contents. Attachment records are
+    read on the first call that needs them.
+    """
+    snapshot: Snapshot | None = None
+    _tombstones: Set[str] = field(default_factory=set)
+    _added: Set[str] = field(default_factory=set)
+    _fully_loaded: bool = False
+    _indexed: bool = False
+    _attachments_loaded: bool = False
+
+    @classmethod
+    def restore(cls, path: str, location: StorageLocation, quota: QuotaManager) -> "SnapshotDocumentStorage":
+        """Open a snapshot file; documents and attachments stay on disk until requested"""
+        snapshot = Snapshot(path)
+        storage = cls(location=location, quota=quota, snapshot=snapshot)
+        quota.used_bytes = snapshot.used_bytes
+        return storage
+
+    def _in_snapshot(self, number: str) -> bool:
+        return self.snapshot is not None and number not in self._tombstones and self.snapshot.contains(number)
+
+    def _only_in_snapshot(self, number: str) -> bool:
+        return not self._fully_loaded and not super().exists(number) and self._in_snapshot(number)
+
+    def get(self, number: str) -> Document:
+        if number in self._docs or number in self._cold:
+            return super().get(number)
+        if not self._fully_loaded and self._in_snapshot(number):
+            assert self.snapshot is not None
+            doc = self.snapshot.load(number)
+            assert doc is not None
+            self._put(doc)
+            return doc
+        raise DocumentNotFoundError(number)
+
+    def exists(self, number: str) -> bool:
+        return super().exists(number) or (not self._fully_loaded and self._in_snapshot(number))
+
+    def save(self, doc: Document, expected_revision: int | None = None) -> None:
+        added = not self._fully_loaded and not super().exists(doc.number) and not self._in_snapshot(doc.number)
+        super().save(doc, expected_revision)
+        if added:
+            self._added.add(doc.number)
+
+    def delete(self, number: str) -> None:
+        self.load_attachments()
+        if not self._fully_loaded:
+            self._added.discard(number)
+            if self._in_snapshot(number):
+                self._tombstones.add(number)
+                if not super().exists(number):
+                    for index in self._indexes():
+                        index.remove(number)
+                    self._emit("deleted", number)
+        super().delete(number)
+
+    def count_documents(self) -> int:
+        if self._fully_loaded or self.snapshot is None:
+            return super().count_documents()
+        return len(self.snapshot) - len(self._tombstones) + len(self._added)
+
+    def clear(self) -> None:
+        self.load_attachments()
+        self._fully_loaded = True
+        super().clear()
+
+    def load_attachments(self) -> None:
+        """Read the attachment records of the snapshot"""
+        if self._attachments_loaded or self.snapshot is None:
+            return
+        self._attachments_loaded = True
+        for key, att in self.snapshot.attachments():
+            self._restore_attachment(key, att)
+
+    def build_indexes(self) -> None:
+        """Index documents still only in the snapshot from their stubs, except for full text"""
+        if self._indexed or self._fully_loaded or self.snapshot is None:
+            return
+        indexes = [index for index in self._indexes() if index is not self._fulltext]
+        for number, stub in self.snapshot.stubs():
+            if number not in self._tombstones and not super().exists(number):
+                for index in indexes:
+                    index.add(stub)
+        self._indexed = True
+
+    def get_all_numbers(self) -> List[str]:
+        self.build_indexes()
+        return super().get_all_numbers()
+
+    def numbers_in_range(self, low: str | None = None, high: str | None = None) -> List[str]:
+        self.build_indexes()
+        return super().numbers_in_range(low, high)
+
+    def numbers_with_prefix(self, prefix: str) -> List[str]:
+        self.build_indexes()
+        return super().numbers_with_prefix(prefix)
+
+    def last_number(self, prefix: str = "") -> str | None:
+        self.build_indexes()
+        return super().last_number(prefix)
+
+    def search(self, query: str) -> Iterator[Document]:
+        self.build_indexes()
+        return super().search(query)
+
+    def search_words(self, query: str) -> Iterator[Document]:
+        self.build_indexes()
+        return super().search_words(query)
+
+    def search_substring(self, query: str) -> Iterator[Document]:
+        self.build_indexes()
+        return super().search_substring(query)
+
+    def search_page(self, query: str, limit: int, cursor: str | None = None, order_by: str = "number") -> SearchPage:
+        self.build_indexes()
+        return super().search_page(query, limit, cursor, order_by)
+
+    def find_by_status(self, status: str) -> List[Document]:
+        self.build_indexes()
+        return super().find_by_status(status)
+
+    def count_by_status(self, status: str) -> int:
+        self.build_indexes()
+        return super().count_by_status(status)
+
+    def status_counts(self) -> Dict[str, int]:
+        self.build_indexes()
+        return super().status_counts()
+
+    def find_by_tags(self, tags: Iterable[str], match_all: bool = True) -> List[Document]:
+        self.build_indexes()
+        return super().find_by_tags(tags, match_all)
+
+    def find_by_attribute(self, key: str, value: str) -> List[Document]:
+        self.build_indexes()
+        return super().find_by_attribute(key, value)
+
+    def tag_facets(self, numbers: Iterable[str] | None = None) -> Dict[str, int]:
+        self.build_indexes()
+        return super().tag_facets(numbers)
+
+    def attribute_facets(self, key: str, numbers: Iterable[str] | None = None) -> Dict[str, int]:
+        self.build_indexes()
+        return super().attribute_facets(key, numbers)
+
+    def field_indexes(self) -> Dict[str, FieldIndex]:
+        self.build_indexes()
+        return super().field_indexes()
+
+    def archived_before(self, cutoff: datetime, limit: int | None = None) -> List[str]:
+        self.build_indexes()
+        return super().archived_before(cutoff, limit)
+
+    def count_archived_before(self, cutoff: datetime) -> int:
+        self.build_indexes()
+        return super().count_archived_before(cutoff)
+
+    def search_content(self, query: str, limit: int = 10) -> List[Document]:
+        self.materialize_all()
+        return super().search_content(query, limit)
+
+    def store_attachment(self, doc: Document, att: DocumentAttachment) -> None:
+        self.load_attachments()
+        super().store_attachment(doc, att)
+
+    def remove_attachment(self, doc: Document, filename: str) -> bool:
+        self.load_attachments()
+        return super().remove_attachment(doc, filename)
+
+    def attachment_refcount(self, checksum: str) -> int:
+        self.load_attachments()
+        return super().attachment_refcount(checksum)
+
+    def blob_count(self) -> int:
+        self.load_attachments()
+        return super().blob_count()
+
+    def materialize_all(self) -> None:
+        """Load every document that is still only in the snapshot"""
+        if self._fully_loaded or self.snapshot is None:
+            return
+        for number in self.snapshot.numbers():
+            if not super().exists(number) and number not in self._tombstones:
+                doc = self.snapshot.load(number)
+                assert doc is not None
+                self._put(doc)
+        self._fully_loaded = True
+
@@ -0,0 +1,255 @@
+from __future__ import annotations
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List
+from . import serialization
+from .core import DocumentRepositoryProtocol, SearchPage
+from .documents import Document
+from .exceptions import DocumentNotFoundError, VersionConflictError
+from .indexes import tokenize
+from .storage import SORT_ORDERS, decode_cursor, encode_cursor
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents ("
+    " number TEXT PRIMARY KEY, title TEXT NOT NULL, status TEXT NOT NULL,"
+    " updated_at TEXT NOT NULL, search_text TEXT NOT NULL, body BLOB NOT NULL, details BLOB,"
+    " revision INTEGER NOT NULL DEFAULT 0)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS documents_words USING fts5(text)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS documents_grams USING fts5(title, code, tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS documents_content USING fts5(content)",
+)
+_UPSERT = (
+    "INSERT INTO documents (number, title, status, updated_at, search_text, body, details, revision)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT(number) DO UPDATE SET title = excluded.title, status = excluded.status,"
+    " updated_at = excluded.updated_at, search_text = excluded.search_text, body = excluded.body,"
+    " details = excluded.details RETURNING rowid"
+)
+_UPDATE_HEADER = (
+    "UPDATE documents SET title = ?, status = ?, updated_at = ?, search_text = ?, body = ?"
+    " WHERE number = ? RETURNING rowid"
+)
+_BUMP_REVISION = "UPDATE documents SET revision = revision + 1 WHERE number = ? RETURNING revision"
+_DELETE_HEADER_FTS = (
+    "DELETE FROM documents_words WHERE rowid = ?",
+    "DELETE FROM documents_grams WHERE rowid = ?",
+)
+_DELETE_CONTENT_FTS = "DELETE FROM documents_content WHERE rowid = ?"
+_DELETE_FTS = _DELETE_HEADER_FTS + (_DELETE_CONTENT_FTS,)
+_INSERT_WORDS = "INSERT INTO documents_words (rowid, text) VALUES (?, ?)"
+_INSERT_GRAMS = "INSERT INTO documents_grams (rowid, title, code) VALUES (?, ?, ?)"
+_INSERT_CONTENT = "INSERT INTO documents_content (rowid, content) VALUES (?, ?)"
+_SELECT_BODY = "SELECT body FROM documents WHERE number = ?"
+_SELECT_DETAILS = "SELECT details FROM documents WHERE number = ?"
+_SELECT_EXISTS = "SELECT 1 FROM documents WHERE number = ?"
+_GRAM_FILTER = "rowid IN (SELECT rowid FROM documents_grams WHERE documents_grams MATCH ?)"
+_SCAN_FILTER = "instr(search_text, ?) > 0"
+
+
+def _phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+@dataclass
+class SqliteDocumentRepository(DocumentRepositoryProtocol):
+    """SQLite-backed repository with per-thread connections and FTS5 search
+
+    Documents are stored as serialized bodies next to the columns used for
+    ordering; title, number and latest version content are mirrored into
+    FTS5 tables for word, substring (trigram) and BM25 content search.
+    Substring queries shorter than a trigram fall back to a table scan.
+
+    With lazy=True documents are read with their header fields only;
+    versions, attachments, signatures and metadata are stored in a separate
+    column and fetched on first access. Saving a document whose deferred
+    fields were never loaded rewrites only the header.
+    """
+    path: str
+    batch_size: int = 500
+    lazy: bool = True
+    _local: threading.local = field(default_factory=threading.local, repr=False)
+    _connections: List[sqlite3.Connection] = field(default_factory=list, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self) -> None:
+        conn = self._connection()
+        with conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+            if "details" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN details BLOB")
+            if "revision" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run several writes in one transaction on the current thread's connection"""
+        conn = self._connection()
+        with conn:
+            yield conn
+
+    def _write_one(self, conn: sqlite3.Connection, doc: Document, expected_revision: int | None = None) -> int:
+        # bumping first takes the write lock, so the check and the write are atomic
+        row = conn.execute(_BUMP_REVISION, (doc.number,)).fetchone()
+        current = row[0] - 1 if row else 0
+        if expected_revision is not None and current != expected_revision:
+            raise VersionConflictError(
+                f"Документ {doc.number} изменён: ожидалась ревизия {expected_revision}, текущая {current}")
+        doc.revision = current + 1
+        header, details = serialization.split_document(doc)
+        columns = (doc.title, doc.status, doc.updated_at.isoformat(), f"{doc.title.lower()}\n{doc.number.lower()}",
+                   json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode())
+        if details is None:
+            row = conn.execute(_UPDATE_HEADER, columns + (doc.number,)).fetchone()
+            if row is not None:
+                return row[0]
+            doc.load_deferred()
+            header, details = serialization.split_document(doc)
+        raw_details = json.dumps(details, ensure_ascii=False, separators=(",", ":")).encode()
+        return conn.execute(_UPSERT, (doc.number,) + columns + (raw_details, doc.revision)).fetchone()[0]
+
+    def _write(self, conn: sqlite3.Connection, docs: List[Document], expected_revision: int | None = None) -> None:
+        revisions = [d.revision for d in docs]
+        try:
+            rowids = [self._write_one(conn, d, expected_revision) for d in docs]
+            for statement in _DELETE_HEADER_FTS:
+                conn.executemany(statement, [(rowid,) for rowid in rowids])
+            conn.executemany(_INSERT_WORDS, [(rowid, f"{d.title} {d.number}") for rowid, d in zip(rowids, docs)])
+            conn.executemany(_INSERT_GRAMS, [(rowid, d.title, d.number) for rowid, d in zip(rowids, docs)])
+            loaded = [(rowid, d) for rowid, d in zip(rowids, docs) if d.is_loaded()]
+            conn.executemany(_DELETE_CONTENT_FTS, [(rowid,) for rowid, _ in loaded])
+            conn.executemany(_INSERT_CONTENT, [(rowid, d.versions[-1].content) for rowid, d in loaded if d.versions])
+        except BaseException:
+            # the transaction is rolled back, and so are the revisions
+            for d, revision in zip(docs, revisions):
+                d.revision = revision
+            raise
+
+    def save(self, doc: Document, expected_revision: int | None = None) -> None:
+        """Save a document; with expected_revision, only if the stored revision still matches"""
+        with self.transaction() as conn:
+            self._write(conn, [doc], expected_revision)
+
+    def save_many(self, docs: Iterable[Document]) -> None:
+        """Save documents in transactions of batch_size"""
+        batch: List[Document] = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                with self.transaction() as conn:
+                    self._write(conn, batch)
+                batch = []
+        if batch:
+            with self.transaction() as conn:
+                self._write(conn, batch)
+
+    def _decode(self, body: bytes) -> Document:
+        doc = serialization.loads(body)
+        if "metadata" not in doc.__dict__:
+            doc.defer_loading(partial(self._load_details, doc.number))
+            if not self.lazy:
+                doc.load_deferred()
+        return doc
+
+    def _load_details(self, number: str) -> Dict[str, Any]:
+        row = self._connection().execute(_SELECT_DETAILS, (number,)).fetchone()
+        if row is None or row[0] is None:
+            raise DocumentNotFoundError(number)
+        return {name: serialization.from_primitive(value) for name, value in json.loads(row[0]).items()}
+
+    def get(self, number: str) -> Document | None:
+        row = self._connection().execute(_SELECT_BODY, (number,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def exists(self, number: str) -> bool:
+        return self._connection().execute(_SELECT_EXISTS, (number,)).fetchone() is not None
+
+    def delete(self, number: str) -> None:
+        with self.transaction() as conn:
+            row = conn.execute("DELETE FROM documents WHERE number = ? RETURNING rowid", (number,)).fetchone()
+            if row is not None:
+                for statement in _DELETE_FTS:
+                    conn.execute(statement, row)
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM documents").fetchone()[0]
+
+    def _load(self, sql: str, params: tuple) -> List[Document]:
+        return [self._decode(row[0]) for row in self._connection().execute(sql, params)]
+
+    def search(self, query: str) -> Iterable[Document]:
+        return self.search_substring(query)
+
+    def search_words(self, query: str) -> Iterable[Document]:
+        tokens = tokenize(query)
+        if not query.strip():
+            return self._load("SELECT body FROM documents ORDER BY number", ())
+        if not tokens:
+            return []
+        match = " ".join(_phrase(t) for t in tokens)
+        return self._load(
+            "SELECT body FROM documents WHERE rowid IN"
+            " (SELECT rowid FROM documents_words WHERE documents_words MATCH ?) ORDER BY number", (match,))
+
+    def _substring_filter(self, query: str) -> tuple[str, tuple]:
+        q = query.lower()
+        if not q.strip():
+            return "1", ()
+        if len(q) >= 3:
+            return _GRAM_FILTER, (_phrase(q),)
+        return _SCAN_FILTER, (q,)
+
+    def search_substring(self, query: str) -> Iterable[Document]:
+        where, params = self._substring_filter(query)
+        return self._load(f"SELECT body FROM documents WHERE {where} ORDER BY number", params)
+
+    def search_page(self, query: str, limit: int, cursor: str | None = None, order_by: str = "number") -> SearchPage:
+        if limit <= 0:
+            raise ValueError("limit должен быть положительным")
+        if order_by not in SORT_ORDERS:
+            raise ValueError(f"Неизвестный порядок сортировки: {order_by}")
+        where, params = self._substring_filter(query)
+        columns = "number" if order_by == "number" else "updated_at, number"
+        if cursor is not None:
+            after = decode_cursor(order_by, cursor)
+            where += f" AND ({columns}) > ({', '.join('?' * len(after))})"
+            params += tuple(after)
+        rows = self._connection().execute(
+            f"SELECT {columns}, body FROM documents WHERE {where} ORDER BY {columns} LIMIT ?", params + (limit + 1,)
+        ).fetchall()
+        items = [self._decode(row[-1]) for row in rows[:limit]]
+        next_cursor = encode_cursor(order_by, tuple(rows[limit - 1][:-1])) if len(rows) > limit else None
+        return SearchPage(items=items, next_cursor=next_cursor)
+
+    def search_content(self, query: str, limit: int = 10) -> List[Document]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        match = " OR ".join(_phrase(t) for t in tokens)
+        return self._load(
+            "SELECT d.body FROM documents_content c JOIN documents d ON d.rowid = c.rowid"
+            " WHERE documents_content MATCH ? ORDER BY bm25(documents_content) LIMIT ?", (match, limit))
+
+    def close(self) -> None:
+        """Close connections opened by every thread"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
@@ -1,9 +1,16 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import Dict, List
-from datetime import datetime
-from .exceptions import DocumentNotFoundError
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, List, Iterator, Set, Tuple
+from datetime import datetime, timedelta
+import base64, heapq, json, threading, time, zlib
+from itertools import islice
+from . import serialization
+from .blobs import BlobStore
+from .core import ObservableMixin, SearchPage
+from .exceptions import DocumentNotFoundError, VersionConflictError
 from .documents import Document, DocumentAttachment
+from .indexes import (ArchivedAgeIndex, DocumentIndex, FieldIndex, FullTextIndex, OrderedIndex, TokenIndex, TrigramIndex,
+                      TagIndex, StatusIndex, UpdatedAtIndex)
 from .security import QuotaManager
 
 @dataclass
@@ -21,51 +28,391 @@ class StorageLocation:
         """Get full path to file"""
         return f"{self.base_path}/{filename}"
 
+SORT_ORDERS = ("number", "updated_at")
+
+def encode_cursor(order_by: str, key: Tuple[str, ...]) -> str:
+    raw = json.dumps([order_by, list(key)], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(order_by: str, cursor: str) -> Tuple[str, ...]:
+    try:
+        cursor_order, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Некорректный курсор") from e
+    if cursor_order != order_by:
+        raise ValueError("Курсор получен для другого порядка сортировки")
+    return tuple(key)
+
+def _organization_key(doc: Document) -> str | None:
+    return doc.organization.inn if doc.organization else None
+
+def _department_key(doc: Document) -> str | None:
+    return doc.department.cost_center if doc.department else None
+
+def _author_key(doc: Document) -> str:
+    return doc.author.id
+
+def _number_key(doc: Document) -> str:
+    return doc.number
+
+def _blob_key(key: str, att: DocumentAttachment) -> str:
+    return att.checksum or key
+
+# a query whose rarest trigram is in fewer than 1/_SPARSE_RATIO of the
+# documents is paged from its sorted candidates instead of an index walk
+_SPARSE_RATIO = 16
+
 @dataclass
-class DocumentStorage:
+class TierStats:
+    """Counters of the hot (live objects) and cold (compressed) tiers"""
+    hot_documents: int = 0
+    cold_documents: int = 0
+    cold_bytes: int = 0
+    cold_raw_bytes: int = 0
+    demotions: int = 0
+    rehydrations: int = 0
+    rehydration_seconds: float = 0.0
+
+    def compression_ratio(self) -> float:
+        return self.cold_raw_bytes / self.cold_bytes if self.cold_bytes else 0.0
+
+    def average_rehydration_ms(self) -> float:
+        return self.rehydration_seconds * 1000 / self.rehydrations if self.rehydrations else 0.0
+
+@dataclass
+class DocumentStorage(ObservableMixin):
     location: StorageLocation
     quota: QuotaManager
     _docs: Dict[str, Document] = field(default_factory=dict)
+    _cold: Dict[str, Tuple[bytes, int]] = field(default_factory=dict)
+    _tier: TierStats = field(default_factory=TierStats)
     _attachments: Dict[str, DocumentAttachment] = field(default_factory=dict)
+    _attachment_keys: Dict[str, Set[str]] = field(default_factory=dict)
+    _blobs: BlobStore = field(default_factory=BlobStore)
+    _tokens: TokenIndex = field(default_factory=TokenIndex)
+    _trigrams: TrigramIndex = field(default_factory=TrigramIndex)
+    _tags: TagIndex = field(default_factory=TagIndex)
+    _statuses: StatusIndex = field(default_factory=StatusIndex)
+    _types: FieldIndex = field(default_factory=lambda: FieldIndex(type))
+    _organizations: FieldIndex = field(default_factory=lambda: FieldIndex(_organization_key))
+    _departments: FieldIndex = field(default_factory=lambda: FieldIndex(_department_key))
+    _authors: FieldIndex = field(default_factory=lambda: FieldIndex(_author_key))
+    _numbers: OrderedIndex = field(default_factory=lambda: OrderedIndex(_number_key))
+    _updated: UpdatedAtIndex = field(default_factory=UpdatedAtIndex)
+    _archived_by_age: ArchivedAgeIndex = field(default_factory=ArchivedAgeIndex)
+    _fulltext: FullTextIndex = field(default_factory=FullTextIndex)
+    _write_lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    def _indexes(self) -> List[DocumentIndex]:
+        return [self._tokens, self._trigrams, self._tags, self._numbers, self._updated, self._archived_by_age,
+                self._fulltext, self._statuses, self._types, self._organizations, self._departments, self._authors]
 
-    def save(self, doc: Document) -> None:
+    def field_indexes(self) -> Dict[str, FieldIndex]:
+        """Get equality indexes by the name of the field they cover"""
+        return {
+            "status": self._statuses,
+            "type": self._types,
+            "organization": self._organizations,
+            "department": self._departments,
+            "author": self._authors,
+        }
+
+    def _on_document_event(self, doc: Document, event: str, *args: Any) -> None:
+        if self._docs.get(doc.number) is not doc:
+            return
+        for index in self._indexes():
+            index.on_event(doc, event, *args)
+
+    def _put(self, doc: Document) -> None:
+        self._drop_cold(doc.number)
+        previous = self._docs.get(doc.number)
+        if previous is not None and previous is not doc:
+            previous.unsubscribe(self._on_document_event)
         self._docs[doc.number] = doc
+        doc.subscribe(self._on_document_event)
+        for index in self._indexes():
+            index.add(doc)
+
+    def save(self, doc: Document, expected_revision: int | None = None) -> None:
+        """Save a document; with expected_revision, only if the stored revision still matches
+
+        Raises VersionConflictError on a stale write. A document that is
+        not stored yet has revision 0. Saving a changed copy of a stored
+        document updates the stored one, so those holding it see the change.
+        """
+        with self._write_lock:
+            if expected_revision is not None:
+                current = self.get(doc.number).revision if self.exists(doc.number) else 0
+                if current != expected_revision:
+                    raise VersionConflictError(
+                        f"Документ {doc.number} изменён: ожидалась ревизия {expected_revision}, текущая {current}")
+                doc.revision = expected_revision + 1
+            else:
+                doc.revision += 1
+            stored = self._docs.get(doc.number)
+            if stored is not None and stored is not doc and stored.id == doc.id:
+                stored.update_from(doc)
+                doc = stored
+            self._put(doc)
+        self._emit("saved", doc)
+
+    def save_many(self, docs: Iterable[Document]) -> None:
+        """Save a batch of documents"""
+        for doc in docs:
+            self.save(doc)
 
     def get(self, number: str) -> Document:
-        try:
-            return self._docs[number]
-        except KeyError as e:
-            raise DocumentNotFoundError(number) from e
+        doc = self._docs.get(number)
+        if doc is not None:
+            return doc
+        if number in self._cold:
+            return self._rehydrate(number)
+        raise DocumentNotFoundError(number)
 
     def exists(self, number: str) -> bool:
-        return number in self._docs
+        return number in self._docs or number in self._cold
+
+    def demote(self, number: str) -> None:
+        """Move a document with its versions to the compressed cold tier"""
+        if number in self._cold:
+            return
+        doc = self.get(number)
+        raw = serialization.dumps(doc)
+        blob = zlib.compress(raw)
+        del self._docs[number]
+        doc.unsubscribe(self._on_document_event)
+        self._cold[number] = (blob, len(raw))
+        self._tier.cold_bytes += len(blob)
+        self._tier.cold_raw_bytes += len(raw)
+        self._tier.demotions += 1
+        self._emit("demoted", number)
+
+    def is_cold(self, number: str) -> bool:
+        return number in self._cold
+
+    def tier_stats(self) -> TierStats:
+        """Get hot/cold sizes and rehydration counters"""
+        return replace(self._tier, hot_documents=len(self._docs), cold_documents=len(self._cold))
+
+    def _read(self, number: str) -> Document:
+        # decodes a cold document without moving it back to the hot tier;
+        # scans return such copies, so changes need a document from get()
+        if number not in self._cold:
+            return self.get(number)
+        return serialization.loads(zlib.decompress(self._cold[number][0]))
+
+    def _rehydrate(self, number: str) -> Document:
+        started = time.perf_counter()
+        doc = serialization.loads(zlib.decompress(self._cold[number][0]))
+        self._drop_cold(number)
+        self._docs[number] = doc
+        doc.subscribe(self._on_document_event)
+        self._tier.rehydrations += 1
+        self._tier.rehydration_seconds += time.perf_counter() - started
+        return doc
+
+    def _drop_cold(self, number: str) -> None:
+        entry = self._cold.pop(number, None)
+        if entry is not None:
+            self._tier.cold_bytes -= len(entry[0])
+            self._tier.cold_raw_bytes -= entry[1]
 
     def store_attachment(self, doc: Document, att: DocumentAttachment) -> None:
-        if not self.quota.can_allocate(att.size):
-            self.quota.allocate(att.size)  # вызовет исключение
-        self._attachments[f"{doc.number}:{att.filename}"] = att
-        self.quota.allocate(att.size)
+        """Store an attachment; quota is charged once per unique checksum"""
+        key = f"{doc.number}:{att.filename}"
+        blob = _blob_key(key, att)
+        if blob not in self._blobs:
+            self.quota.allocate(att.size)
+        self._blobs.acquire(blob, att)
+        previous = self._attachments.get(key)
+        self._attachments[key] = att
+        self._attachment_keys.setdefault(doc.number, set()).add(key)
+        if previous is not None:
+            self._release_blob(key, previous)
+
+    def remove_attachment(self, doc: Document, filename: str) -> bool:
+        """Remove an attachment, freeing quota when no document references its blob"""
+        key = f"{doc.number}:{filename}"
+        att = self._attachments.pop(key, None)
+        if att is None:
+            return False
+        keys = self._attachment_keys[doc.number]
+        keys.discard(key)
+        if not keys:
+            del self._attachment_keys[doc.number]
+        self._release_blob(key, att)
+        return True
+
+    def attachment_refcount(self, checksum: str) -> int:
+        """Get the number of attachments sharing a blob"""
+        return self._blobs.refcount(checksum)
+
+    def blob_count(self) -> int:
+        """Get the number of unique attachment blobs"""
+        return len(self._blobs)
+
+    def _restore_attachment(self, key: str, att: DocumentAttachment) -> None:
+        # quota is restored separately by the caller
+        self._attachments[key] = att
+        self._attachment_keys.setdefault(key.split(":", 1)[0], set()).add(key)
+        self._blobs.acquire(_blob_key(key, att), att)
+
+    def _release_blob(self, key: str, att: DocumentAttachment) -> None:
+        blob = self._blobs.release(_blob_key(key, att))
+        if blob is not None:
+            self.quota.deallocate(blob.size)
+
+    def _release_attachments(self, number: str) -> None:
+        for key in self._attachment_keys.pop(number, ()):
+            self._release_blob(key, self._attachments.pop(key))
 
     def archive(self, doc: Document) -> None:
         doc.archive()
     
     def delete(self, number: str) -> None:
         """Delete document from storage"""
-        if number in self._docs:
-            del self._docs[number]
+        self._release_attachments(number)
+        if number in self._docs or number in self._cold:
+            if number in self._docs:
+                self._docs.pop(number).unsubscribe(self._on_document_event)
+            self._drop_cold(number)
+            for index in self._indexes():
+                index.remove(number)
+            self._emit("deleted", number)
     
     def count_documents(self) -> int:
         """Count total documents in storage"""
-        return len(self._docs)
+        return len(self._docs) + len(self._cold)
     
     def get_all_numbers(self) -> List[str]:
         """Get all document numbers"""
-        return list(self._docs.keys())
+        return list(self._numbers.range())
+    
+    def numbers_in_range(self, low: str | None = None, high: str | None = None) -> List[str]:
+        """Get sorted numbers between low and high inclusive"""
+        return list(self._numbers.range(low, high))
+    
+    def numbers_with_prefix(self, prefix: str) -> List[str]:
+        """Get sorted numbers of a series"""
+        return list(self._numbers.prefix(prefix))
+    
+    def last_number(self, prefix: str = "") -> str | None:
+        """Get the greatest number of a series"""
+        return self._numbers.last(prefix)
+    
+    def archived_before(self, cutoff: datetime, limit: int | None = None) -> List[str]:
+        """Get numbers of archived documents created at or before cutoff, oldest first"""
+        numbers = self._archived_by_age.range(None, cutoff)
+        return list(numbers if limit is None else islice(numbers, limit))
+    
+    def count_archived_before(self, cutoff: datetime) -> int:
+        """Count archived documents created at or before cutoff"""
+        return sum(1 for _ in self._archived_by_age.range(None, cutoff))
     
     def clear(self) -> None:
         """Clear all documents from storage"""
+        for doc in self._docs.values():
+            doc.unsubscribe(self._on_document_event)
         self._docs.clear()
+        self._cold.clear()
+        self._tier.cold_bytes = self._tier.cold_raw_bytes = 0
         self._attachments.clear()
+        self._attachment_keys.clear()
+        self.quota.deallocate(self._blobs.stored_bytes())
+        self._blobs.clear()
+        for index in self._indexes():
+            index.clear()
+        self._emit("cleared")
+    
+    def search(self, query: str) -> Iterator[Document]:
+        """Find documents whose title or number contains the query as a substring"""
+        return self.search_substring(query)
+
+    def search_words(self, query: str) -> Iterator[Document]:
+        """Find documents whose title or number contains every word of the query"""
+        if not query.strip():
+            yield from [self._read(n) for n in self.get_all_numbers()]
+            return
+        for number in sorted(self._tokens.lookup(query)):
+            yield self._read(number)
+    
+    def search_substring(self, query: str) -> Iterator[Document]:
+        """Find documents whose title or number contains the query as a substring"""
+        if not query.strip():
+            yield from [self._read(n) for n in self.get_all_numbers()]
+            return
+        for number in sorted(self._trigrams.lookup(query)):
+            yield self._read(number)
+    
+    def find_by_status(self, status: str) -> List[Document]:
+        """Find documents in the given workflow status
+
+        Like other scans, returns cold documents as detached copies without
+        rehydrating them; changes need the document from get().
+        """
+        return [self._read(n) for n in sorted(self._statuses.numbers(status))]
+    
+    def count_by_status(self, status: str) -> int:
+        """Count documents in the given workflow status"""
+        return self._statuses.count(status)
+    
+    def status_counts(self) -> Dict[str, int]:
+        """Count documents per workflow status"""
+        return self._statuses.counts()
+    
+    def find_by_tags(self, tags: Iterable[str], match_all: bool = True) -> List[Document]:
+        """Find documents having all (AND) or any (OR) of the tags"""
+        return [self._read(n) for n in sorted(self._tags.with_tags(tags, match_all))]
+    
+    def find_by_attribute(self, key: str, value: str) -> List[Document]:
+        """Find documents whose metadata attribute has the given value"""
+        return [self._read(n) for n in sorted(self._tags.with_attribute(key, value))]
+    
+    def tag_facets(self, numbers: Iterable[str] | None = None) -> Dict[str, int]:
+        """Count documents per tag, optionally within a subset of numbers"""
+        return self._tags.tag_facets(numbers)
+    
+    def attribute_facets(self, key: str, numbers: Iterable[str] | None = None) -> Dict[str, int]:
+        """Count documents per value of a metadata attribute"""
+        return self._tags.attribute_facets(key, numbers)
+    
+    def search_content(self, query: str, limit: int = 10) -> List[Document]:
+        """Find documents whose latest version content best matches the query"""
+        return [self._read(n) for n, _ in self._fulltext.search(query, limit)]
+    
+    def search_page(self, query: str, limit: int, cursor: str | None = None, order_by: str = "number") -> SearchPage:
+        """Get one page of substring search results in a stable order"""
+        if limit <= 0:
+            raise ValueError("limit должен быть положительным")
+        if order_by not in SORT_ORDERS:
+            raise ValueError(f"Неизвестный порядок сортировки: {order_by}")
+        after = decode_cursor(order_by, cursor) if cursor is not None else None
+        if order_by == "number":
+            start = (after[0], after[0]) if after is not None else None
+            page = [(n,) for _, n in self._page_entries(self._numbers, query, limit, start)]
+        else:
+            page = self._page_entries(self._updated, query, limit, after)
+        next_cursor = encode_cursor(order_by, page[limit - 1]) if len(page) > limit else None
+        return SearchPage(items=[self._read(k[-1]) for k in page[:limit]], next_cursor=next_cursor)
+
+    def _page_entries(self, index: OrderedIndex, query: str, limit: int,
+                      start: Tuple[str, ...] | None) -> List[Tuple[str, ...]]:
+        # seeks to the cursor in the ordered index and stops after limit + 1
+        # matches, so streaming all results stays linear in their count
+        entries = index.entries_after(start)
+        if not query.strip():
+            return list(islice(entries, limit + 1))
+        q = query.lower()
+        postings = self._trigrams.postings(q)
+        if postings == []:
+            return []
+        if postings and len(postings[0]) * _SPARSE_RATIO <= len(index):
+            # a rare query: sorting its few candidates beats walking the index
+            candidates = (index.entry(n) for n in self._trigrams.lookup(q))
+            return heapq.nsmallest(limit + 1, (e for e in candidates if e is not None and (start is None or e > start)))
+        rest = postings or []
+        matches = (e for e in entries if all(e[1] in p for p in rest) and self._trigrams.contains(e[1], q))
+        return list(islice(matches, limit + 1))
 
 @dataclass
 class ArchiveService:
@@ -73,17 +420,28 @@ class ArchiveService:
     archive_retention_days: int = 365
     
     def archive_document(self, number: str) -> None:
+        """Archive a document and move it to the cold tier"""
         doc = self.storage.get(number)
         self.storage.archive(doc)
+        self.storage.demote(number)
     
     def restore_document(self, number: str) -> None:
+        """Rehydrate an archived document and return it to work"""
         doc = self.storage.get(number)
         doc.restore()
     
     def get_archived_documents(self) -> List[Document]:
-        """Get all archived documents"""
+        """Get all archived documents, rehydrating cold ones so changes to them are kept
+
+        To only look at archived documents, use storage.find_by_status,
+        which leaves them in the cold tier.
+        """
         from .workflow import WorkflowState
-        return [doc for doc in self.storage._docs.values() if doc.status == WorkflowState.ARCHIVED]
+        return [self.storage.get(d.number) for d in self.storage.find_by_status(WorkflowState.ARCHIVED)]
+    
+    def retention_cutoff(self, now: datetime | None = None) -> datetime:
+        """Get the latest creation time of an archived document that can be deleted"""
+        return (now or datetime.utcnow()) - timedelta(days=self.archive_retention_days + 1)
     
     def can_delete_archived(self, doc: Document) -> bool:
         """Check if archived document can be permanently deleted"""
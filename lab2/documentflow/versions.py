@@ -0,0 +1,192 @@
+from __future__ import annotations
+import codecs
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Iterable, Iterator, List, Tuple, Union
+
+# A delta is a list of operations over the lines of its keyframe:
+# (start, end) copies keyframe lines, a str is inserted as is.
+_Op = Union[Tuple[int, int], str]
+
+
+def make_delta(base: List[str], lines: List[str]) -> List[_Op]:
+    """Describe lines as copies of base line ranges and inserted text"""
+    ops: List[_Op] = []
+    matcher = SequenceMatcher(None, base, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append((i1, i2))
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return ops
+
+
+def apply_delta(base: List[str], ops: List[_Op]) -> str:
+    return "".join(op if isinstance(op, str) else "".join(base[op[0]:op[1]]) for op in ops)
+
+
+@dataclass
+class DeltaVersionStore:
+    """Version contents kept as periodic keyframes plus deltas against them
+
+    Every keyframe_interval-th content, and any content whose delta would
+    not be smaller than the text itself, is stored in full. Other contents
+    are stored as a delta against the latest keyframe, so reading any
+    version costs one keyframe split and one delta application.
+    """
+    keyframe_interval: int = 16
+    _entries: List[Tuple[int, List[_Op] | None, str | None]] = field(default_factory=list)
+    _lengths: List[int] = field(default_factory=list)
+    _base: int = -1
+    _base_lines: List[str] = field(default_factory=list, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.keyframe_interval <= 0:
+            raise ValueError("keyframe_interval должен быть положительным")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def append(self, content: str) -> int:
+        """Store content and return its slot"""
+        slot = len(self._entries)
+        lines = content.splitlines(keepends=True)
+        if self._base >= 0 and slot - self._base < self.keyframe_interval:
+            ops = make_delta(self._base_lines, lines)
+            if sum(len(op) if isinstance(op, str) else 16 for op in ops) < len(content):
+                self._entries.append((self._base, ops, None))
+                self._lengths.append(len(content))
+                return slot
+        self._entries.append((slot, None, content))
+        self._lengths.append(len(content))
+        self._base, self._base_lines = slot, lines
+        return slot
+
+    def content(self, slot: int) -> str:
+        """Reconstruct the content of a slot"""
+        base, ops, text = self._entries[slot]
+        if ops is None:
+            assert text is not None
+            return text
+        if base == self._base:
+            return apply_delta(self._base_lines, ops)
+        keyframe = self._entries[base][2]
+        assert keyframe is not None
+        return apply_delta(keyframe.splitlines(keepends=True), ops)
+
+    def length(self, slot: int) -> int:
+        """Get the content length of a slot without reconstructing it"""
+        return self._lengths[slot]
+
+    def is_keyframe(self, slot: int) -> bool:
+        return self._entries[slot][1] is None
+
+    def stored_chars(self) -> int:
+        """Get characters held by keyframes and inserted delta text"""
+        total = 0
+        for _, ops, text in self._entries:
+            if text is not None:
+                total += len(text)
+            else:
+                assert ops is not None
+                total += sum(len(op) for op in ops if isinstance(op, str))
+        return total
+
+    def raw_chars(self) -> int:
+        """Get characters the contents would take if stored in full"""
+        return sum(self._lengths)
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _pieces(source: Any) -> Iterator[str | bytes]:
+    if isinstance(source, (str, bytes, bytearray, memoryview)):
+        # a bare buffer is one piece, not an iterable of characters or ints
+        yield source
+        return
+    read = getattr(source, "read", None)
+    if read is None:
+        yield from source
+        return
+    while True:
+        piece = read(CHUNK_SIZE)
+        if not piece:
+            return
+        yield piece
+
+
+@dataclass
+class ChunkedContent:
+    """Version content stored as fixed-size chunks of UTF-8 bytes
+
+    Built from an iterator of str/bytes pieces or a file-like object
+    without joining the input. Readers get memoryviews of the chunks or
+    decoded text pieces; only the content property joins everything.
+    """
+    chunk_size: int = CHUNK_SIZE
+    char_length: int = 0
+    _chunks: List[bytes] = field(default_factory=list, repr=False)
+
+    @classmethod
+    def from_source(cls, source: Iterable[str | bytes] | Any, chunk_size: int = CHUNK_SIZE) -> "ChunkedContent":
+        """Read bytes, an iterable of str/bytes pieces or a text/binary file-like object"""
+        if chunk_size <= 0:
+            raise ValueError("chunk_size должен быть положительным")
+        content = cls(chunk_size=chunk_size)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = bytearray()
+        for piece in _pieces(source):
+            if isinstance(piece, str):
+                content.char_length += len(piece)
+                piece = piece.encode()
+            else:
+                content.char_length += len(decoder.decode(piece))
+            buffer += piece
+            if len(buffer) >= chunk_size:
+                end = len(buffer) - len(buffer) % chunk_size
+                content._chunks.extend(bytes(buffer[i:i + chunk_size]) for i in range(0, end, chunk_size))
+                del buffer[:end]
+        decoder.decode(b"", final=True)
+        if buffer:
+            content._chunks.append(bytes(buffer))
+        return content
+
+    def __len__(self) -> int:
+        """Get the size in bytes"""
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def chunk_count(self) -> int:
+        return len(self._chunks)
+
+    def iter_bytes(self) -> Iterator[memoryview]:
+        """Iterate chunks as zero-copy memoryviews"""
+        for chunk in self._chunks:
+            yield memoryview(chunk)
+
+    def iter_text(self) -> Iterator[str]:
+        """Iterate decoded text, one piece per chunk"""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in self._chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def read(self, offset: int, size: int) -> bytes:
+        """Read size bytes starting at a byte offset"""
+        parts: List[bytes] = []
+        index, start = divmod(offset, self.chunk_size)
+        while size > 0 and index < len(self._chunks):
+            view = memoryview(self._chunks[index])[start:start + size]
+            parts.append(bytes(view))
+            size -= len(view)
+            index, start = index + 1, 0
+        return b"".join(parts)
+
+    @property
+    def content(self) -> str:
+        """Join the whole text; avoid for large bodies"""
+        return "".join(self.iter_text())
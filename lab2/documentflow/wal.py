@@ -0,0 +1,289 @@
+from __future__ import annotations
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+from . import serialization
+from .documents import Document, DocumentAttachment
+from .security import QuotaManager
+from .storage import DocumentStorage, StorageLocation
+
+_HEADER = struct.Struct("<II")
+
+
+class FsyncPolicy:
+    ALWAYS = "always"
+    GROUP = "group"
+    NEVER = "never"
+
+
+def _frame(record: List[Any]) -> bytes:
+    payload = serialization.dumps(record)
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(path: str) -> Iterator[Tuple[List[Any], int]]:
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, offset)
+        payload = data[offset + _HEADER.size:offset + _HEADER.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            return
+        offset += _HEADER.size + length
+        yield serialization.loads(payload), offset
+
+
+def read_records(path: str) -> Iterator[List[Any]]:
+    """Read framed records, stopping at the first torn or corrupt one"""
+    for record, _ in _read_frames(path):
+        yield record
+
+
+@dataclass
+class WriteAheadLog:
+    """Append-only log of storage changes
+
+    Records are buffered and written together once group_size of them
+    accumulate, max_delay seconds pass after the first of them or commit()
+    is called. ALWAYS commits every record, GROUP fsyncs each committed
+    group, NEVER leaves syncing to the OS.
+    """
+    path: str
+    fsync_policy: str = FsyncPolicy.GROUP
+    group_size: int = 64
+    max_delay: float = 0.05
+    records_written: int = 0
+    syncs: int = 0
+    _buffer: List[bytes] = field(default_factory=list)
+    _file: BinaryIO | None = None
+    _timer: threading.Timer | None = field(default=None, repr=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    def open(self) -> None:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+
+    def append(self, record: List[Any]) -> None:
+        """Buffer a record, committing the group when it is full or max_delay runs out"""
+        frame = _frame(record)
+        with self._lock:
+            self._buffer.append(frame)
+            if self.fsync_policy == FsyncPolicy.ALWAYS or len(self._buffer) >= self.group_size:
+                self.commit()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self.commit)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def commit(self) -> None:
+        """Write buffered records with a single write and sync per policy"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._buffer:
+                return
+            self.open()
+            assert self._file is not None
+            self._file.write(b"".join(self._buffer))
+            self._file.flush()
+            if self.fsync_policy != FsyncPolicy.NEVER:
+                os.fsync(self._file.fileno())
+                self.syncs += 1
+            self.records_written += len(self._buffer)
+            self._buffer.clear()
+
+    def replay(self) -> Iterator[List[Any]]:
+        """Read committed records, dropping a torn tail left by a crash"""
+        valid = 0
+        for record, valid in _read_frames(self.path):
+            yield record
+        if os.path.exists(self.path) and os.path.getsize(self.path) > valid:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+
+    def truncate(self) -> None:
+        """Drop committed records, e.g. after a checkpoint; buffered ones are written later"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, "wb"):
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            self.commit()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+@dataclass
+class RecoveryStats:
+    records: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class DurableDocumentStorage(DocumentStorage):
+    """DocumentStorage that logs every change and rebuilds itself on startup
+
+    Saving a document that is already stored and logged, or a copy of it,
+    writes an update record: its fields without versions, the numbers of
+    logged versions it still has and only the versions added since. Replay
+    restores documents with the revision they were logged with. Changes
+    are logged under the write lock, which a checkpoint holds throughout,
+    so no record falls between the checkpoint and the truncated log.
+    """
+    wal: WriteAheadLog | None = None
+    checkpoint_path: str = ""
+    last_recovery: RecoveryStats = field(default_factory=RecoveryStats)
+    _replaying: bool = False
+    _logged_versions: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def open(cls, location: StorageLocation, quota: QuotaManager, path: str,
+             fsync_policy: str = FsyncPolicy.GROUP, group_size: int = 64,
+             max_delay: float = 0.05) -> "DurableDocumentStorage":
+        """Open the log at path, replaying the last checkpoint and the log after it"""
+        wal = WriteAheadLog(path=path, fsync_policy=fsync_policy, group_size=group_size, max_delay=max_delay)
+        storage = cls(location=location, quota=quota, wal=wal, checkpoint_path=f"{path}.checkpoint")
+        storage.recover()
+        return storage
+
+    def _log(self, record: List[Any]) -> None:
+        if not self._replaying and self.wal is not None:
+            with self._write_lock:
+                self.wal.append(record)
+
+    def _remember_versions(self, doc: Document) -> None:
+        self._logged_versions[doc.number] = doc.versions[-1].number if doc.versions else 0
+
+    def _save_record(self, doc: Document, stored: bool) -> List[Any]:
+        logged = self._logged_versions.get(doc.number)
+        self._remember_versions(doc)
+        if not stored or logged is None:
+            return ["save", doc]
+        doc.load_deferred()
+        # a detached copy of the fields, so the versions can be left out
+        # without touching the document itself
+        header = object.__new__(type(doc))
+        header.__dict__.update(doc.__dict__)
+        header.__dict__.pop("_listeners", None)
+        header.__dict__["versions"] = [v for v in doc.versions if v.number > logged]
+        return ["update", header, [v.number for v in doc.versions if v.number <= logged]]
+
+    def save(self, doc: Document, expected_revision: int | None = None) -> None:
+        with self._write_lock:
+            previous = self._docs.get(doc.number)
+            # a copy of the stored document shares its logged versions
+            stored = previous is not None and (previous is doc or (previous.id, previous.created_at) == (doc.id, doc.created_at))
+            super().save(doc, expected_revision)
+            if not self._replaying and self.wal is not None:
+                self.wal.append(self._save_record(doc, stored))
+
+    def delete(self, number: str) -> None:
+        with self._write_lock:
+            if self.exists(number):
+                super().delete(number)
+                self._logged_versions.pop(number, None)
+                self._log(["delete", number])
+
+    def store_attachment(self, doc: Document, att: DocumentAttachment) -> None:
+        with self._write_lock:
+            super().store_attachment(doc, att)
+            self._log(["attachment", doc.number, att])
+
+    def remove_attachment(self, doc: Document, filename: str) -> bool:
+        with self._write_lock:
+            removed = super().remove_attachment(doc, filename)
+            if removed:
+                self._log(["remove_attachment", doc.number, filename])
+            return removed
+
+    def clear(self) -> None:
+        with self._write_lock:
+            super().clear()
+            self._logged_versions.clear()
+            self._log(["clear"])
+
+    def _on_document_event(self, doc: Document, event: str, *args: Any) -> None:
+        super()._on_document_event(doc, event, *args)
+        if event == "status" and self._docs.get(doc.number) is doc:
+            self._log(["status", doc.number, args[1]])
+
+    def _apply(self, record: List[Any]) -> None:
+        op = record[0]
+        if op in ("save", "update"):
+            doc = record[1]
+            if op == "update":
+                previous = {v.number: v for v in self._read(doc.number).versions}
+                doc.versions = [previous[n] for n in record[2]] + doc.versions
+            with self._write_lock:
+                self._put(doc)
+            self._remember_versions(doc)
+        elif op == "delete":
+            self.delete(record[1])
+        elif op == "attachment":
+            self.store_attachment(self.get(record[1]), record[2])
+        elif op == "remove_attachment":
+            self.remove_attachment(self.get(record[1]), record[2])
+        elif op == "status":
+            self.get(record[1]).status = record[2]
+        elif op == "clear":
+            self.clear()
+
+    def recover(self) -> RecoveryStats:
+        """Rebuild state from the checkpoint and the log"""
+        assert self.wal is not None
+        started = time.perf_counter()
+        records = 0
+        self._replaying = True
+        try:
+            for record in read_records(self.checkpoint_path):
+                self._apply(record)
+                records += 1
+            for record in self.wal.replay():
+                self._apply(record)
+                records += 1
+        finally:
+            self._replaying = False
+        self.wal.open()
+        self.last_recovery = RecoveryStats(records=records, seconds=time.perf_counter() - started)
+        return self.last_recovery
+
+    def checkpoint(self) -> None:
+        """Write the current state to the checkpoint file and truncate the log
+
+        Holds the write lock throughout, so changes wait for the checkpoint.
+        """
+        assert self.wal is not None
+        with self._write_lock:
+            self.wal.commit()
+            tmp_path = f"{self.checkpoint_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                for number in self.get_all_numbers():
+                    doc = self._read(number)
+                    f.write(_frame(["save", doc]))
+                    self._remember_versions(doc)
+                for key, att in self._attachments.items():
+                    number = key.split(":", 1)[0]
+                    if self.exists(number):
+                        f.write(_frame(["attachment", number, att]))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_path)
+            self.wal.truncate()
+            self.wal.open()
+
+    def close(self) -> None:
+        if self.wal is not None:
+            self.wal.close()
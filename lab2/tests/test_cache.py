@@ -0,0 +1,193 @@
+import unittest
+from documentflow.cache import CachedDocumentRepository, SearchCache, estimate_size
+from documentflow.services import InMemoryDocumentRepository, SearchService
+from documentflow.storage import StorageLocation, DocumentStorage
+from documentflow.security import QuotaManager
+from documentflow.documents import Document
+from documentflow.users import User
+from documentflow.exceptions import VersionConflictError
+
+
+class TestSearchCache(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.storage = DocumentStorage(location=StorageLocation(name="test", base_path="/tmp"), quota=QuotaManager(max_bytes=1_000_000))
+        self.cache = SearchCache(capacity=3)
+        self.cache.attach(self.storage)
+        self.search = SearchService(repo=InMemoryDocumentRepository(storage=self.storage), cache=self.cache)
+        self.storage.save(Document(id="1", number="INV-001", title="Счёт Ромашка", author=self.user))
+        self.storage.save(Document(id="2", number="CON-001", title="Договор Лютик", author=self.user))
+
+    def test_hits_and_misses(self):
+        """Test that repeated queries are served from the cache"""
+        self.assertEqual([d.number for d in self.search.find("Ромашка")], ["INV-001"])
+        self.assertEqual([d.number for d in self.search.find("ромашка")], ["INV-001"])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_write_invalidates_only_affected_queries(self):
+        """Test selective invalidation on save and delete"""
+        self.search.find("ромашка")
+        self.search.find("лютик")
+        self.search.find("inv-")
+
+        self.storage.save(Document(id="3", number="INV-002", title="Счёт Ромашка", author=self.user))
+        self.assertEqual(self.cache.stats()["size"], 1)
+        self.assertEqual([d.number for d in self.search.find("ромашка")], ["INV-001", "INV-002"])
+        self.assertEqual([d.number for d in self.search.find("inv-")], ["INV-001", "INV-002"])
+        self.assertEqual(self.cache.stats()["hits"], 0)
+        self.assertEqual(self.cache.get("лютик")[0].number, "CON-001")
+
+        self.storage.delete("CON-001")
+        self.assertIsNone(self.cache.get("лютик"))
+        self.assertIsNotNone(self.cache.get("ромашка"))
+
+    def test_renamed_document_leaves_old_query(self):
+        """Test that a document dropping out of a result invalidates that result"""
+        self.search.find("лютик")
+        doc = self.storage.get("CON-001")
+        doc.title = "Договор"
+        self.storage.save(doc)
+        self.assertEqual(self.search.find("лютик"), [])
+
+    def test_blank_queries_share_one_entry(self):
+        """Test that whitespace queries are invalidated by any save"""
+        self.assertEqual(len(self.search.find(" ")), 2)
+        self.assertEqual(len(self.search.find("")), 2)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.storage.save(Document(id="3", number="INV-002", title="Nospace", author=self.user))
+        self.assertEqual(len(self.search.find("  ")), 3)
+
+    def test_short_queries_and_clear(self):
+        """Test invalidation of short queries and full clear"""
+        self.search.find("ё")
+        self.storage.save(Document(id="3", number="N-3", title="Ёж", author=self.user))
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+        self.search.find("ё")
+        self.storage.clear()
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used query is evicted"""
+        for query in ("a", "b", "c"):
+            self.search.find(query)
+        self.search.find("a")
+        self.search.find("d")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+
+
+class CountingRepository(InMemoryDocumentRepository):
+    gets = 0
+
+    def get(self, number):
+        self.gets += 1
+        return super().get(number)
+
+
+class TestCachedDocumentRepository(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        storage = DocumentStorage(location=StorageLocation(name="test", base_path="/tmp"), quota=QuotaManager(max_bytes=1_000_000))
+        self.backend = CountingRepository(storage=storage)
+        self.now = 0.0
+        self.repo = CachedDocumentRepository(repo=self.backend, clock=lambda: self.now)
+
+    def make(self, number: str, content: str = "") -> Document:
+        doc = Document(id=number, number=number, title="Договор", author=self.user)
+        if content:
+            doc.add_version(content, "u1")
+        return doc
+
+    def test_read_and_write_through(self):
+        """Test that saved and fetched documents are served from the cache"""
+        self.repo.save(self.make("DOC-1"))
+        self.backend.save(self.make("DOC-2"))
+        self.repo.get("DOC-1")
+        self.repo.get("DOC-2")
+        self.repo.get("DOC-2")
+        self.assertEqual(self.backend.gets, 1)
+        stats = self.repo.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertAlmostEqual(stats["hit_ratio"], 2 / 3)
+
+    def test_negative_cache_expires(self):
+        """Test that misses are remembered only for negative_ttl"""
+        self.assertIsNone(self.repo.get("DOC-9"))
+        self.assertIsNone(self.repo.get("DOC-9"))
+        self.assertFalse(self.repo.exists("DOC-9"))
+        self.assertEqual(self.backend.gets, 1)
+        self.backend.save(self.make("DOC-9"))
+        self.now += 10
+        self.assertIsNotNone(self.repo.get("DOC-9"))
+        self.assertEqual(self.repo.stats()["negative_hits"], 1)
+
+        self.repo.get("DOC-8")
+        self.repo.save(self.make("DOC-8"))
+        self.assertIsNotNone(self.repo.get("DOC-8"))
+
+    def test_byte_bounded_eviction(self):
+        """Test that least recently used documents are evicted by size"""
+        size = estimate_size(self.make("DOC-1", "x" * 1000))
+        self.repo.max_bytes = size * 2
+        for number in ("DOC-1", "DOC-2"):
+            self.repo.save(self.make(number, "x" * 1000))
+        self.repo.get("DOC-1")
+        self.repo.save(self.make("DOC-3", "x" * 1000))
+        self.assertEqual(self.repo.stats()["evictions"], 1)
+        self.assertEqual(self.repo.stats()["bytes"], size * 2)
+        self.repo.get("DOC-1")
+        self.assertEqual(self.backend.gets, 0)
+        self.repo.get("DOC-2")
+        self.assertEqual(self.backend.gets, 1)
+
+        self.repo.save(self.make("BIG", "x" * size * 3))
+        self.assertNotIn("BIG", self.repo._entries)
+
+    def test_size_of_deferred_document(self):
+        """Test that estimating a lazy document does not load it"""
+        doc = self.make("DOC-1", "x" * 1000)
+        doc.defer_loading(lambda: {})
+        self.assertLess(estimate_size(doc), 2000)
+        self.assertFalse(doc.is_loaded())
+
+    def test_deferred_document_is_measured_when_loaded(self):
+        """Test that loading a cached lazy document counts its full size against max_bytes"""
+        full = self.make("DOC-1", "x" * 5000)
+        self.repo.max_bytes = estimate_size(full) + 2000
+        docs = {}
+        for number in ("DOC-1", "DOC-2"):
+            loaded = self.make(number, "x" * 5000)
+            doc = self.make(number)
+            for name in ("versions", "attachments", "signatures", "metadata"):
+                del doc.__dict__[name]
+            doc.defer_loading(lambda loaded=loaded: {name: getattr(loaded, name) for name in
+                                                     ("versions", "attachments", "signatures", "metadata")})
+            docs[number] = doc
+        self.backend.get = docs.get
+        self.repo.get("DOC-1")
+        self.repo.get("DOC-2")
+        self.assertEqual(len(self.repo._entries), 2)
+
+        docs["DOC-1"].load_deferred()
+        self.assertEqual(self.repo.stats()["bytes"], estimate_size(docs["DOC-1"]) + estimate_size(docs["DOC-2"]))
+        docs["DOC-2"].load_deferred()
+        self.assertEqual(list(self.repo._entries), ["DOC-2"])
+        self.assertEqual(self.repo.stats()["bytes"], estimate_size(docs["DOC-2"]))
+        self.assertEqual(self.repo.stats()["evictions"], 1)
+
+    def test_conflict_invalidates_entry(self):
+        """Test that a rejected stale write drops the cached copy"""
+        self.repo.save(self.make("DOC-1"))
+        self.backend.save(self.make("DOC-1"), expected_revision=1)
+        with self.assertRaises(VersionConflictError):
+            self.repo.save(self.repo.get("DOC-1"), expected_revision=1)
+        self.assertEqual(self.repo.get("DOC-1").revision, 2)
+        self.assertEqual(self.backend.gets, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from datetime import datetime
+from documentflow import codec, serialization
+from documentflow.codec import ReferenceResolver, decode, encode
+from documentflow.documents import (
+    ContractDocument, Document, DocumentAttachment, IncomingDocument, InvoiceDocument, OrderDocument,
+)
+from documentflow.users import Department, Organization, User
+from documentflow.workflow import ApprovalRoute, ApprovalStep, WorkflowState
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.org = Organization(name="ООО Ромашка", inn="7700000001")
+        self.dept = Department(name="Бухгалтерия", cost_center="CC-1")
+        self.resolver = ReferenceResolver(users={"u1": self.user}, organizations={self.org.inn: self.org},
+                                          departments={"CC-1": self.dept})
+
+    def make_contract(self) -> ContractDocument:
+        doc = ContractDocument(id="c1", number="CON-001", title="Договор поставки", author=self.user,
+                               organization=self.org, department=self.dept,
+                               effective_from=datetime(2024, 1, 1), total_amount=1_500_000)
+        doc.add_version("Первая редакция", "u1")
+        doc.add_version("Вторая редакция", "u2")
+        doc.add_attachment(DocumentAttachment(filename="scan.pdf", content_type="application/pdf", size=2048, checksum="sha"))
+        doc.approval_route = ApprovalRoute(name="Договоры", steps=[ApprovalStep(name="Юрист", role_name="lawyer", order=1)])
+        doc.metadata.add_tag("поставка")
+        doc.metadata.set_attribute("region", "77")
+        doc.lock("u1")
+        doc.sign("u1")
+        return doc
+
+    def test_round_trip(self):
+        """Test that a document with nested entities survives encode/decode"""
+        doc = self.make_contract()
+        restored = decode(encode(doc), self.resolver)
+        self.assertIsInstance(restored, ContractDocument)
+        self.assertEqual(restored, doc)
+        self.assertIs(restored.author, self.user)
+        self.assertIs(restored.organization, self.org)
+        self.assertIsNone(restored.effective_to)
+        self.assertTrue(restored.metadata.has_tag("поставка"))
+
+    def test_subclasses(self):
+        """Test every registered document type"""
+        docs = [
+            Document(id="1", number="D-1", title="Документ", author=self.user),
+            IncomingDocument(id="2", number="IN-1", title="Письмо", author=self.user, sender="ФНС"),
+            InvoiceDocument(id="3", number="INV-1", title="Счёт", author=self.user, amount_due=-5, paid=True),
+            OrderDocument(id="4", number="ORD-1", title="Приказ", author=self.user, items=["a", "б"]),
+        ]
+        for doc in docs:
+            self.assertEqual(decode(encode(doc), self.resolver), doc)
+
+    def test_references_are_ids(self):
+        """Test that users are stored by ID and resolved on decode"""
+        raw = encode(self.make_contract())
+        self.assertNotIn(b"Test User", raw)
+        restored = decode(raw)
+        self.assertEqual(restored.author.id, "u1")
+        self.assertEqual(restored.organization.inn, "7700000001")
+        self.assertLess(len(raw), len(serialization.dumps(self.make_contract())))
+
+    def test_metadata_events_after_decode(self):
+        """Test that a decoded document relays metadata events"""
+        restored = decode(encode(self.make_contract()))
+        events = []
+        restored.subscribe(lambda source, event, *args: events.append(event))
+        restored.metadata.add_tag("новый")
+        restored.status = WorkflowState.APPROVED
+        self.assertEqual(events, ["tag_added", "status"])
+
+    def test_revision(self):
+        """Test that the revision is encoded and schema 1 data decodes with revision 0"""
+        doc = Document(id="1", number="D-1", title="Документ", author=self.user, revision=7)
+        raw = encode(doc)
+        self.assertEqual(decode(raw).revision, 7)
+        old = bytearray(raw[:-16])
+        old[0] = 1
+        self.assertEqual(decode(bytes(old)).revision, 0)
+
+    def test_invalid_input(self):
+        """Test schema version and type checks"""
+        raw = bytearray(encode(Document(id="1", number="D-1", title="Документ", author=self.user)))
+        raw[0] = codec.SCHEMA_VERSION + 1
+        with self.assertRaises(ValueError):
+            decode(bytes(raw))
+        raw[0], raw[1] = codec.SCHEMA_VERSION, 99
+        with self.assertRaises(ValueError):
+            decode(bytes(raw))
+
+        class Memo(Document):
+            pass
+
+        with self.assertRaises(TypeError):
+            encode(Memo(id="1", number="M-1", title="Записка", author=self.user))
+        with self.assertRaises(ValueError):
+            codec.register_document_type(1, Memo)
+
+
+if __name__ == "__main__":
+    unittest.main()
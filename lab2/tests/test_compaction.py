@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from documentflow.compaction import KeepAnnotated, KeepLastN, ThinByAge, VersionCompactor, compact_document
+from documentflow.storage import StorageLocation, DocumentStorage
+from documentflow.security import QuotaManager
+from documentflow.documents import Document, Signature
+from documentflow.users import User
+from documentflow.exceptions import VersionConflictError
+from documentflow.wal import DurableDocumentStorage
+
+
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.now = datetime(2025, 1, 1)
+        self.doc = self.make("CON-001")
+
+    def make(self, number: str) -> Document:
+        """Create a document with 20 hourly autosaves ending 19 hours before now"""
+        doc = Document(id=number, number=number, title="Договор", author=self.user)
+        for i in range(20):
+            v = doc.add_version(f"Редакция {i}\n" * 50, "u1")
+            v.created_at = self.now - timedelta(hours=38 - i)
+        return doc
+
+    def numbers(self) -> list:
+        return [v.number for v in self.doc.versions]
+
+    def test_keep_last_n(self):
+        """Test that only the last N versions survive and keep their numbers"""
+        report = compact_document(self.doc, [KeepLastN(3)], self.now)
+        self.assertEqual(self.numbers(), [18, 19, 20])
+        self.assertEqual(report.versions_removed, 17)
+        self.assertGreater(report.reclaimed_bytes, 0)
+        self.assertEqual(self.doc.add_version("новая", "u1").number, 21)
+        self.assertEqual(self.doc.get_version(19).content, "Редакция 18\n" * 50)
+
+    def test_keep_annotated(self):
+        """Test that commented and signed versions survive"""
+        self.doc.versions[4].comment = "Согласовано юристом"
+        self.doc.signatures.append(Signature(user_id="u1", signed_at=self.now - timedelta(hours=30, minutes=30), certificate_id="c1"))
+        compact_document(self.doc, [KeepLastN(1), KeepAnnotated()], self.now)
+        self.assertEqual(self.numbers(), [5, 8, 20])
+
+    def test_thin_by_age(self):
+        """Test that old versions are thinned to one per period"""
+        compact_document(self.doc, [ThinByAge(older_than=timedelta(hours=24), period=timedelta(hours=5))], self.now)
+        self.assertEqual(self.numbers(), [5, 10, 15, 16, 17, 18, 19, 20])
+
+    def test_delta_versions_are_reencoded(self):
+        """Test that pruning keyframes keeps remaining delta-encoded contents"""
+        self.doc.use_delta_versions(keyframe_interval=4)
+        compact_document(self.doc, [KeepLastN(2)], self.now)
+        self.assertEqual([v.content for v in self.doc.versions], ["Редакция 18\n" * 50, "Редакция 19\n" * 50])
+        self.assertEqual(len(self.doc.__dict__["_version_store"]), 2)
+
+    def test_storage_wide_run(self):
+        """Test that the compactor processes hot documents and skips cold ones"""
+        storage = DocumentStorage(location=StorageLocation(name="test", base_path="/tmp"), quota=QuotaManager(max_bytes=1_000_000))
+        storage.save(self.doc)
+        storage.save(self.make("CON-002"))
+        storage.demote("CON-002")
+        compactor = VersionCompactor(policies=[KeepLastN(5)], storage=storage, pause=0, clock=lambda: self.now)
+        report = compactor.run_once()
+        self.assertEqual((report.documents, report.compacted, report.versions_removed), (1, 1, 15))
+        self.assertEqual(len(storage.get("CON-002").versions), 20)
+
+    def test_storage_run_is_saved_and_logged(self):
+        """Test that compacting a stored document bumps its revision and survives a restart"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "docs.wal")
+            location = StorageLocation(name="test", base_path=tmp)
+            storage = DurableDocumentStorage.open(location, QuotaManager(max_bytes=1_000_000), path)
+            storage.save(self.doc)
+            stale = self.doc.draft()
+            compactor = VersionCompactor(policies=[KeepLastN(1)], storage=storage, pause=0, clock=lambda: self.now)
+            self.assertEqual(compactor.run_once().versions_removed, 19)
+            self.assertIs(storage.get("CON-001"), self.doc)
+            self.assertEqual((self.numbers(), self.doc.revision), ([20], 2))
+            with self.assertRaises(VersionConflictError):
+                storage.save(stale, expected_revision=stale.revision)
+            storage.close()
+
+            recovered = DurableDocumentStorage.open(location, QuotaManager(max_bytes=1_000_000), path)
+            self.assertEqual([v.number for v in recovered.get("CON-001").versions], [20])
+            recovered.close()
+
+    def test_background_submit(self):
+        """Test that a submitted document is compacted by the background thread"""
+        compactor = VersionCompactor(policies=[KeepLastN(2)], clock=lambda: self.now)
+        compactor.start(interval=60)
+        try:
+            compactor.submit(self.doc)
+            for _ in range(200):
+                if len(self.doc.versions) == 2:
+                    break
+                compactor._stop.wait(0.01)
+        finally:
+            compactor.stop()
+        self.assertEqual(self.numbers(), [19, 20])
+        self.assertGreater(compactor.total_reclaimed, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from documentflow.diffs import DiffCache, diff_contents
+from documentflow.documents import Document
+from documentflow.users import User
+
+
+def contract(changed: str = "") -> str:
+    lines = [f"Пункт {i}. Стороны договорились о поставке партии {i}.\n" for i in range(100)]
+    if changed:
+        lines[50] = changed
+    return "".join(lines)
+
+
+class TestDiffContents(unittest.TestCase):
+    def test_line_diff(self):
+        """Test that a changed line is reported as one replace run"""
+        ops = diff_contents(contract(), contract("Пункт 50. Поставка отменена.\n"))
+        changes = [op for op in ops if op.tag != "equal"]
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].tag, "replace")
+        self.assertEqual(changes[0].new, "Пункт 50. Поставка отменена.\n")
+        self.assertEqual("".join(op.new for op in ops), contract("Пункт 50. Поставка отменена.\n"))
+
+    def test_word_diff(self):
+        """Test that word mode narrows changed lines down to words"""
+        new = contract("Пункт 50. Стороны договорились о возврате партии 50.\n")
+        ops = diff_contents(contract(), new, mode="word")
+        self.assertEqual([(op.tag, op.old, op.new) for op in ops if op.tag != "equal"], [("replace", "поставке", "возврате")])
+        self.assertEqual("".join(op.old for op in ops), contract())
+
+    def test_unknown_mode(self):
+        """Test that an unknown mode is rejected"""
+        with self.assertRaises(ValueError):
+            diff_contents("a", "b", mode="char")
+
+
+class TestDocumentDiff(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.doc = Document(id="d1", number="CON-001", title="Договор", author=self.user)
+        self.doc.add_version(contract(), "u1")
+        self.doc.add_version(contract("Пункт 50. Новая редакция.\n"), "u1")
+        self.cache = DiffCache(capacity=2)
+
+    def test_diff_is_cached(self):
+        """Test that repeated diffs come from the cache"""
+        first = self.doc.diff(1, 2, cache=self.cache)
+        self.assertIs(self.doc.diff(1, 2, cache=self.cache), first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(first.added(), 1)
+        self.assertEqual(first.removed(), 1)
+        self.assertTrue(self.doc.diff(2, 2, cache=self.cache).is_empty())
+
+    def test_cache_is_bounded(self):
+        """Test that the least recently used diff is evicted"""
+        self.doc.add_version(contract("Пункт 50. Третья редакция.\n"), "u1")
+        self.doc.diff(1, 2, cache=self.cache)
+        self.doc.diff(2, 3, cache=self.cache)
+        self.doc.diff(1, 3, cache=self.cache)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_replaced_versions_are_not_served(self):
+        """Test that a document with the same id but other versions misses the cache"""
+        self.doc.diff(1, 2, cache=self.cache)
+        other = Document(id="d1", number="CON-001", title="Договор", author=self.user)
+        other.add_version("а\n", "u1")
+        other.add_version("б\n", "u1")
+        diff = other.diff(1, 2, cache=self.cache)
+        self.assertEqual([(op.old, op.new) for op in diff.changes()], [("а\n", "б\n")])
+
+    def test_missing_version(self):
+        """Test that an unknown version number is rejected"""
+        with self.assertRaises(ValueError):
+            self.doc.diff(1, 5, cache=self.cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
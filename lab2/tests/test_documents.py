@@ -85,6 +85,41 @@ class TestDocuments(unittest.TestCase):
         metadata.remove_tag("not_present")
         self.assertEqual(len(metadata.tags), 1)
     
+    def test_document_metadata_events(self):
+        """Test that metadata changes are relayed through the document"""
+        doc = IncomingDocument(id="9", number="Z", title="Doc", author=self.user)
+        events = []
+        doc.subscribe(lambda source, event, *args: events.append((source.number, event) + args))
+        
+        doc.metadata.add_tag("urgent")
+        doc.metadata.add_tag("urgent")
+        doc.metadata.set_attribute("region", "north")
+        doc.metadata.remove_attribute("region")
+        doc.metadata.remove_tag("urgent")
+        doc.metadata = DocumentMetadata(tags=["x"])
+        self.assertTrue(doc.metadata.has_tag("x"))
+        
+        self.assertEqual(events, [
+            ("Z", "tag_added", "urgent"),
+            ("Z", "attribute_set", "region", None, "north"),
+            ("Z", "attribute_removed", "region", "north"),
+            ("Z", "tag_removed", "urgent"),
+            ("Z", "metadata_replaced"),
+        ])
+    
+    def test_only_status_and_metadata_are_observed(self):
+        """Test that plain field writes emit nothing and new metadata is relayed"""
+        doc = IncomingDocument(id="9", number="Z", title="Doc", author=self.user)
+        doc.metadata = DocumentMetadata()
+        events = []
+        doc.subscribe(lambda source, event, *args: events.append(event))
+        doc.title = "Другое"
+        doc.status = doc.status
+        doc.metadata = DocumentMetadata()
+        doc.metadata.add_tag("x")
+        self.assertEqual(events, ["metadata_replaced", "tag_added"])
+        self.assertNotIn("__setattr__", vars(Document))
+
     def test_document_attachment_methods(self):
         """Test document attachment methods"""
         # Test image attachment
@@ -320,5 +355,29 @@ class TestDocuments(unittest.TestCase):
         with self.assertRaises(ValueError):
             contract.validate()
 
+    def test_deferred_loading(self):
+        """Test that deferred fields are loaded once on first access"""
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return {"versions": [], "attachments": [], "signatures": [], "metadata": DocumentMetadata(tags=["a"])}
+
+        doc = Document.__new__(Document)
+        doc.__setstate__({"id": "d1", "number": "DOC-001", "title": "Lazy", "author": self.user, "status": WorkflowState.NEW})
+        doc.defer_loading(loader)
+        self.assertEqual(doc.title, "Lazy")
+        self.assertEqual(calls, [])
+        self.assertTrue(doc.metadata.has_tag("a"))
+        self.assertEqual(doc.versions, [])
+        self.assertEqual(calls, [1])
+        events = []
+        doc.subscribe(lambda source, event, *args: events.append(event))
+        doc.metadata.add_tag("b")
+        self.assertEqual(events, ["tag_added"])
+        with self.assertRaises(AttributeError):
+            doc.missing
+
+
 if __name__ == "__main__":
     unittest.main()
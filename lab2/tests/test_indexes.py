@@ -0,0 +1,227 @@
+import unittest
+from documentflow.indexes import FullTextIndex, OrderedIndex, TokenIndex, TrigramIndex, TagIndex, StatusIndex, tokenize, trigrams
+from documentflow.documents import Document
+from documentflow.users import User
+from documentflow.workflow import WorkflowState
+
+
+class TestIndexes(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+
+    def make_doc(self, number: str, title: str) -> Document:
+        return Document(id=number, number=number, title=title, author=self.user)
+
+    def test_tokenize(self):
+        """Test splitting text into lowercase tokens"""
+        self.assertEqual(tokenize("Счёт на оплату INV-001"), ["счёт", "на", "оплату", "inv", "001"])
+        self.assertEqual(tokenize("  -- "), [])
+
+    def test_token_index_lookup(self):
+        """Test looking up documents by title and number tokens"""
+        index = TokenIndex()
+        index.add(self.make_doc("IN-001", "Письмо от поставщика"))
+        index.add(self.make_doc("INV-001", "Счёт поставщика"))
+
+        self.assertEqual(index.lookup("поставщика"), {"IN-001", "INV-001"})
+        self.assertEqual(index.lookup("Письмо поставщика"), {"IN-001"})
+        self.assertEqual(index.lookup("inv"), {"INV-001"})
+        self.assertEqual(index.lookup("001"), {"IN-001", "INV-001"})
+        self.assertEqual(index.lookup("договор"), set())
+        self.assertEqual(index.lookup(""), set())
+
+    def test_token_index_reindex_and_remove(self):
+        """Test that re-adding a document replaces its old tokens"""
+        index = TokenIndex()
+        doc = self.make_doc("IN-001", "Письмо")
+        index.add(doc)
+        doc.title = "Договор"
+        index.add(doc)
+        self.assertEqual(index.lookup("письмо"), set())
+        self.assertEqual(index.lookup("договор"), {"IN-001"})
+
+        index.remove("IN-001")
+        self.assertEqual(index.lookup("договор"), set())
+        self.assertEqual(index.token_count(), 0)
+
+
+    def test_trigrams(self):
+        """Test padded trigram extraction"""
+        self.assertEqual(trigrams("Ab"), {"\x02ab", "ab\x03"})
+        self.assertEqual(trigrams("A"), {"\x02a\x03"})
+
+    def test_trigram_index_substring_lookup(self):
+        """Test substring lookup with candidate verification"""
+        index = TrigramIndex()
+        index.add(self.make_doc("INV-001", "Счёт поставщика"))
+        index.add(self.make_doc("INV-102", "Акт сверки"))
+        index.add(self.make_doc("IN-001", "Письмо"))
+
+        self.assertEqual(index.lookup("INV-00"), {"INV-001"})
+        self.assertEqual(index.lookup("inv"), {"INV-001", "INV-102"})
+        self.assertEqual(index.lookup("ставщ"), {"INV-001"})
+        self.assertEqual(index.lookup("01"), {"INV-001", "IN-001"})
+        self.assertEqual(index.lookup("ь"), {"IN-001"})
+        self.assertEqual(index.lookup("xyz"), set())
+
+    def test_trigram_index_verifies_candidates(self):
+        """Test that documents sharing all trigrams but not the substring are dropped"""
+        index = TrigramIndex()
+        index.add(self.make_doc("N-1", "abcd bcde"))
+        self.assertIn("N-1", index.candidates("abcde"))
+        self.assertEqual(index.lookup("abcde"), set())
+
+        index.remove("N-1")
+        self.assertEqual(index.candidates("abc"), set())
+
+
+    def test_tag_index_queries_and_facets(self):
+        """Test AND/OR tag queries, attribute lookup and facet counts"""
+        index = TagIndex()
+        a = self.make_doc("A", "a")
+        a.metadata.add_tag("urgent")
+        a.metadata.add_tag("finance")
+        a.metadata.set_attribute("region", "north")
+        b = self.make_doc("B", "b")
+        b.metadata.add_tag("finance")
+        b.metadata.set_attribute("region", "south")
+        index.add(a)
+        index.add(b)
+
+        self.assertEqual(index.with_tags(["finance", "urgent"]), {"A"})
+        self.assertEqual(index.with_tags(["urgent", "finance"], match_all=False), {"A", "B"})
+        self.assertEqual(index.with_tags(["missing", "finance"]), set())
+        self.assertEqual(index.with_tags([]), set())
+        self.assertEqual(index.with_attribute("region", "south"), {"B"})
+        self.assertEqual(index.tag_facets(), {"urgent": 1, "finance": 2})
+        self.assertEqual(index.tag_facets(["B"]), {"finance": 1})
+        self.assertEqual(index.attribute_facets("region"), {"north": 1, "south": 1})
+
+    def test_tag_index_follows_metadata_events(self):
+        """Test that metadata events keep the tag index consistent"""
+        index = TagIndex()
+        doc = self.make_doc("A", "a")
+        index.add(doc)
+        doc.subscribe(lambda d, event, *args: index.on_event(d, event, *args))
+
+        doc.metadata.add_tag("urgent")
+        doc.metadata.set_attribute("region", "north")
+        self.assertEqual(index.with_tags(["urgent"]), {"A"})
+        doc.metadata.set_attribute("region", "south")
+        self.assertEqual(index.with_attribute("region", "north"), set())
+        self.assertEqual(index.with_attribute("region", "south"), {"A"})
+
+        doc.metadata.remove_tag("urgent")
+        doc.metadata.remove_attribute("region")
+        self.assertEqual(index.tag_facets(), {})
+        self.assertEqual(index.attribute_facets("region"), {})
+
+
+    def test_status_index_transitions(self):
+        """Test that status transitions move documents between buckets"""
+        index = StatusIndex()
+        doc = self.make_doc("A", "a")
+        other = self.make_doc("B", "b")
+        index.add(doc)
+        index.add(other)
+        doc.subscribe(lambda d, event, *args: index.on_event(d, event, *args))
+        self.assertEqual(index.count(WorkflowState.NEW), 2)
+
+        doc.approve()
+        doc.archive()
+        self.assertEqual(index.numbers(WorkflowState.ARCHIVED), {"A"})
+        self.assertEqual(index.counts(), {WorkflowState.NEW: 1, WorkflowState.ARCHIVED: 1})
+
+        doc.restore()
+        self.assertEqual(index.count(WorkflowState.ARCHIVED), 0)
+        index.remove("A")
+        self.assertEqual(index.counts(), {WorkflowState.NEW: 1})
+
+
+    def test_ordered_index_range_prefix_and_last(self):
+        """Test range, prefix and last-in-series scans across chunk splits"""
+        index = OrderedIndex(key=lambda d: d.number, load=2)
+        numbers = [f"IN-{i:03d}" for i in range(20)] + ["INV-2024-000123", "INV-2024-000124", "OUT-1"]
+        for number in reversed(numbers):
+            index.add(self.make_doc(number, "t"))
+        self.assertEqual(len(index), 23)
+        self.assertEqual(list(index.range()), sorted(numbers))
+
+        self.assertEqual(list(index.range("IN-005", "IN-008")), ["IN-005", "IN-006", "IN-007", "IN-008"])
+        self.assertEqual(list(index.range("IN-0185", None))[:2], ["IN-019", "INV-2024-000123"])
+        self.assertEqual(list(index.prefix("INV-2024")), ["INV-2024-000123", "INV-2024-000124"])
+        self.assertEqual(list(index.prefix("X")), [])
+        self.assertEqual(index.last("IN-"), "IN-019")
+        self.assertEqual(index.last("INV-2024-"), "INV-2024-000124")
+        self.assertEqual(index.last(), "OUT-1")
+        self.assertIsNone(index.last("A"))
+        self.assertIsNone(index.last("Z"))
+
+        for number in numbers[:19]:
+            index.remove(number)
+        self.assertEqual(list(index.range()), ["IN-019", "INV-2024-000123", "INV-2024-000124", "OUT-1"])
+        index.clear()
+        self.assertIsNone(index.last())
+        self.assertEqual(list(index.range()), [])
+
+
+    def test_fulltext_index_bm25_ranking(self):
+        """Test BM25 ranking and incremental version replacement"""
+        index = FullTextIndex()
+        a = self.make_doc("A", "a")
+        a.add_version("поставка товара поставка", "u1")
+        b = self.make_doc("B", "b")
+        b.add_version("поставка услуг и оплата в течение тридцати дней", "u1")
+        c = self.make_doc("C", "c")
+        for doc in (a, b, c):
+            index.add(doc)
+            doc.subscribe(lambda d, event, *args: index.on_event(d, event, *args))
+
+        self.assertEqual([n for n, _ in index.search("поставка")], ["A", "B"])
+        self.assertEqual([n for n, _ in index.search("оплата поставка", limit=1)], ["B"])
+        self.assertEqual(index.search("договор"), [])
+
+        a.add_version("расторжение", "u1")
+        self.assertEqual([n for n, _ in index.search("поставка")], ["B"])
+        self.assertEqual([n for n, _ in index.search("расторжение")], ["A"])
+
+        index.remove("B")
+        self.assertEqual(index.search("поставка"), [])
+
+    def test_fulltext_index_posting_limit(self):
+        """Test that the most common terms are dropped over the posting limit"""
+        index = FullTextIndex(max_postings=4)
+        for number, content in [("A", "счёт акт"), ("B", "счёт накладная"), ("C", "счёт")]:
+            doc = self.make_doc(number, "t")
+            doc.add_version(content, "u1")
+            index.add(doc)
+        self.assertEqual(index.stopped_terms(), {"счёт"})
+        self.assertEqual(index.posting_count(), 2)
+        self.assertEqual(index.search("счёт"), [])
+        self.assertEqual([n for n, _ in index.search("накладная")], ["B"])
+
+    def test_fulltext_index_memory_is_bounded(self):
+        """Test that per-document terms and stopped terms stay within the posting limit"""
+        index = FullTextIndex(max_postings=10)
+        for i in range(50):
+            doc = self.make_doc(f"N-{i}", "t")
+            doc.add_version(f"договор пункт{i} статья{i}", "u1")
+            index.add(doc)
+        self.assertLessEqual(index.posting_count(), 10)
+        self.assertEqual(sum(len(terms) for terms in index._doc_terms.values()), index.posting_count())
+        self.assertEqual(len(index.stopped_terms()), 10)
+        self.assertIn("договор", index.stopped_terms())
+
+        for i in range(50):
+            index.remove(f"N-{i}")
+        self.assertEqual(index.posting_count(), 0)
+        self.assertEqual(index._doc_terms, {})
+        d = self.make_doc("D", "t")
+        d.add_version("договор", "u1")
+        index.add(d)
+        self.assertEqual(index.search("договор"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from datetime import datetime, timedelta
+from documentflow.partitioning import PartitionedDocumentStorage, shard_of
+from documentflow.storage import StorageLocation, ArchiveService
+from documentflow.security import QuotaManager
+from documentflow.documents import Document, DocumentAttachment
+from documentflow.users import User
+from documentflow.workflow import WorkflowState
+from documentflow.cache import SearchCache
+from documentflow.exceptions import DocumentNotFoundError
+
+
+class TestPartitionedStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.storage = PartitionedDocumentStorage(
+            location=StorageLocation(name="test", base_path="/tmp"),
+            quota=QuotaManager(max_bytes=1_000_000),
+            shards=4,
+        )
+        self.addCleanup(self.storage.close)
+        for i in range(40):
+            title = "Договор поставки" if i % 2 else "Счёт на оплату"
+            self.storage.save(Document(id=f"d{i}", number=f"DOC-{i:03d}", title=title, author=self.user))
+
+    def test_point_operations(self):
+        """Test that save/get/exists/delete are routed to one shard"""
+        doc = self.storage.get("DOC-007")
+        self.assertIs(self.storage.partition("DOC-007").get("DOC-007"), doc)
+        self.assertEqual(sum(p.count_documents() > 0 for p in self.storage._partitions), 4)
+        self.storage.delete("DOC-007")
+        self.assertFalse(self.storage.exists("DOC-007"))
+        with self.assertRaises(DocumentNotFoundError):
+            self.storage.get("DOC-007")
+        self.assertEqual(self.storage.count_documents(), 39)
+
+    def test_scans_merge_shards(self):
+        """Test that fan-out scans return globally sorted results"""
+        numbers = [d.number for d in self.storage.search("договор")]
+        self.assertEqual(numbers, [f"DOC-{i:03d}" for i in range(1, 40, 2)])
+        self.assertEqual(self.storage.get_all_numbers(), [f"DOC-{i:03d}" for i in range(40)])
+        self.assertEqual(len(list(self.storage.search_substring("оплат"))), 20)
+
+        archive = ArchiveService(storage=self.storage)
+        self.storage.get("DOC-003").approve()
+        self.storage.get("DOC-001").approve()
+        archive.archive_document("DOC-003")
+        archive.archive_document("DOC-001")
+        self.assertEqual([d.number for d in archive.get_archived_documents()], ["DOC-001", "DOC-003"])
+        self.assertEqual(self.storage.status_counts(), {WorkflowState.NEW: 38, WorkflowState.ARCHIVED: 2})
+
+    def test_search_page(self):
+        """Test keyset pagination across shards"""
+        seen, cursor = [], None
+        while True:
+            page = self.storage.search_page("DOC", 7, cursor)
+            seen.extend(d.number for d in page.items)
+            if not page.has_more():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [f"DOC-{i:03d}" for i in range(40)])
+
+    def test_rebalance(self):
+        """Test growing and shrinking the shard count"""
+        doc = self.storage.get("DOC-010")
+        att = DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=10, checksum="c")
+        self.storage.store_attachment(doc, att)
+        cache = SearchCache()
+        cache.attach(self.storage)
+        cache.put("договор", list(self.storage.search("договор")))
+
+        revision = doc.revision
+        moved = self.storage.rebalance(7)
+        expected = sum(shard_of(f"DOC-{i:03d}", 4) != shard_of(f"DOC-{i:03d}", 7) for i in range(40))
+        self.assertEqual(moved, expected)
+        self.assertEqual(len(self.storage._partitions), 7)
+        self.assertEqual(self.storage.count_documents(), 40)
+        self.assertIs(self.storage.partition("DOC-010").get("DOC-010"), doc)
+        self.assertEqual(doc.revision, revision)
+        self.assertEqual(self.storage.quota.used_bytes, 10)
+
+        self.storage.rebalance(1)
+        self.assertEqual(self.storage.get_all_numbers(), [f"DOC-{i:03d}" for i in range(40)])
+        self.assertEqual(self.storage.partition("DOC-010").attachment_refcount("c"), 1)
+        self.assertEqual(len(list(self.storage.search("договор"))), 20)
+
+    def test_attachments_are_shared_across_shards(self):
+        """Test that one blob backs equal attachments of documents in different shards"""
+        first = "DOC-000"
+        second = next(n for n in self.storage.get_all_numbers() if shard_of(n, 4) != shard_of(first, 4))
+        for number in (first, second):
+            att = DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=10, checksum="c")
+            self.storage.store_attachment(self.storage.get(number), att)
+        self.assertEqual(self.storage.quota.used_bytes, 10)
+        self.assertEqual(self.storage.partition(first).attachment_refcount("c"), 2)
+        self.storage.delete(first)
+        self.assertEqual(self.storage.quota.used_bytes, 10)
+        self.storage.delete(second)
+        self.assertEqual(self.storage.quota.used_bytes, 0)
+
+    def test_archived_before_merges_by_creation_time(self):
+        """Test that archived documents of all shards come oldest first"""
+        base = datetime(2024, 1, 1)
+        for i in range(40):
+            doc = self.storage.get(f"DOC-{i:03d}")
+            doc.created_at = base + timedelta(days=(i * 13) % 40)
+            doc.archive()
+        expected = [d.number for d in sorted((self.storage.get(f"DOC-{i:03d}") for i in range(40)), key=lambda d: d.created_at)]
+        self.assertEqual(self.storage.archived_before(base + timedelta(days=100)), expected)
+        self.assertEqual(self.storage.archived_before(base + timedelta(days=100), limit=5), expected[:5])
+        self.assertEqual(self.storage.archived_before(base + timedelta(days=9)), expected[:10])
+
+    def test_invalid_shard_count(self):
+        """Test that the shard count must be positive"""
+        with self.assertRaises(ValueError):
+            self.storage.rebalance(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime, timedelta
+from documentflow.query import DocumentQuery, DocumentQueryEngine, FULL_SCAN
+from documentflow.storage import StorageLocation, DocumentStorage
+from documentflow.security import QuotaManager
+from documentflow.documents import Document, IncomingDocument, InvoiceDocument
+from documentflow.users import User, Organization, Department
+from documentflow.workflow import WorkflowState
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.other = User(id="u2", login="other", display_name="Other User")
+        self.org = Organization(name="Org", inn="7711111111")
+        self.dep = Department(name="IT", cost_center="42")
+        self.storage = DocumentStorage(location=StorageLocation(name="test", base_path="/tmp"), quota=QuotaManager(max_bytes=1_000_000))
+        self.engine = DocumentQueryEngine(storage=self.storage)
+        for i in range(6):
+            self.storage.save(InvoiceDocument(id=f"i{i}", number=f"INV-{i}", title="Счёт", author=self.user, organization=self.org))
+        self.storage.save(IncomingDocument(id="in1", number="IN-1", title="Письмо", author=self.other, organization=self.org, department=self.dep))
+        self.storage.get("INV-0").department = self.dep
+        self.storage.save(self.storage.get("INV-0"))
+        self.storage.get("INV-0").status = WorkflowState.IN_REVIEW
+        self.storage.get("INV-1").status = WorkflowState.IN_REVIEW
+        self.storage.get("INV-2").status = WorkflowState.IN_REVIEW
+
+    def test_query_uses_most_selective_index(self):
+        """Test that the planner picks the smallest posting list"""
+        query = DocumentQuery(status=WorkflowState.IN_REVIEW, doc_type=InvoiceDocument, organization_inn="7711111111", cost_center="42")
+        plan = self.engine.plan(query)
+        self.assertEqual(plan.index, "department")
+        self.assertEqual(plan.estimated_rows, 2)
+        self.assertEqual(plan.estimates, {"status": 3, "type": 6, "organization": 7, "department": 2})
+        self.assertIn("department", plan.describe())
+
+        result = self.engine.execute(query)
+        self.assertEqual([d.number for d in result.documents], ["INV-0"])
+        self.assertEqual(result.examined, 2)
+
+    def test_query_type_filter_includes_subclasses(self):
+        """Test that a base document type matches all subclasses"""
+        result = self.engine.execute(DocumentQuery(doc_type=Document, author_id="u2"))
+        self.assertEqual(result.plan.index, "author")
+        self.assertEqual([d.number for d in result.documents], ["IN-1"])
+        self.assertEqual(self.engine.plan(DocumentQuery(doc_type=Document)).estimated_rows, 7)
+
+    def test_query_date_ranges_without_index(self):
+        """Test that range-only queries fall back to a full scan"""
+        old = self.storage.get("INV-5")
+        old.created_at = datetime.utcnow() - timedelta(days=30)
+        week_ago = datetime.utcnow() - timedelta(days=7)
+
+        result = self.engine.execute(DocumentQuery(created_to=week_ago))
+        self.assertEqual(result.plan.index, FULL_SCAN)
+        self.assertEqual([d.number for d in result.documents], ["INV-5"])
+
+        result = self.engine.execute(DocumentQuery(doc_type=InvoiceDocument, created_from=week_ago, updated_to=datetime.utcnow()))
+        self.assertEqual(len(result.documents), 5)
+
+    def test_query_unknown_value_is_empty(self):
+        """Test that an unknown filter value short-circuits to an empty plan"""
+        result = self.engine.execute(DocumentQuery(status=WorkflowState.IN_REVIEW, organization_inn="000"))
+        self.assertEqual(result.plan.index, "organization")
+        self.assertEqual(result.plan.estimated_rows, 0)
+        self.assertEqual(result.documents, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
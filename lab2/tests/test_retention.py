@@ -0,0 +1,80 @@
+import unittest
+from datetime import datetime, timedelta
+from documentflow.retention import RetentionSweeper
+from documentflow.storage import StorageLocation, DocumentStorage, ArchiveService
+from documentflow.security import QuotaManager
+from documentflow.documents import Document, DocumentAttachment
+from documentflow.users import User
+from documentflow.workflow import WorkflowState
+
+
+class TestRetentionSweeper(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.now = datetime(2025, 1, 1)
+        self.storage = DocumentStorage(location=StorageLocation(name="test", base_path="/tmp"), quota=QuotaManager(max_bytes=1_000_000))
+        self.archive = ArchiveService(storage=self.storage, archive_retention_days=30)
+        for i in range(10):
+            self.add(f"OLD-{i}", days=40 + i, status=WorkflowState.ARCHIVED)
+        self.add("NEW-0", days=5, status=WorkflowState.ARCHIVED)
+        self.add("ACTIVE-0", days=100, status=WorkflowState.NEW)
+
+    def add(self, number: str, days: int, status: str) -> Document:
+        doc = Document(id=number, number=number, title="Акт", author=self.user, status=status)
+        doc.created_at = self.now - timedelta(days=days)
+        self.storage.save(doc)
+        return doc
+
+    def sweeper(self, **kwargs) -> RetentionSweeper:
+        return RetentionSweeper(archive=self.archive, pause=0, clock=lambda: self.now, **kwargs)
+
+    def test_index_follows_status(self):
+        """Test that only archived documents are in the age index"""
+        cutoff = self.archive.retention_cutoff(self.now)
+        self.assertEqual(self.storage.archived_before(cutoff, 2), ["OLD-9", "OLD-8"])
+        self.assertEqual(self.storage.count_archived_before(cutoff), 10)
+        self.storage.get("ACTIVE-0").archive()
+        self.storage.get("OLD-0").restore()
+        self.assertEqual(self.storage.count_archived_before(cutoff), 10)
+        self.assertEqual(self.storage.archived_before(cutoff)[0], "ACTIVE-0")
+        self.assertTrue(all(self.archive.can_delete_archived(self.storage.get(n)) for n in self.storage.archived_before(cutoff, 9)))
+
+    def test_sweep_in_batches(self):
+        """Test throttled batches, released quota and backlog"""
+        att = DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=100, checksum="x")
+        self.storage.store_attachment(self.storage.get("OLD-0"), att)
+        self.storage.store_attachment(self.storage.get("NEW-0"), att)
+        self.storage.store_attachment(self.storage.get("OLD-1"), DocumentAttachment(filename="b.pdf", content_type="application/pdf", size=50, checksum="y"))
+
+        report = self.sweeper(batch_size=3, max_batches=2).run_once()
+        self.assertEqual((report.deleted, report.batches, report.backlog), (6, 2, 4))
+        self.assertGreater(report.throughput(), 0)
+
+        sweeper = self.sweeper(batch_size=3)
+        report = sweeper.run_once()
+        self.assertEqual((report.deleted, report.batches, report.backlog), (4, 2, 0))
+        self.assertEqual(report.released_bytes, 50)
+        self.assertEqual(self.storage.quota.used_bytes, 100)
+        self.assertEqual(sorted(self.storage.get_all_numbers()), ["ACTIVE-0", "NEW-0"])
+        self.assertEqual(sweeper.run_once().deleted, 0)
+        self.assertEqual((sweeper.runs, sweeper.total_deleted), (2, 4))
+
+    def test_cold_documents_are_swept(self):
+        """Test that documents in the cold tier are deleted without rehydration"""
+        self.storage.demote("OLD-3")
+        self.sweeper().run_once()
+        self.assertFalse(self.storage.exists("OLD-3"))
+        self.assertEqual(self.storage.tier_stats().rehydrations, 0)
+
+    def test_background_thread(self):
+        """Test that the background job sweeps and stops"""
+        sweeper = self.sweeper()
+        sweeper.start(interval=60)
+        sweeper.stop()
+        self.assertEqual(sweeper.total_deleted, 10)
+        self.assertEqual(self.storage.count_documents(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
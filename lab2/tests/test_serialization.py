@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime
+from documentflow.serialization import dumps, loads, document_to_dict, document_from_dict
+from documentflow.documents import InvoiceDocument, DocumentAttachment
+from documentflow.users import User, Role, Permission, Organization, Department
+from documentflow.workflow import ApprovalRoute, ApprovalStep, WorkflowState
+
+
+class TestSerialization(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        role = Role(name="REVIEWER", permissions={Permission(code="approve")})
+        self.user = User(id="u1", login="u1", display_name="U1", roles=[role],
+                         org=Organization(name="Org", inn="123"), department=Department(name="IT", cost_center="42"))
+
+    def test_document_round_trip(self):
+        """Test that a document with nested entities survives a round trip"""
+        doc = InvoiceDocument(id="d1", number="INV-1", title="Счёт", author=self.user, amount_due=100,
+                              due_date=datetime(2025, 1, 31), approval_route=ApprovalRoute(name="r", steps=[ApprovalStep(name="s", role_name="REVIEWER")]))
+        doc.add_version("v1", "u1")
+        doc.add_attachment(DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=10, checksum="c"))
+        doc.metadata.add_tag("urgent")
+        doc.metadata.set_attribute("region", "north")
+        doc.sign("u1")
+
+        restored = loads(dumps(doc))
+        self.assertIsInstance(restored, InvoiceDocument)
+        self.assertEqual(restored, doc)
+        self.assertEqual(restored.created_at, doc.created_at)
+        self.assertTrue(restored.metadata.has_tag("urgent"))
+        self.assertTrue(restored.author.has_permission("approve"))
+
+    def test_restored_document_publishes_events(self):
+        """Test that a restored document relays metadata and status events"""
+        restored = document_from_dict(document_to_dict(InvoiceDocument(id="d1", number="INV-1", title="Счёт", author=self.user)))
+        events = []
+        restored.subscribe(lambda source, event, *args: events.append(event))
+        restored.metadata.add_tag("x")
+        restored.status = WorkflowState.APPROVED
+        self.assertEqual(events, ["tag_added", "status"])
+
+    def test_unknown_values_rejected(self):
+        """Test that unsupported types are rejected"""
+        with self.assertRaises(TypeError):
+            dumps(object())
+        with self.assertRaises(TypeError):
+            loads(b'{"__type__": "Unknown"}')
+        with self.assertRaises(TypeError):
+            document_from_dict(document_to_dict(self.user))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,10 @@
 import unittest
-from documentflow.services import InMemoryDocumentRepository, ConsoleNotifier, NotificationService, ValidationService, DocumentService, ApprovalService, SearchService, AuthService
+from documentflow.services import retry_on_conflict, InMemoryDocumentRepository, ConsoleNotifier, NotificationService, ValidationService, DocumentService, ApprovalService, SearchService, AuthService
 from documentflow.storage import StorageLocation, DocumentStorage
 from documentflow.security import QuotaManager, PasswordPolicy
-from documentflow.documents import IncomingDocument, DocumentRegistry
+from documentflow.documents import IncomingDocument, DocumentRegistry, DocumentAttachment
 from documentflow.users import User
+from documentflow.exceptions import VersionConflictError
 
 class TestServices(unittest.TestCase):
     def setUp(self):
@@ -22,6 +23,103 @@ class TestServices(unittest.TestCase):
         search = SearchService(repo=self.repo)
         res = search.find("Test")
         self.assertEqual(res[0].number, "N-1")
+    def test_search_substring_ranking(self):
+        """Test that substring matches are ranked by match quality"""
+        u = User(id="u1", login="l", display_name="d")
+        for number, title in [("ACT-7", "Акт по счёту INV"), ("INV-002", "Счёт"), ("INV", "Реестр"), ("X-1", "Invoice list")]:
+            self.doc_service.register(IncomingDocument(id=number, number=number, title=title, author=u))
+        search = SearchService(repo=self.repo)
+        res = search.find("inv")
+        self.assertEqual([d.number for d in res], ["INV", "INV-002", "X-1", "ACT-7"])
+        self.assertEqual([d.number for d in search.find("V-00")], ["INV-002"])
+    def test_search_pagination(self):
+        """Test cursor pagination in number and updated_at order"""
+        u = User(id="u1", login="l", display_name="d")
+        for i in range(5):
+            self.doc_service.register(IncomingDocument(id=str(i), number=f"P-{i}", title="Письмо", author=u))
+        search = SearchService(repo=self.repo)
+
+        first = search.find_page("письмо", limit=2)
+        self.assertEqual([d.number for d in first.items], ["P-0", "P-1"])
+        self.assertTrue(first.has_more())
+        second = search.find_page("письмо", limit=2, cursor=first.next_cursor)
+        self.assertEqual([d.number for d in second.items], ["P-2", "P-3"])
+        last = search.find_page("письмо", limit=2, cursor=second.next_cursor)
+        self.assertEqual([d.number for d in last.items], ["P-4"])
+        self.assertFalse(last.has_more())
+
+        self.repo.get("P-0").touch()
+        by_update = [d.number for d in search.iter_results("письмо", page_size=2, order_by="updated_at")]
+        self.assertEqual(by_update[-1], "P-0")
+        self.assertEqual(sorted(by_update), ["P-0", "P-1", "P-2", "P-3", "P-4"])
+    def test_search_pagination_invalid_arguments(self):
+        """Test that bad limits, orders and cursors are rejected"""
+        search = SearchService(repo=self.repo)
+        with self.assertRaises(ValueError):
+            search.find_page("x", limit=0)
+        with self.assertRaises(ValueError):
+            search.find_page("x", order_by="title")
+        with self.assertRaises(ValueError):
+            search.find_page("x", cursor="not-a-cursor")
+        page = SearchService(repo=self.repo).find_page("", limit=1)
+        self.assertIsNone(page.next_cursor)
+    def test_register_many(self):
+        """Test bulk registration with per-document failures"""
+        from documentflow.exceptions import DuplicateDocumentError
+        messages = []
+        self.notify.notifier.notify = messages.append
+        u = User(id="u1", login="l", display_name="d")
+        self.doc_service.register(IncomingDocument(id="0", number="B-0", title="Old", author=u))
+        messages.clear()
+        batch = [
+            IncomingDocument(id="1", number="B-1", title="Первый", author=u),
+            IncomingDocument(id="2", number="B-0", title="Дубликат реестра", author=u),
+            IncomingDocument(id="3", number="B-1", title="Дубликат пакета", author=u),
+            IncomingDocument(id="4", number="B-4", title="", author=u),
+            IncomingDocument(id="5", number="B-5", title="Пятый", author=u),
+        ]
+        result = self.doc_service.register_many(batch)
+
+        self.assertEqual(result.registered, ["B-1", "B-5"])
+        self.assertFalse(result.is_complete())
+        self.assertEqual([(d.id, type(e)) for d, e in result.failed], [("2", DuplicateDocumentError), ("3", DuplicateDocumentError), ("4", ValueError)])
+        self.assertTrue(self.registry.contains("B-5"))
+        self.assertFalse(self.registry.contains("B-4"))
+        self.assertEqual(self.repo.get("B-1").title, "Первый")
+        self.assertEqual(messages, ["Зарегистрировано документов: 2, ошибок: 3"])
+    def test_register_many_write_failure(self):
+        """Test that numbers of documents that failed to store stay unregistered"""
+        u = User(id="u1", login="l", display_name="d")
+        save = self.repo.save
+
+        def failing_save(doc, expected_revision=None):
+            if doc.number == "W-2":
+                raise OSError("диск недоступен")
+            save(doc, expected_revision)
+
+        def failing_save_many(docs):
+            for doc in docs:
+                failing_save(doc)
+
+        self.repo.save = failing_save
+        self.repo.save_many = failing_save_many
+        batch = [IncomingDocument(id=str(i), number=f"W-{i}", title="Письмо", author=u) for i in range(1, 4)]
+        result = self.doc_service.register_many(batch)
+        self.assertEqual(result.registered, ["W-1", "W-3"])
+        self.assertEqual([(d.number, type(e)) for d, e in result.failed], [("W-2", OSError)])
+        self.assertFalse(self.registry.contains("W-2"))
+        del self.repo.save, self.repo.save_many
+        self.assertEqual(self.doc_service.register_many([batch[1]]).registered, ["W-2"])
+    def test_find_content(self):
+        """Test full-text search over the latest version content"""
+        u = User(id="u1", login="l", display_name="d")
+        doc = IncomingDocument(id="c1", number="C-1", title="Договор", author=u)
+        self.doc_service.register(doc)
+        doc.add_version("условия поставки оборудования", u.id)
+        search = SearchService(repo=self.repo)
+        self.assertEqual([d.number for d in search.find_content("оборудования")], ["C-1"])
+        doc.add_version("условия аренды", u.id)
+        self.assertEqual(search.find_content("оборудования"), [])
     def test_approve_and_sign(self):
         u = User(id="u1", login="l", display_name="d")
         doc = IncomingDocument(id="2", number="N-2", title="Test2", author=u)
@@ -75,5 +173,52 @@ class TestServices(unittest.TestCase):
         with self.assertRaises(AccessDeniedError):
             self.doc_service.sign("N-4", u)
 
+    def test_retry_on_conflict(self):
+        """Test that conflicts are retried and the last one is raised"""
+        calls = []
+
+        @retry_on_conflict(attempts=3, backoff=0)
+        def flaky(failures: int) -> str:
+            calls.append(failures)
+            if len(calls) <= failures:
+                raise VersionConflictError("конфликт")
+            return "ok"
+
+        self.assertEqual(flaky(2), "ok")
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        with self.assertRaises(VersionConflictError):
+            flaky(3)
+        self.assertEqual(len(calls), 3)
+
+    def test_service_writes_check_revision(self):
+        """Test that service writes compare revisions and bump them"""
+        u = User(id="u1", login="l", display_name="d")
+        doc = IncomingDocument(id="5", number="N-5", title="Письмо", author=u)
+        self.doc_service.register(doc)
+        with self.assertRaises(VersionConflictError):
+            self.repo.save(doc, expected_revision=doc.revision - 1)
+        self.doc_service.archive("N-5")
+        self.assertEqual(self.repo.get("N-5").revision, 2)
+
+    def test_conflicting_write_is_applied_once(self):
+        """Test that a retried service write does not repeat a change lost to a conflict"""
+        u = User(id="u1", login="l", display_name="d")
+        doc = IncomingDocument(id="6", number="N-6", title="Письмо", author=u)
+        self.doc_service.register(doc)
+        save = self.repo.save
+
+        def racing_save(draft, expected_revision=None):
+            del self.repo.save
+            save(self.repo.get("N-6"), expected_revision=self.repo.get("N-6").revision)
+            save(draft, expected_revision=expected_revision)
+
+        self.repo.save = racing_save
+        self.doc_service.add_attachment("N-6", DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=10, checksum="x"))
+        stored = self.repo.get("N-6")
+        self.assertIs(stored, doc)
+        self.assertEqual([a.filename for a in doc.attachments], ["a.pdf"])
+        self.assertEqual(doc.revision, 3)
+
 if __name__ == "__main__":
     unittest.main()
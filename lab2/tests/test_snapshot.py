@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from documentflow.snapshot import Snapshot, SnapshotDocumentStorage, write_snapshot, restore_registry
+from documentflow.storage import StorageLocation, DocumentStorage
+from documentflow.security import QuotaManager
+from documentflow.documents import Document, InvoiceDocument, DocumentAttachment, DocumentRegistry
+from documentflow.users import User
+from documentflow.workflow import WorkflowState
+from documentflow.exceptions import DocumentNotFoundError
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "docs.snap")
+        self.location = StorageLocation(name="test", base_path=self.tmp.name)
+        storage = DocumentStorage(location=self.location, quota=QuotaManager(max_bytes=1_000_000))
+        registry = DocumentRegistry()
+        for i in range(5):
+            doc = InvoiceDocument(id=f"d{i}", number=f"INV-{i:03d}", title=f"Счёт {i}", author=self.user, amount_due=i)
+            storage.save(doc)
+            registry.register(doc.number)
+        storage.get("INV-001").archive()
+        storage.get("INV-003").metadata.add_tag("срочно")
+        storage.store_attachment(storage.get("INV-002"), DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=10, checksum="c"))
+        self.used_bytes = storage.quota.used_bytes
+        write_snapshot(self.path, storage, registry)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def restore(self) -> SnapshotDocumentStorage:
+        storage = SnapshotDocumentStorage.restore(self.path, self.location, QuotaManager(max_bytes=1_000_000))
+        self.addCleanup(storage.snapshot.close)
+        return storage
+
+    def test_snapshot_lookup(self):
+        """Test binary search over the mmap-ed entry table"""
+        snapshot = Snapshot(self.path)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(len(snapshot), 5)
+        self.assertTrue(snapshot.contains("INV-004"))
+        self.assertFalse(snapshot.contains("INV-005"))
+        self.assertEqual(snapshot.load("INV-003").amount_due, 3)
+        self.assertIsNone(snapshot.load("A"))
+        self.assertEqual(list(snapshot.numbers()), [f"INV-{i:03d}" for i in range(5)])
+        self.assertEqual(restore_registry(snapshot).count(), 5)
+
+    def test_lazy_materialization(self):
+        """Test that documents are decoded only when requested"""
+        storage = self.restore()
+        self.assertEqual(storage.count_documents(), 5)
+        self.assertEqual(len(storage._docs), 0)
+        self.assertEqual(storage.quota.used_bytes, self.used_bytes)
+        self.assertEqual(storage.attachment_refcount("c"), 1)
+
+        self.assertTrue(storage.exists("INV-003"))
+        self.assertEqual(storage.get("INV-003").title, "Счёт 3")
+        self.assertEqual(len(storage._docs), 1)
+        with self.assertRaises(DocumentNotFoundError):
+            storage.get("INV-404")
+
+    def test_index_queries_do_not_load_documents(self):
+        """Test that index-backed queries are answered from index stubs"""
+        storage = self.restore()
+        self.assertEqual(storage._attachments, {})
+        self.assertEqual(storage.count_by_status(WorkflowState.ARCHIVED), 1)
+        self.assertEqual(storage.get_all_numbers(), [f"INV-{i:03d}" for i in range(5)])
+        self.assertEqual(storage.tag_facets(), {"срочно": 1})
+        self.assertEqual(len(storage._docs), 0)
+
+        self.assertEqual([d.number for d in storage.find_by_tags(["срочно"])], ["INV-003"])
+        self.assertEqual(list(storage._docs), ["INV-003"])
+        storage.delete("INV-002")
+        self.assertEqual(storage.get_all_numbers(), ["INV-000", "INV-001", "INV-003", "INV-004"])
+        self.assertEqual(storage.attachment_refcount("c"), 0)
+        self.assertEqual(storage.quota.used_bytes, 0)
+
+    def test_writes_over_snapshot(self):
+        """Test saves and deletes on top of unmaterialized documents"""
+        storage = self.restore()
+        storage.delete("INV-000")
+        storage.save(Document(id="n", number="NEW-1", title="Новый", author=self.user))
+        storage.save(Document(id="r", number="INV-004", title="Заменён", author=self.user))
+        self.assertFalse(storage.exists("INV-000"))
+        self.assertEqual(storage.count_documents(), 5)
+        self.assertEqual(storage.get("INV-004").title, "Заменён")
+
+        self.assertEqual([d.number for d in storage.find_by_status(WorkflowState.ARCHIVED)], ["INV-001"])
+        self.assertEqual(storage.get_all_numbers(), ["INV-001", "INV-002", "INV-003", "INV-004", "NEW-1"])
+        self.assertEqual(storage.count_documents(), 5)
+        self.assertEqual([d.number for d in storage.search("заменён")], ["INV-004"])
+
+    def test_snapshot_of_restored_storage(self):
+        """Test that a restored storage can be written to a new snapshot"""
+        storage = self.restore()
+        storage.delete("INV-000")
+        second = os.path.join(self.tmp.name, "second.snap")
+        write_snapshot(second, storage)
+        snapshot = Snapshot(second)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(len(snapshot), 4)
+        self.assertEqual(list(snapshot.registry_numbers()), [])
+
+    def test_invalid_file(self):
+        """Test that a foreign file is rejected"""
+        other = os.path.join(self.tmp.name, "other.bin")
+        with open(other, "wb") as f:
+            f.write(b"\0" * 100)
+        with self.assertRaises(ValueError):
+            Snapshot(other)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import tempfile
+import threading
+import unittest
+from documentflow.sqlite_repository import SqliteDocumentRepository
+from documentflow.services import SearchService, DocumentService, ValidationService, NotificationService, ConsoleNotifier
+from documentflow.documents import IncomingDocument, InvoiceDocument, DocumentRegistry
+from documentflow.users import User
+from documentflow.workflow import WorkflowState
+from documentflow.exceptions import DocumentNotFoundError, VersionConflictError
+
+
+class TestSqliteRepository(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = SqliteDocumentRepository(path=os.path.join(self.tmp.name, "docs.db"), batch_size=2)
+
+    def tearDown(self):
+        self.repo.close()
+        self.tmp.cleanup()
+
+    def test_save_get_exists(self):
+        """Test round trip of a document through SQLite"""
+        doc = InvoiceDocument(id="d1", number="INV-001", title="Счёт", author=self.user, amount_due=100)
+        doc.add_version("оплата поставки", self.user.id)
+        self.repo.save(doc)
+        self.assertTrue(self.repo.exists("INV-001"))
+        self.assertFalse(self.repo.exists("INV-404"))
+        self.assertIsNone(self.repo.get("INV-404"))
+        loaded = self.repo.get("INV-001")
+        self.assertIsInstance(loaded, InvoiceDocument)
+        self.assertEqual(loaded, doc)
+
+        loaded.status = WorkflowState.APPROVED
+        self.repo.save(loaded)
+        self.assertEqual(self.repo.get("INV-001").status, WorkflowState.APPROVED)
+        self.assertEqual(self.repo.count(), 1)
+
+    def test_batched_writes_and_search(self):
+        """Test save_many and the FTS-backed search methods"""
+        docs = [
+            IncomingDocument(id="1", number="IN-001", title="Письмо поставщика", author=self.user),
+            IncomingDocument(id="2", number="INV-001", title="Счёт поставщика", author=self.user),
+            IncomingDocument(id="3", number="INV-002", title="Акт сверки", author=self.user),
+        ]
+        docs[2].add_version("сверка взаиморасчётов за квартал", self.user.id)
+        self.repo.save_many(docs)
+
+        self.assertEqual([d.number for d in self.repo.search_words("поставщика")], ["IN-001", "INV-001"])
+        self.assertEqual([d.number for d in self.repo.search_words("письмо поставщика")], ["IN-001"])
+        self.assertEqual([d.number for d in self.repo.search("IN-00")], ["IN-001"])
+        self.assertEqual([d.number for d in self.repo.search_substring("INV-00")], ["INV-001", "INV-002"])
+        self.assertEqual([d.number for d in self.repo.search_substring("ставщ")], ["IN-001", "INV-001"])
+        self.assertEqual([d.number for d in self.repo.search_substring("кт")], ["INV-002"])
+        self.assertEqual([d.number for d in self.repo.search_content("квартал")], ["INV-002"])
+        self.assertEqual([d.number for d in SearchService(repo=self.repo).find("inv")], ["INV-002", "INV-001"])
+
+        self.repo.delete("INV-002")
+        self.assertEqual(self.repo.search_content("квартал"), [])
+
+    def test_search_page(self):
+        """Test keyset pagination in SQL"""
+        self.repo.save_many(IncomingDocument(id=str(i), number=f"P-{i}", title="Письмо", author=self.user) for i in range(5))
+        numbers = [d.number for d in SearchService(repo=self.repo).iter_results("письмо", page_size=2)]
+        self.assertEqual(numbers, ["P-0", "P-1", "P-2", "P-3", "P-4"])
+        by_update = [d.number for d in SearchService(repo=self.repo).iter_results("", page_size=3, order_by="updated_at")]
+        self.assertEqual(by_update, ["P-0", "P-1", "P-2", "P-3", "P-4"])
+        with self.assertRaises(ValueError):
+            self.repo.search_page("x", limit=0)
+
+    def test_connection_per_thread(self):
+        """Test that every thread gets its own connection"""
+        self.repo.save(IncomingDocument(id="1", number="IN-001", title="Письмо", author=self.user))
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(self.repo.exists("IN-001")))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [True])
+        self.assertEqual(len(self.repo._connections), 2)
+
+    def test_document_service_on_sqlite(self):
+        """Test that DocumentService works with the SQLite repository"""
+        service = DocumentService(repo=self.repo, registry=DocumentRegistry(), validator=ValidationService(), notifier=NotificationService(ConsoleNotifier()))
+        service.register(IncomingDocument(id="1", number="IN-001", title="Письмо", author=self.user))
+        service.archive("IN-001")
+        self.assertEqual(self.repo.get("IN-001").status, WorkflowState.ARCHIVED)
+
+
+    def test_lazy_details(self):
+        """Test that versions and metadata are fetched on first access"""
+        doc = InvoiceDocument(id="d1", number="INV-001", title="Счёт", author=self.user)
+        doc.add_version("оплата поставки", self.user.id)
+        doc.metadata.add_tag("срочно")
+        self.repo.save(doc)
+
+        header = self.repo.get("INV-001")
+        self.assertFalse(header.is_loaded())
+        self.assertEqual((header.title, header.status), ("Счёт", WorkflowState.NEW))
+        header.status = WorkflowState.APPROVED
+        self.repo.save(header)
+        self.assertFalse(header.is_loaded())
+
+        loaded = self.repo.get("INV-001")
+        self.assertEqual(loaded.status, WorkflowState.APPROVED)
+        self.assertEqual(loaded.metadata.tags, ["срочно"])
+        self.assertTrue(loaded.is_loaded())
+        self.assertEqual(loaded.versions[0].content, "оплата поставки")
+        self.assertEqual([d.number for d in self.repo.search_content("поставки")], ["INV-001"])
+
+        stale = self.repo.get("INV-001")
+        self.repo.delete("INV-001")
+        with self.assertRaises(DocumentNotFoundError):
+            stale.versions
+
+    def test_compare_and_swap_save(self):
+        """Test that a stale copy cannot overwrite a newer revision"""
+        self.repo.save(IncomingDocument(id="1", number="IN-001", title="Письмо", author=self.user))
+        first, second = self.repo.get("IN-001"), self.repo.get("IN-001")
+        self.assertEqual(first.revision, 1)
+        first.title = "Письмо поставщику"
+        self.repo.save(first, expected_revision=1)
+        second.title = "Письмо клиенту"
+        with self.assertRaises(VersionConflictError):
+            self.repo.save(second, expected_revision=1)
+        self.assertEqual(second.revision, 1)
+        stored = self.repo.get("IN-001")
+        self.assertEqual((stored.title, stored.revision), ("Письмо поставщику", 2))
+
+    def test_concurrent_service_writes(self):
+        """Test that concurrent signatures are all kept thanks to retries"""
+        doc = IncomingDocument(id="1", number="IN-001", title="Письмо", author=self.user)
+        doc.add_version("текст", self.user.id)
+        self.repo.save(doc)
+        service = DocumentService(repo=self.repo, registry=DocumentRegistry(), validator=ValidationService(), notifier=NotificationService(ConsoleNotifier()))
+        barrier = threading.Barrier(4)
+        errors = []
+
+        def sign(i: int) -> None:
+            barrier.wait()
+            try:
+                for j in range(5):
+                    service.sign("IN-001", User(id=f"u{i}-{j}", login="l", display_name="d"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=sign, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        stored = self.repo.get("IN-001")
+        self.assertEqual(len(stored.signatures), 20)
+        self.assertEqual(stored.revision, 21)
+
+    def test_eager_mode(self):
+        """Test that lazy=False loads every field with the header"""
+        self.repo.lazy = False
+        self.repo.save(IncomingDocument(id="1", number="IN-001", title="Письмо", author=self.user))
+        self.assertTrue(self.repo.get("IN-001").is_loaded())
+
+
+if __name__ == "__main__":
+    unittest.main()
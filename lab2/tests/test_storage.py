@@ -5,7 +5,7 @@ from documentflow.security import QuotaManager
 from documentflow.documents import Document, DocumentAttachment, DocumentMetadata
 from documentflow.users import User
 from documentflow.workflow import WorkflowState
-from documentflow.exceptions import DocumentNotFoundError
+from documentflow.exceptions import DocumentNotFoundError, VersionConflictError
 
 
 class TestStorage(unittest.TestCase):
@@ -324,6 +324,252 @@ class TestStorage(unittest.TestCase):
         with self.assertRaises(StorageLimitExceededError):
             storage.store_attachment(doc, large_att)
 
+    
+    def test_document_storage_search(self):
+        """Test substring search and word search through the token index"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        quota = QuotaManager(max_bytes=1_000_000)
+        storage = DocumentStorage(location=loc, quota=quota)
+        
+        storage.save(Document(id="d1", number="IN-001", title="Письмо поставщика", author=self.user))
+        storage.save(Document(id="d2", number="INV-001", title="Счёт поставщика", author=self.user))
+        
+        self.assertEqual([d.number for d in storage.search_words("поставщика")], ["IN-001", "INV-001"])
+        self.assertEqual([d.number for d in storage.search_words("INV-001")], ["INV-001"])
+        self.assertEqual([d.number for d in storage.search_words("пост")], [])
+        self.assertEqual([d.number for d in storage.search("пост")], ["IN-001", "INV-001"])
+        self.assertEqual([d.number for d in storage.search("IN-00")], ["IN-001"])
+        self.assertEqual([d.number for d in storage.search("договор")], [])
+        self.assertEqual(len(list(storage.search(""))), 2)
+        
+        storage.delete("IN-001")
+        self.assertEqual([d.number for d in storage.search_words("письмо")], [])
+        
+        storage.clear()
+        self.assertEqual(list(storage.search("поставщика")), [])
+
+    
+    def test_document_storage_tag_index_consistency(self):
+        """Test that tag queries follow in-place metadata changes"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        quota = QuotaManager(max_bytes=1_000_000)
+        storage = DocumentStorage(location=loc, quota=quota)
+        
+        doc1 = Document(id="d1", number="DOC-001", title="Test", author=self.user)
+        doc2 = Document(id="d2", number="DOC-002", title="Test", author=self.user)
+        storage.save(doc1)
+        storage.save(doc2)
+        
+        doc1.metadata.add_tag("urgent")
+        doc2.metadata.add_tag("urgent")
+        doc2.metadata.add_tag("finance")
+        doc1.metadata.set_attribute("dept", "IT")
+        
+        self.assertEqual([d.number for d in storage.find_by_tags(["urgent", "finance"])], ["DOC-002"])
+        self.assertEqual([d.number for d in storage.find_by_tags(["urgent", "finance"], match_all=False)], ["DOC-001", "DOC-002"])
+        self.assertEqual([d.number for d in storage.find_by_attribute("dept", "IT")], ["DOC-001"])
+        self.assertEqual(storage.tag_facets(), {"urgent": 2, "finance": 1})
+        
+        doc2.metadata.remove_tag("urgent")
+        self.assertEqual(storage.tag_facets(), {"urgent": 1, "finance": 1})
+        
+        doc1.metadata = DocumentMetadata(tags=["archive"])
+        self.assertEqual([d.number for d in storage.find_by_tags(["archive"])], ["DOC-001"])
+        self.assertEqual(storage.find_by_attribute("dept", "IT"), [])
+        
+        storage.delete("DOC-002")
+        doc2.metadata.add_tag("urgent")
+        self.assertEqual(storage.tag_facets(), {"archive": 1})
+
+    
+    def test_document_storage_status_index(self):
+        """Test that status counts follow document transitions"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        quota = QuotaManager(max_bytes=1_000_000)
+        storage = DocumentStorage(location=loc, quota=quota)
+        archive_service = ArchiveService(storage=storage)
+        
+        for i in range(3):
+            storage.save(Document(id=f"d{i}", number=f"DOC-{i:03d}", title="Test", author=self.user))
+        storage.get("DOC-000").status = WorkflowState.IN_REVIEW
+        archive_service.archive_document("DOC-001")
+        
+        self.assertEqual(storage.count_by_status(WorkflowState.IN_REVIEW), 1)
+        self.assertEqual([d.number for d in archive_service.get_archived_documents()], ["DOC-001"])
+        self.assertEqual(storage.status_counts(), {WorkflowState.NEW: 1, WorkflowState.IN_REVIEW: 1, WorkflowState.ARCHIVED: 1})
+        
+        archive_service.restore_document("DOC-001")
+        self.assertEqual(archive_service.get_archived_documents(), [])
+        self.assertEqual(storage.count_by_status(WorkflowState.NEW), 2)
+        
+        storage.delete("DOC-000")
+        self.assertEqual([d.number for d in storage.find_by_status(WorkflowState.IN_REVIEW)], [])
+
+    
+    def test_document_storage_number_ranges(self):
+        """Test ordered number scans"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        quota = QuotaManager(max_bytes=1_000_000)
+        storage = DocumentStorage(location=loc, quota=quota)
+        
+        for num in ["IN-300", "IN-100", "INV-001", "IN-200", "IN-600"]:
+            storage.save(Document(id=num, number=num, title="Test", author=self.user))
+        
+        self.assertEqual(storage.get_all_numbers(), ["IN-100", "IN-200", "IN-300", "IN-600", "INV-001"])
+        self.assertEqual(storage.numbers_in_range("IN-100", "IN-500"), ["IN-100", "IN-200", "IN-300"])
+        self.assertEqual(storage.numbers_with_prefix("INV-"), ["INV-001"])
+        self.assertEqual(storage.last_number("IN-"), "IN-600")
+        
+        storage.delete("IN-600")
+        self.assertEqual(storage.last_number("IN-"), "IN-300")
+
+
+    def test_attachment_deduplication(self):
+        """Test that identical attachments share one blob and one quota charge"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        storage = DocumentStorage(location=loc, quota=QuotaManager(max_bytes=150))
+        docs = [Document(id=f"d{i}", number=f"DOC-{i:03d}", title="Скан", author=self.user) for i in range(3)]
+        scan = DocumentAttachment(filename="scan.pdf", content_type="application/pdf", size=100, checksum="sha-1")
+        for doc in docs:
+            storage.save(doc)
+            storage.store_attachment(doc, scan)
+        self.assertEqual(storage.quota.used_bytes, 100)
+        self.assertEqual(storage.blob_count(), 1)
+        self.assertEqual(storage.attachment_refcount("sha-1"), 3)
+
+        storage.store_attachment(docs[0], scan)
+        self.assertEqual(storage.attachment_refcount("sha-1"), 3)
+        self.assertTrue(storage.remove_attachment(docs[0], "scan.pdf"))
+        self.assertFalse(storage.remove_attachment(docs[0], "scan.pdf"))
+        storage.delete("DOC-001")
+        self.assertEqual(storage.quota.used_bytes, 100)
+        storage.delete("DOC-002")
+        self.assertEqual(storage.quota.used_bytes, 0)
+        self.assertEqual(storage.blob_count(), 0)
+
+    def test_attachment_replacement_releases_old_blob(self):
+        """Test that overwriting an attachment frees the previous content"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        storage = DocumentStorage(location=loc, quota=QuotaManager(max_bytes=1000))
+        doc = Document(id="d1", number="DOC-001", title="Договор", author=self.user)
+        storage.save(doc)
+        storage.store_attachment(doc, DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=100, checksum="v1"))
+        storage.store_attachment(doc, DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=40, checksum="v2"))
+        self.assertEqual(storage.quota.used_bytes, 40)
+        storage.clear()
+        self.assertEqual(storage.quota.used_bytes, 0)
+
+
+    def test_archived_documents_move_to_cold_tier(self):
+        """Test that archiving compresses a document and get rehydrates it"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        storage = DocumentStorage(location=loc, quota=QuotaManager(max_bytes=1_000_000))
+        doc = Document(id="d1", number="DOC-001", title="Договор аренды", author=self.user, status=WorkflowState.APPROVED)
+        doc.add_version("Текст договора " * 50, "u1")
+        doc.metadata.add_tag("аренда")
+        storage.save(doc)
+        storage.save(Document(id="d2", number="DOC-002", title="Письмо", author=self.user))
+
+        ArchiveService(storage=storage).archive_document("DOC-001")
+        self.assertTrue(storage.is_cold("DOC-001"))
+        stats = storage.tier_stats()
+        self.assertEqual((stats.hot_documents, stats.cold_documents), (1, 1))
+        self.assertGreater(stats.compression_ratio(), 1)
+        self.assertEqual(storage.count_documents(), 2)
+        self.assertEqual(storage.count_by_status(WorkflowState.ARCHIVED), 1)
+        self.assertEqual(storage.get_all_numbers(), ["DOC-001", "DOC-002"])
+
+        found = storage.find_by_tags(["аренда"])[0]
+        self.assertEqual(len(found.versions), 1)
+        self.assertEqual([d.number for d in storage.find_by_status(WorkflowState.ARCHIVED)], ["DOC-001"])
+        self.assertTrue(storage.is_cold("DOC-001"))
+        self.assertEqual(storage.tier_stats().rehydrations, 0)
+
+        restored = ArchiveService(storage=storage).get_archived_documents()[0]
+        self.assertFalse(storage.is_cold("DOC-001"))
+        stats = storage.tier_stats()
+        self.assertEqual((stats.rehydrations, stats.cold_documents, stats.cold_bytes), (1, 0, 0))
+
+        restored.restore()
+        self.assertIs(storage.get("DOC-001"), restored)
+        self.assertEqual(storage.count_by_status(WorkflowState.ARCHIVED), 0)
+
+    def test_cold_document_delete_and_restore(self):
+        """Test deleting a cold document and restoring an archived one"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        storage = DocumentStorage(location=loc, quota=QuotaManager(max_bytes=1_000_000))
+        archive = ArchiveService(storage=storage)
+        for i in range(2):
+            storage.save(Document(id=f"d{i}", number=f"DOC-{i}", title="Акт", author=self.user, status=WorkflowState.APPROVED))
+            archive.archive_document(f"DOC-{i}")
+        storage.delete("DOC-0")
+        self.assertFalse(storage.exists("DOC-0"))
+        self.assertEqual(storage.get_all_numbers(), ["DOC-1"])
+        archive.restore_document("DOC-1")
+        self.assertEqual(storage.get("DOC-1").status, WorkflowState.NEW)
+        self.assertEqual(storage.tier_stats().cold_documents, 0)
+
+    def test_search_page_walks_from_cursor(self):
+        """Test that paging dense, rare and short queries matches a full sort"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        storage = DocumentStorage(location=loc, quota=QuotaManager(max_bytes=1_000_000))
+        for i in range(200):
+            title = "Договор аренды" if i % 50 == 7 else "Договор поставки"
+            storage.save(Document(id=str(i), number=f"DOC-{i:03d}", title=title, author=self.user))
+        for query in ("", "поставки", "аренды", "до", "нет такого"):
+            numbers, cursor = [], None
+            while True:
+                page = storage.search_page(query, 9, cursor)
+                numbers.extend(d.number for d in page.items)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+            expected = sorted(d.number for d in storage.search_substring(query))
+            self.assertEqual(numbers, expected, query)
+
+    def test_search_page_by_update_time(self):
+        """Test paging in updated_at order from the index, following touches and keeping cold documents cold"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        storage = DocumentStorage(location=loc, quota=QuotaManager(max_bytes=1_000_000))
+        base = datetime(2024, 1, 1)
+        for i in range(60):
+            doc = Document(id=str(i), number=f"DOC-{i:03d}", title="Договор поставки" if i % 3 else "Акт", author=self.user)
+            doc.updated_at = base + timedelta(minutes=(i * 7) % 60)
+            storage.save(doc)
+        storage.get("DOC-001").touch()
+        storage.demote("DOC-002")
+        for query in ("", "поставки", "акт"):
+            numbers, cursor = [], None
+            while True:
+                page = storage.search_page(query, 7, cursor, order_by="updated_at")
+                numbers.extend(d.number for d in page.items)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+            docs = [storage._read(n) for n in storage.get_all_numbers()]
+            expected = [d.number for d in sorted(docs, key=lambda d: (d.updated_at, d.number))
+                        if query.lower() in d.title.lower() or query.lower() in d.number.lower()]
+            self.assertEqual(numbers, expected, query)
+        self.assertEqual(storage.search_page("", 60, order_by="updated_at").items[-1].number, "DOC-001")
+        self.assertTrue(storage.is_cold("DOC-002"))
+
+    def test_compare_and_swap_save(self):
+        """Test that saves bump the revision and stale writes are rejected"""
+        loc = StorageLocation(name="test", base_path="/tmp")
+        storage = DocumentStorage(location=loc, quota=QuotaManager(max_bytes=1_000_000))
+        doc = Document(id="d1", number="DOC-1", title="Акт", author=self.user)
+        storage.save(doc, expected_revision=0)
+        self.assertEqual(doc.revision, 1)
+        with self.assertRaises(VersionConflictError):
+            storage.save(Document(id="d2", number="DOC-1", title="Другой акт", author=self.user), expected_revision=0)
+        self.assertEqual(storage.get("DOC-1").title, "Акт")
+        storage.save(doc)
+        storage.demote("DOC-1")
+        with self.assertRaises(VersionConflictError):
+            storage.save(doc, expected_revision=1)
+        storage.save(doc, expected_revision=2)
+        self.assertEqual(storage.get("DOC-1").revision, 3)
+
 
 if __name__ == "__main__":
     unittest.main()
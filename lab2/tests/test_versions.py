@@ -0,0 +1,157 @@
+import io
+import pickle
+import unittest
+from documentflow.versions import ChunkedContent, DeltaVersionStore
+from documentflow.indexes import FullTextIndex, tokenize, tokenize_stream
+from documentflow.documents import Document
+from documentflow.users import User
+from documentflow.storage import DocumentStorage, StorageLocation
+from documentflow.security import QuotaManager
+from documentflow import codec, serialization
+
+
+def contract(revision: int) -> str:
+    lines = [f"Пункт {i}. Стороны договорились о поставке партии {i}.\n" for i in range(200)]
+    lines[revision % 200] = f"Пункт {revision % 200}. Изменено в редакции {revision}.\n"
+    return "".join(lines)
+
+
+class TestDeltaVersionStore(unittest.TestCase):
+    def test_keyframes_and_deltas(self):
+        """Test that contents are reconstructed from keyframes and deltas"""
+        store = DeltaVersionStore(keyframe_interval=8)
+        contents = [contract(i) for i in range(20)]
+        for content in contents:
+            store.append(content)
+        self.assertEqual([store.content(i) for i in range(20)], contents)
+        self.assertEqual([i for i in range(20) if store.is_keyframe(i)], [0, 8, 16])
+        self.assertEqual(store.length(5), len(contents[5]))
+        self.assertLess(store.stored_chars() * 5, store.raw_chars())
+
+    def test_unrelated_content_is_stored_in_full(self):
+        """Test that a delta larger than the text becomes a keyframe"""
+        store = DeltaVersionStore()
+        store.append("первая строка\n")
+        store.append("совсем другое\n")
+        self.assertTrue(store.is_keyframe(1))
+        self.assertEqual(store.content(1), "совсем другое\n")
+        with self.assertRaises(ValueError):
+            DeltaVersionStore(keyframe_interval=0)
+
+
+class TestDocumentDeltaVersions(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.doc = Document(id="d1", number="CON-001", title="Договор", author=self.user)
+        self.doc.add_version(contract(0), "u1")
+
+    def test_add_version_uses_store(self):
+        """Test that versions added after enabling the store are delta-encoded"""
+        store = self.doc.use_delta_versions(keyframe_interval=4)
+        for i in range(1, 10):
+            self.doc.add_version(contract(i), "u1")
+        self.assertEqual(len(store), 10)
+        self.assertEqual(self.doc.versions[6].content, contract(6))
+        self.assertEqual(self.doc.versions[6].number, 7)
+        self.assertNotIn("content", self.doc.versions[6].__dict__)
+        self.assertEqual(self.doc.versions[6].get_content_length(), len(contract(6)))
+
+    def test_round_trips(self):
+        """Test that delta-encoded documents serialize with full contents"""
+        self.doc.use_delta_versions()
+        self.doc.add_version(contract(1), "u1")
+        restored = serialization.loads(serialization.dumps(self.doc))
+        self.assertEqual(restored.versions[1].content, contract(1))
+        copied = pickle.loads(pickle.dumps(self.doc))
+        self.assertEqual(copied, self.doc)
+
+    def test_delta_mode_survives_round_trips(self):
+        """Test that documents restored from serialization, the codec and the cold tier stay delta-encoded"""
+        self.doc.use_delta_versions(keyframe_interval=4)
+        self.doc.add_version(contract(1), "u1")
+        storage = DocumentStorage(location=StorageLocation(name="test", base_path="/tmp"), quota=QuotaManager(max_bytes=1_000_000))
+        storage.save(self.doc)
+        storage.demote(self.doc.number)
+        header, details = serialization.split_document(self.doc)
+        deferred = serialization.from_primitive(header)
+        deferred.defer_loading(lambda: {k: serialization.from_primitive(v) for k, v in details.items()})
+        for restored in (serialization.loads(serialization.dumps(self.doc)), codec.decode(codec.encode(self.doc)),
+                         storage.get(self.doc.number), deferred):
+            restored.add_version(contract(2), "u1")
+            self.assertEqual(restored.delta_keyframes, 4)
+            self.assertEqual(len(restored.__dict__["_version_store"]), 3)
+            self.assertNotIn("content", restored.versions[0].__dict__)
+            self.assertEqual([v.content for v in restored.versions], [contract(0), contract(1), contract(2)])
+
+
+class TestChunkedContent(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.doc = Document(id="d1", number="CON-001", title="Договор", author=self.user)
+        self.text = contract(3)
+
+    def test_chunks_split_multibyte_text(self):
+        """Test that chunks cut inside UTF-8 characters decode back intact"""
+        chunks = ChunkedContent.from_source(io.BytesIO(self.text.encode()), chunk_size=1000)
+        self.assertEqual(chunks.chunk_count(), -(-len(self.text.encode()) // 1000))
+        self.assertEqual(chunks.char_length, len(self.text))
+        self.assertEqual(chunks.content, self.text)
+        self.assertEqual(b"".join(bytes(view) for view in chunks.iter_bytes()), self.text.encode())
+        self.assertEqual(chunks.read(995, 10), self.text.encode()[995:1005])
+
+    def test_add_version_from_iterator(self):
+        """Test that add_version streams an iterator of pieces into chunks"""
+        pieces = (self.text[i:i + 100] for i in range(0, len(self.text), 100))
+        v = self.doc.add_version(pieces, "u1", chunk_size=4096)
+        self.assertTrue(v.is_chunked())
+        self.assertNotIn("content", v.__dict__)
+        self.assertEqual(v.get_content_length(), len(self.text))
+        self.assertEqual("".join(v.iter_content()), self.text)
+        self.assertEqual(v.content, self.text)
+        self.assertEqual(v.number, 1)
+
+    def test_add_version_from_file(self):
+        """Test that add_version reads a text file-like object"""
+        v = self.doc.add_version(io.StringIO(self.text), "u1")
+        self.assertEqual(v.content, self.text)
+        restored = serialization.loads(serialization.dumps(self.doc))
+        self.assertEqual(restored.versions[0].content, self.text)
+
+    def test_add_version_from_bytes(self):
+        """Test that bare bytes and bytearray are stored as one piece of UTF-8 text"""
+        for raw in (self.text.encode(), bytearray(self.text.encode())):
+            v = self.doc.add_version(raw, "u1", chunk_size=1000)
+            self.assertEqual(v.content, self.text)
+            self.assertEqual(v.get_content_length(), len(self.text))
+
+    def test_stream_tokenize_joins_cut_words(self):
+        """Test that words cut at chunk boundaries are tokenized whole"""
+        pieces = [self.text[i:i + 7] for i in range(0, len(self.text), 7)]
+        self.assertEqual(list(tokenize_stream(pieces)), tokenize(self.text))
+
+    def test_fulltext_indexes_chunked_version(self):
+        """Test that the full-text index reads chunked content"""
+        index = FullTextIndex()
+        self.doc.add_version(io.BytesIO("Поставка оборудования".encode()), "u1", chunk_size=5)
+        index.add(self.doc)
+        self.assertEqual([n for n, _ in index.search("оборудования")], ["CON-001"])
+
+    def test_chunked_versions_survive_round_trips(self):
+        """Test that chunked bodies come back chunked from serialization, the codec and the cold tier"""
+        self.doc.add_version(io.BytesIO(self.text.encode()), "u1", chunk_size=1000)
+        storage = DocumentStorage(location=StorageLocation(name="test", base_path="/tmp"), quota=QuotaManager(max_bytes=1_000_000))
+        storage.save(self.doc)
+        storage.demote(self.doc.number)
+        for restored in (serialization.loads(serialization.dumps(self.doc)), codec.decode(codec.encode(self.doc)),
+                         storage.get(self.doc.number)):
+            v = restored.versions[0]
+            self.assertTrue(v.is_chunked())
+            self.assertEqual(v.__dict__["_chunks"].chunk_count(), self.doc.versions[0].__dict__["_chunks"].chunk_count())
+            self.assertEqual(v.get_content_length(), len(self.text))
+            self.assertEqual("".join(v.iter_content()), self.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
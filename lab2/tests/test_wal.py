@@ -0,0 +1,160 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from documentflow.wal import DurableDocumentStorage, FsyncPolicy, WriteAheadLog, read_records
+from documentflow.storage import StorageLocation
+from documentflow.security import QuotaManager
+from documentflow.documents import Document, DocumentAttachment
+from documentflow.users import User
+from documentflow.workflow import WorkflowState
+
+
+class TestWal(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures"""
+        self.user = User(id="u1", login="testuser", display_name="Test User")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "docs.wal")
+        self.location = StorageLocation(name="test", base_path=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open_storage(self, **kwargs) -> DurableDocumentStorage:
+        return DurableDocumentStorage.open(self.location, QuotaManager(max_bytes=1_000_000), self.path, **kwargs)
+
+    def test_group_commit(self):
+        """Test that records are written in groups"""
+        wal = WriteAheadLog(path=self.path, group_size=3)
+        for i in range(4):
+            wal.append(["delete", f"N-{i}"])
+        self.assertEqual(wal.records_written, 3)
+        self.assertEqual(wal.syncs, 1)
+        wal.close()
+        self.assertEqual([r[1] for r in read_records(self.path)], ["N-0", "N-1", "N-2", "N-3"])
+
+    def test_recovery_replays_log(self):
+        """Test that saves, status changes, attachments and deletes are recovered"""
+        storage = self.open_storage(fsync_policy=FsyncPolicy.ALWAYS)
+        doc = Document(id="d1", number="DOC-001", title="Договор поставки", author=self.user)
+        storage.save(doc)
+        storage.save(Document(id="d2", number="DOC-002", title="Письмо", author=self.user))
+        storage.store_attachment(doc, DocumentAttachment(filename="a.pdf", content_type="application/pdf", size=10, checksum="c"))
+        doc.approve()
+        storage.delete("DOC-002")
+        storage.close()
+
+        recovered = self.open_storage()
+        self.assertEqual(recovered.last_recovery.records, 5)
+        self.assertEqual(recovered.get_all_numbers(), ["DOC-001"])
+        self.assertEqual(recovered.get("DOC-001").status, WorkflowState.APPROVED)
+        self.assertEqual(recovered.count_by_status(WorkflowState.APPROVED), 1)
+        self.assertEqual([d.number for d in recovered.search("поставки")], ["DOC-001"])
+        self.assertEqual(recovered.quota.used_bytes, storage.quota.used_bytes)
+        recovered.close()
+
+    def test_torn_tail_is_dropped(self):
+        """Test that a partially written record is ignored and truncated"""
+        storage = self.open_storage(fsync_policy=FsyncPolicy.ALWAYS)
+        storage.save(Document(id="d1", number="DOC-001", title="Test", author=self.user))
+        storage.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, "ab") as f:
+            f.write(b"\x10\x00\x00\x00garbage")
+
+        recovered = self.open_storage()
+        self.assertEqual(recovered.get_all_numbers(), ["DOC-001"])
+        self.assertEqual(os.path.getsize(self.path), size)
+        recovered.close()
+
+    def test_checkpoint_truncates_log(self):
+        """Test recovery from a checkpoint plus the log written after it"""
+        storage = self.open_storage(group_size=100)
+        for i in range(5):
+            storage.save(Document(id=f"d{i}", number=f"DOC-{i:03d}", title="Test", author=self.user))
+        storage.checkpoint()
+        self.assertEqual(os.path.getsize(self.path), 0)
+        storage.get("DOC-000").archive()
+        storage.close()
+
+        recovered = self.open_storage()
+        self.assertEqual(recovered.last_recovery.records, 6)
+        self.assertEqual(recovered.count_documents(), 5)
+        self.assertEqual([d.number for d in recovered.find_by_status(WorkflowState.ARCHIVED)], ["DOC-000"])
+        recovered.close()
+
+    def test_truncate_keeps_buffered_records(self):
+        """Test that truncating the log drops only committed records"""
+        wal = WriteAheadLog(path=self.path, group_size=10, max_delay=60)
+        wal.append(["delete", "N-0"])
+        wal.commit()
+        wal.append(["delete", "N-1"])
+        wal.truncate()
+        wal.close()
+        self.assertEqual([r[1] for r in read_records(self.path)], ["N-1"])
+
+    def test_checkpoint_during_writes_loses_nothing(self):
+        """Test that saves racing with checkpoints are all recovered"""
+        storage = self.open_storage(group_size=8, max_delay=60)
+
+        def write() -> None:
+            for i in range(300):
+                storage.save(Document(id=f"d{i}", number=f"DOC-{i:03d}", title="Test", author=self.user))
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        while writer.is_alive():
+            storage.checkpoint()
+        writer.join()
+        storage.close()
+
+        recovered = self.open_storage()
+        self.assertEqual(recovered.count_documents(), 300)
+        recovered.close()
+
+    def test_uncommitted_group_is_lost(self):
+        """Test that records of an unfinished group are not durable"""
+        storage = self.open_storage(group_size=10, max_delay=60)
+        storage.save(Document(id="d1", number="DOC-001", title="Test", author=self.user))
+        recovered = self.open_storage()
+        self.assertEqual(recovered.count_documents(), 0)
+        recovered.close()
+        storage.close()
+
+    def test_group_is_committed_after_max_delay(self):
+        """Test that a group that never fills is still committed"""
+        wal = WriteAheadLog(path=self.path, group_size=10, max_delay=0.01)
+        wal.append(["delete", "N-0"])
+        for _ in range(100):
+            if wal.records_written:
+                break
+            time.sleep(0.01)
+        self.assertEqual(wal.records_written, 1)
+        self.assertEqual([r[1] for r in read_records(self.path)], ["N-0"])
+        wal.close()
+
+    def test_update_records_carry_only_new_versions(self):
+        """Test that saving a stored document logs only its new versions and keeps the revision"""
+        storage = self.open_storage(fsync_policy=FsyncPolicy.ALWAYS)
+        doc = Document(id="d1", number="DOC-001", title="Test", author=self.user)
+        doc.add_version("первая редакция " * 100, "u1")
+        storage.save(doc)
+        doc.add_version("вторая", "u1")
+        storage.save(doc)
+        storage.close()
+        records = list(read_records(self.path))
+        self.assertEqual([r[0] for r in records], ["save", "update"])
+        self.assertEqual([v.number for v in records[1][1].versions], [2])
+        self.assertEqual(records[1][2], [1])
+
+        recovered = self.open_storage()
+        restored = recovered.get("DOC-001")
+        self.assertEqual(restored.revision, 2)
+        self.assertEqual([v.content for v in restored.versions], ["первая редакция " * 100, "вторая"])
+        recovered.close()
+
+
+if __name__ == "__main__":
+    unittest.main()